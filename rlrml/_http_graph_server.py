@@ -88,7 +88,9 @@ def make_routes(builder):
                     mmr_history, season_dates=season_dates
                 )
                 calc = mmr.SeasonBasedPolyFitMMRCalculator(
-                    mmr_by_season, season_dates=season_dates,
+                    mmr.split_mmr_history_arrays(
+                        mmr.mmr_history_arrays(mmr_history), season_dates=season_dates
+                    ), season_dates=season_dates,
                 )
             except KeyError:
                 continue
@@ -1,9 +1,12 @@
 import asyncio
+import collections
 import multiprocessing
 import numpy as np
 import logging
+import time
+import torch
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from .playlist import Playlist
 from . import load
 from . import mmr
@@ -67,8 +70,25 @@ class ReplaySetAssesor:
         return dict(self.yield_replay_statuses())
 
     def yield_replay_statuses(self):
+        cached_metas = self._get_cached_metas()
         for uuid in self._replay_set.get_replay_uuids():
-            yield uuid, self._get_replay_status(uuid)
+            yield uuid, self._get_replay_status(uuid, meta=cached_metas.get(uuid))
+
+    def _uses_cached_meta(self):
+        return (
+            isinstance(self._replay_set, load.CachedReplaySet) and
+            not self._always_load_tensor
+        )
+
+    def _get_cached_metas(self):
+        """Read every cached meta in one pass over the meta store."""
+        if not self._uses_cached_meta():
+            return {}
+        try:
+            return self._replay_set.get_cached_replay_metas()
+        except Exception as e:
+            logger.warn(f"Exception when bulk loading cached metas {e}")
+            return {}
 
     def get_replay_statuses_by_rank(self):
         replay_statuses = self.get_replay_statuses()
@@ -134,16 +154,13 @@ class ReplaySetAssesor:
                     return False
         return True
 
-    def _get_replay_status(self, uuid, require_headers=True):
-        meta = None
-        if (
-                isinstance(self._replay_set, load.CachedReplaySet) and
-                not self._always_load_tensor
-        ):
-            try:
-                meta = self._replay_set.get_replay_meta(uuid)
-            except Exception as e:
-                logger.warn(f"Exception when loading meta of {uuid} {e}")
+    def _get_replay_status(self, uuid, require_headers=True, meta=None):
+        if self._uses_cached_meta():
+            if meta is None:
+                try:
+                    meta = self._replay_set.get_replay_meta(uuid)
+                except Exception as e:
+                    logger.warn(f"Exception when loading meta of {uuid} {e}")
             if require_headers and meta is not None and not meta.headers:
                 self._replay_set.bust_cache(uuid)
                 meta = None
@@ -217,3 +234,109 @@ class ParallelTensorMetaLoader:
         uuids = self._replay_set.get_replay_uuids()
         await asyncio.gather(*[self.call_load_replay_tensor(uuid) for uuid in uuids])
         return
+
+
+WarmStats = collections.namedtuple("WarmStats", "parsed failed skipped seconds")
+
+
+_worker_replay_set = None
+
+
+def _initialize_warm_worker(replay_set):
+    global _worker_replay_set
+    _worker_replay_set = replay_set
+
+
+def _parse_replay_in_worker(uuid):
+    tensor, meta = _worker_replay_set.get_replay_tensor(uuid)
+    # Plain numpy arrays are sent back instead of tensors so that results do
+    # not travel through torch's file descriptor based sharing.
+    return uuid, np.asarray(tensor), meta
+
+
+class TensorCacheWarmer:
+    """Fill a :py:class:`load.CachedReplaySet` by parsing replays in a pool of processes.
+
+    Uuids are fed to the pool lazily with at most `max_in_flight` parses
+    outstanding, results are written by this process through
+    `_save_to_cache`, and uuids that are already cached are skipped so that an
+    interrupted run can simply be restarted.
+
+    The results of the parses that complete together are reported with one
+    call of `on_success(uuids)` and one of `on_failure(uuid_exception_pairs)`,
+    so that they can be recorded in a single write. Failures that are one of
+    :py:data:`load.transient_load_errors` are counted but not reported.
+    """
+
+    def __init__(
+            self, cached_replay_set: load.CachedReplaySet, processes=None,
+            max_in_flight=None, report_every=100, on_success=None, on_failure=None
+    ):
+        self._cached_replay_set = cached_replay_set
+        self._on_success = on_success or (lambda _uuids: None)
+        self._on_failure = on_failure or (lambda _uuid_exceptions: None)
+        self._processes = processes or multiprocessing.cpu_count()
+        self._max_in_flight = max_in_flight or self._processes * 2
+        self._report_every = report_every
+
+    def _uncached_uuids(self, uuids, stats):
+        for uuid in uuids:
+            if self._cached_replay_set.is_cached(uuid):
+                stats['skipped'] += 1
+            else:
+                yield uuid
+
+    def warm(self, uuids=None) -> WarmStats:
+        uuids = self._cached_replay_set.get_replay_uuids() if uuids is None else uuids
+        stats = collections.Counter(parsed=0, failed=0, skipped=0)
+        start = time.monotonic()
+        executor = ProcessPoolExecutor(
+            max_workers=self._processes,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_initialize_warm_worker,
+            initargs=(self._cached_replay_set._replay_set,),
+        )
+        with executor:
+            # The uuid of each outstanding parse, by its future.
+            in_flight = {}
+            for uuid in self._uncached_uuids(uuids, stats):
+                if len(in_flight) >= self._max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._save_results(done, in_flight, stats, start)
+                in_flight[executor.submit(_parse_replay_in_worker, uuid)] = uuid
+            self._save_results(wait(in_flight)[0], in_flight, stats, start)
+
+        result = WarmStats(seconds=time.monotonic() - start, **stats)
+        self._log_progress(result)
+        return result
+
+    def _save_results(self, futures, in_flight, stats, start):
+        succeeded = []
+        failed = []
+        for future in futures:
+            uuid = in_flight.pop(future)
+            try:
+                _, array, meta = future.result()
+            except Exception as e:
+                logger.warn(f"Failed to parse {uuid}: {e}")
+                if not isinstance(e, load.transient_load_errors):
+                    failed.append((uuid, e))
+                stats['failed'] += 1
+            else:
+                self._cached_replay_set._save_to_cache(uuid, torch.from_numpy(array), meta)
+                succeeded.append(uuid)
+                stats['parsed'] += 1
+
+            if (stats['parsed'] + stats['failed']) % self._report_every == 0:
+                self._log_progress(WarmStats(seconds=time.monotonic() - start, **stats))
+        if succeeded:
+            self._on_success(succeeded)
+        if failed:
+            self._on_failure(failed)
+
+    def _log_progress(self, stats: WarmStats):
+        rate = stats.parsed / stats.seconds if stats.seconds else 0.0
+        logger.info(
+            f"Parsed {stats.parsed} replays ({rate:.2f}/s), "
+            f"failed: {stats.failed}, already cached: {stats.skipped}"
+        )
@@ -0,0 +1,105 @@
+"""Find and repair what interrupted writes leave behind in a replay cache."""
+import collections
+import logging
+import torch
+
+from .cache_store import map_storage_order_shards, MetaStore, TensorStore
+
+
+logger = logging.getLogger(__name__)
+
+
+FsckReport = collections.namedtuple(
+    "FsckReport", "checked unreadable orphaned rebuilt deleted metas_without_tensors"
+)
+
+
+def check_tensor(tensor):
+    """Raise a ValueError if tensor is not something a cache could have stored."""
+    if not isinstance(tensor, torch.Tensor):
+        raise ValueError(f"Expected a tensor but found {type(tensor).__name__}")
+    if tensor.dim() != 2:
+        raise ValueError(f"Expected a two dimensional tensor but found shape {tuple(tensor.shape)}")
+
+
+def _unreadable_tensors(tensor_store, uuids):
+    unreadable = []
+    for uuid in uuids:
+        try:
+            tensor = tensor_store.get(uuid)
+            if tensor is None:
+                raise ValueError("Listed tensor could not be found")
+            check_tensor(tensor)
+        except Exception as e:
+            unreadable.append((uuid, f"{type(e).__name__}: {e}"))
+    return unreadable
+
+
+def find_unreadable_tensors(
+        tensor_store: TensorStore, uuids, processes=None, shards_per_process=4
+):
+    """Read every tensor of uuids in a pool of processes, returning (uuid, error) pairs."""
+    unreadable = []
+    for shard_unreadable in map_storage_order_shards(
+            tensor_store, uuids, _unreadable_tensors, processes=processes,
+            shards_per_process=shards_per_process, description="fsck shards",
+    ):
+        unreadable.extend(shard_unreadable)
+    return unreadable
+
+
+def fsck_cache(
+        tensor_store: TensorStore, meta_store: MetaStore, repair=False,
+        rebuild_meta=None, compact=False, processes=None
+) -> FsckReport:
+    """Check that every tensor in tensor_store can be read and has a meta.
+
+    When repair is set, unreadable tensors are deleted so that they are parsed
+    again on their next use, and tensors without a meta have it recomputed
+    with `rebuild_meta(uuid)` if it is provided, or are deleted otherwise.
+    Metas without a tensor are only counted: metas are shared by every cache
+    variant, so one may simply not have been cached in this variant yet.
+    When compact is set, both stores reclaim the space of deleted entries and
+    interrupted writes afterwards.
+    """
+    tensor_uuids = list(tensor_store.uuids())
+    unreadable = dict(
+        find_unreadable_tensors(tensor_store, tensor_uuids, processes=processes)
+    )
+    for uuid, error in unreadable.items():
+        logger.warn(f"Unreadable tensor for {uuid}: {error}")
+
+    meta_uuids = set(meta_store.uuids())
+    orphaned = [
+        uuid for uuid in tensor_uuids
+        if uuid not in meta_uuids and uuid not in unreadable
+    ]
+    metas_without_tensors = len(meta_uuids.difference(tensor_uuids))
+
+    rebuilt = 0
+    deleted = 0
+    if repair:
+        for uuid in unreadable:
+            tensor_store.delete(uuid)
+            deleted += 1
+        for uuid in orphaned:
+            meta = None
+            if rebuild_meta is not None:
+                try:
+                    meta = rebuild_meta(uuid)
+                except Exception as e:
+                    logger.warn(f"Could not rebuild the meta of {uuid}: {e}")
+            if meta is None:
+                tensor_store.delete(uuid)
+                deleted += 1
+            else:
+                rebuilt += 1
+
+    if compact:
+        tensor_store.compact()
+        meta_store.compact()
+
+    return FsckReport(
+        checked=len(tensor_uuids), unreadable=len(unreadable), orphaned=len(orphaned),
+        rebuilt=rebuilt, deleted=deleted, metas_without_tensors=metas_without_tensors,
+    )
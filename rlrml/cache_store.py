@@ -0,0 +1,715 @@
+"""Storage backends for the tensors and metadata cached by :py:class:`rlrml.load.CachedReplaySet`."""
+import abc
+import fcntl
+import json
+import lmdb
+import logging
+import multiprocessing
+import numpy as np
+import os
+import re
+import shutil
+import time
+import torch
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from .metadata import ReplayMeta
+
+
+logger = logging.getLogger(__name__)
+
+
+TEMPORARY_SUFFIX = ".tmp"
+
+
+def remove_stale_temporary_files(directory, older_than_seconds=3600):
+    """Remove the leftovers of atomic writes in directory that were interrupted."""
+    removed = 0
+    cutoff = time.time() - older_than_seconds
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(TEMPORARY_SUFFIX) and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+    return removed
+
+
+def directory_is_empty(directory) -> bool:
+    """Check whether directory has no entries without listing all of them."""
+    with os.scandir(directory) as entries:
+        return next(entries, None) is None
+
+
+@contextmanager
+def atomic_write(path, mode='wb'):
+    """Open a temporary file that is renamed over path only if writing it succeeds."""
+    temporary_path = f"{path}.{os.getpid()}{TEMPORARY_SUFFIX}"
+    try:
+        with open(temporary_path, mode) as f:
+            yield f
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+class FileLayout:
+    """Place one file per uuid under a directory, fanned out by uuid prefix.
+
+    Each file goes in a subdirectory named after the first `prefix_length`
+    characters of its uuid, so no single directory grows with the size of
+    the cache. A `.layout.<extension>` marker records that a directory uses
+    this layout. A directory that already holds files with the extension but
+    has no marker predates the fan out and keeps its flat layout until
+    :py:meth:`migrate` is run on it.
+    """
+
+    def __init__(self, directory, extension, prefix_length=2):
+        self._directory = directory
+        self._extension = extension
+        self._suffix = f".{extension}"
+        self.prefix_length = prefix_length
+        self.fanned_out = self._detect()
+
+    @property
+    def _marker_path(self):
+        return os.path.join(self._directory, f".layout{self._suffix}")
+
+    def _detect(self):
+        try:
+            with open(self._marker_path, 'r') as f:
+                self.prefix_length = json.loads(f.read())["prefix_length"]
+            return True
+        except FileNotFoundError:
+            pass
+        if any(True for _ in self._flat_files()):
+            logger.warn(
+                f"{self._directory} has a flat cache layout, "
+                "run migrate_cache_layout to fan it out"
+            )
+            return False
+        self._write_marker()
+        return True
+
+    def _write_marker(self):
+        with atomic_write(self._marker_path, 'w') as f:
+            f.write(json.dumps({"prefix_length": self.prefix_length}))
+
+    def _flat_files(self):
+        with os.scandir(self._directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(self._suffix) and not entry.name.startswith("."):
+                    yield entry
+
+    def _fan_out_directories(self):
+        with os.scandir(self._directory) as entries:
+            for entry in entries:
+                if len(entry.name) == self.prefix_length and entry.is_dir():
+                    yield entry.path
+
+    def directories(self):
+        """Get every directory that files of this layout are written to."""
+        if not self.fanned_out:
+            return [self._directory]
+        return [self._directory] + list(self._fan_out_directories())
+
+    def path(self, uuid):
+        filename = f"{uuid}{self._suffix}"
+        if not self.fanned_out:
+            return os.path.join(self._directory, filename)
+        return os.path.join(self._directory, uuid[:self.prefix_length], filename)
+
+    def writable_path(self, uuid):
+        path = self.path(uuid)
+        if self.fanned_out:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def uuids(self):
+        for directory in (
+                self._fan_out_directories() if self.fanned_out else [self._directory]
+        ):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(self._suffix):
+                        yield entry.name[:-len(self._suffix)]
+
+    def migrate(self):
+        """Move the files of a flat directory into the fanned out layout in place.
+
+        Every move is a rename within the directory, and the marker is only
+        written once all of them are done, so an interrupted migration can
+        simply be run again. Nothing else may use the directory meanwhile.
+        """
+        if self.fanned_out:
+            return 0
+        moved = 0
+        for entry in self._flat_files():
+            uuid = entry.name[:-len(self._suffix)]
+            destination = os.path.join(self._directory, uuid[:self.prefix_length])
+            os.makedirs(destination, exist_ok=True)
+            os.replace(entry.path, os.path.join(destination, entry.name))
+            moved += 1
+            if moved % 10000 == 0:
+                logger.info(f"Moved {moved} files in {self._directory}")
+        self._write_marker()
+        self.fanned_out = True
+        return moved
+
+
+class TensorStore(abc.ABC):
+    """A keyed store of replay tensors."""
+
+    @abc.abstractmethod
+    def get(self, uuid) -> torch.Tensor:
+        """Get the tensor stored for uuid, or None if there is none."""
+        pass
+
+    @abc.abstractmethod
+    def put(self, uuid, tensor: torch.Tensor):
+        pass
+
+    @abc.abstractmethod
+    def contains(self, uuid) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def delete(self, uuid):
+        pass
+
+    @abc.abstractmethod
+    def uuids(self):
+        """Iterate over the uuids that have a stored tensor."""
+        pass
+
+    def get_lengths(self, uuids) -> dict:
+        """Get a dictionary from uuid to frame count for each of uuids that has a stored tensor."""
+        result = {}
+        for uuid in uuids:
+            tensor = self.get(uuid)
+            if tensor is not None:
+                result[uuid] = tensor.shape[0]
+        return result
+
+    def storage_order(self, uuids) -> list:
+        """Order uuids so that reading them one after another is as sequential as possible."""
+        return list(uuids)
+
+    def compact(self):
+        """Reclaim the space held by deleted entries and interrupted writes.
+
+        This must not run while anything else writes to the store.
+        """
+        pass
+
+
+class PickleTensorStore(TensorStore):
+    """Store each tensor as its own `torch.save` pickle in a :py:class:`FileLayout`.
+
+    The frame count of every tensor that is written is appended to a small
+    length log in the same directory so that :py:meth:`get_lengths` does not
+    need to unpickle anything.
+    """
+
+    _length_log_name = ".replay_lengths"
+
+    def __init__(self, directory, extension="pt"):
+        self._directory = directory
+        self._extension = extension
+        os.makedirs(self._directory, exist_ok=True)
+        self._layout = FileLayout(directory, extension)
+
+    @property
+    def _length_log_path(self):
+        return os.path.join(self._directory, self._length_log_name)
+
+    def _record_length(self, uuid, length):
+        # Short appends are atomic, so concurrent writers cannot interleave lines.
+        with open(self._length_log_path, 'a') as f:
+            f.write(f"{uuid} {length}\n")
+
+    def _read_length_log(self):
+        lengths = {}
+        try:
+            with open(self._length_log_path, 'r') as f:
+                for line in f:
+                    uuid, _, length = line.strip().rpartition(' ')
+                    if uuid and length.isdigit():
+                        lengths[uuid] = int(length)
+        except FileNotFoundError:
+            pass
+        return lengths
+
+    def get_lengths(self, uuids):
+        logged = self._read_length_log()
+        result = {}
+        for uuid in uuids:
+            if uuid in logged:
+                result[uuid] = logged[uuid]
+                continue
+            # Tensors written before the length log existed are backfilled once.
+            tensor = self.get(uuid)
+            if tensor is not None:
+                result[uuid] = tensor.shape[0]
+                self._record_length(uuid, tensor.shape[0])
+        return result
+
+    def path(self, uuid):
+        return self._layout.path(uuid)
+
+    def get(self, uuid):
+        try:
+            with open(self.path(uuid), 'rb') as f:
+                return torch.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, uuid, tensor):
+        with atomic_write(self._layout.writable_path(uuid), 'wb') as f:
+            torch.save(tensor, f)
+        self._record_length(uuid, tensor.shape[0])
+
+    def contains(self, uuid):
+        return os.path.exists(self.path(uuid))
+
+    def delete(self, uuid):
+        path = self.path(uuid)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def uuids(self):
+        return self._layout.uuids()
+
+    def migrate_layout(self):
+        """Move the tensors of a flat directory into the fanned out layout."""
+        return self._layout.migrate()
+
+    def compact(self):
+        removed = sum(map(remove_stale_temporary_files, self._layout.directories()))
+        logged = self._read_length_log()
+        present = set(self.uuids())
+        with atomic_write(self._length_log_path, 'w') as f:
+            for uuid, length in logged.items():
+                if uuid in present:
+                    f.write(f"{uuid} {length}\n")
+        logger.info(
+            f"Removed {removed} temporary files and {len(set(logged) - present)} "
+            f"stale length log entries from {self._directory}"
+        )
+
+
+class PackedTensorStore(TensorStore):
+    """Append tensors into large shard files and read them back through memory maps.
+
+    Every tensor is written as raw bytes at the end of the current shard file
+    and its shard, offset, shape and dtype are recorded in an lmdb index. Reads
+    copy the bytes out of a read only :py:class:`numpy.memmap` of the shard,
+    so no unpickling happens, DataLoader workers share the underlying pages
+    through the OS page cache, and callers are free to modify what they get.
+    """
+
+    _shard_pattern = re.compile(r"^shard-(\d+)\.bin$")
+    _alignment = 64
+
+    def __init__(self, directory, shard_size=4 * 1024 ** 3, **kwargs):
+        self._directory = directory
+        self._shard_size = shard_size
+        kwargs.setdefault("map_size", 4 * 1024 ** 3)
+        self._lmdb_kwargs = kwargs
+        self._env_pid = None
+        self._env_instance = None
+        self._memmaps = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_env_pid'] = None
+        state['_env_instance'] = None
+        state['_memmaps'] = {}
+        return state
+
+    @property
+    def _env(self):
+        # lmdb environments must not be reused across a fork, so each process
+        # (e.g. each DataLoader worker) opens its own handle.
+        if self._env_pid != os.getpid():
+            os.makedirs(self._directory, exist_ok=True)
+            self._env_instance = lmdb.open(
+                os.path.join(self._directory, "index"), **self._lmdb_kwargs
+            )
+            self._env_pid = os.getpid()
+        return self._env_instance
+
+    def _shard_path(self, shard_number):
+        return os.path.join(self._directory, f"shard-{shard_number:05d}.bin")
+
+    def _shard_numbers(self):
+        return sorted(
+            int(match.group(1))
+            for match in map(self._shard_pattern.match, os.listdir(self._directory))
+            if match
+        )
+
+    @contextmanager
+    def _write_lock(self):
+        with open(os.path.join(self._directory, ".lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _writable_shard(self, byte_count):
+        shard_numbers = self._shard_numbers()
+        shard_number = shard_numbers[-1] if shard_numbers else 0
+        path = self._shard_path(shard_number)
+        if os.path.exists(path) and 0 < os.path.getsize(path) and (
+                os.path.getsize(path) + byte_count > self._shard_size
+        ):
+            shard_number += 1
+        return shard_number
+
+    def _encode_key(self, uuid):
+        return uuid.encode('utf-8')
+
+    def _get_entry(self, uuid):
+        with self._env.begin() as txn:
+            value = txn.get(self._encode_key(uuid))
+        return None if value is None else json.loads(value)
+
+    def _shard_memmap(self, shard_number, required_size):
+        memmap = self._memmaps.get(shard_number)
+        if memmap is None or len(memmap) < required_size:
+            # Shards grow as tensors are appended, so the mapping is refreshed
+            # whenever an entry lies past the end of what was mapped.
+            memmap = np.memmap(self._shard_path(shard_number), dtype=np.uint8, mode='r')
+            self._memmaps[shard_number] = memmap
+        return memmap
+
+    def get(self, uuid):
+        entry = self._get_entry(uuid)
+        if entry is None:
+            return None
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        end = entry["offset"] + int(np.prod(shape)) * dtype.itemsize
+        memmap = self._shard_memmap(entry["shard"], end)
+        return torch.from_numpy(np.array(memmap[entry["offset"]:end].view(dtype).reshape(shape)))
+
+    def put(self, uuid, tensor):
+        array = np.ascontiguousarray(
+            tensor.numpy() if isinstance(tensor, torch.Tensor) else tensor
+        )
+        env = self._env
+        with self._write_lock():
+            shard_number = self._writable_shard(array.nbytes)
+            with open(self._shard_path(shard_number), 'ab') as f:
+                offset = f.tell()
+                padding = -offset % self._alignment
+                f.write(b"\0" * padding)
+                offset += padding
+                f.write(array.tobytes())
+            entry = {
+                "shard": shard_number,
+                "offset": offset,
+                "shape": list(array.shape),
+                "dtype": array.dtype.str,
+            }
+            with env.begin(write=True) as txn:
+                txn.put(self._encode_key(uuid), json.dumps(entry).encode('utf-8'))
+
+    def contains(self, uuid):
+        with self._env.begin() as txn:
+            return txn.get(self._encode_key(uuid)) is not None
+
+    def delete(self, uuid):
+        # The bytes stay in the shard until it is rewritten; only the index
+        # entry is removed.
+        with self._env.begin(write=True) as txn:
+            txn.delete(self._encode_key(uuid))
+
+    def uuids(self):
+        with self._env.begin() as txn:
+            for key in txn.cursor().iternext(values=False):
+                yield key.decode('utf-8')
+
+    def get_lengths(self, uuids):
+        result = {}
+        with self._env.begin() as txn:
+            for uuid in uuids:
+                value = txn.get(self._encode_key(uuid))
+                if value is not None:
+                    result[uuid] = json.loads(value)["shape"][0]
+        return result
+
+    def compact(self):
+        """Rewrite the shards so that they only hold the tensors that are still indexed.
+
+        Live tensors are copied in storage order into a new store that then
+        replaces this one. Processes that still map the old shards keep
+        reading them until they reopen the store.
+        """
+        if not os.path.exists(self._directory):
+            return
+        compacted_directory = f"{self._directory}.compacting"
+        shutil.rmtree(compacted_directory, ignore_errors=True)
+        compacted = PackedTensorStore(
+            compacted_directory, shard_size=self._shard_size, **self._lmdb_kwargs
+        )
+        for uuid in self.storage_order(list(self.uuids())):
+            compacted.put(uuid, self.get(uuid))
+        compacted._env.close()
+        self._env.close()
+        self._env_pid = None
+        self._memmaps = {}
+
+        old_directory = f"{self._directory}.old"
+        os.replace(self._directory, old_directory)
+        os.replace(compacted_directory, self._directory)
+        shutil.rmtree(old_directory)
+
+    def storage_order(self, uuids):
+        positions = {}
+        missing = []
+        with self._env.begin() as txn:
+            for uuid in uuids:
+                value = txn.get(self._encode_key(uuid))
+                if value is None:
+                    missing.append(uuid)
+                else:
+                    entry = json.loads(value)
+                    positions[uuid] = (entry["shard"], entry["offset"])
+        return sorted(positions, key=positions.__getitem__) + missing
+
+
+class DownsampledTensorStore(TensorStore):
+    """A read only view of a tensor store that holds replays at `factor` times the frame rate.
+
+    With mode "stride" every `factor`th frame is kept, which is what parsing
+    at the lower frame rate samples. With mode "mean" each window of `factor`
+    frames is averaged, the last window over however many frames it has.
+    """
+
+    modes = ("stride", "mean")
+
+    def __init__(self, source: TensorStore, factor: int, mode="stride"):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown downsampling mode {mode}")
+        self._source = source
+        self._factor = factor
+        self._mode = mode
+
+    def downsample(self, tensor):
+        if self._mode == "stride":
+            return tensor[::self._factor].contiguous()
+        frame_count = tensor.shape[0]
+        if frame_count == 0:
+            return tensor
+        window_count = -(-frame_count // self._factor)
+        padded = torch.zeros(
+            (window_count * self._factor,) + tuple(tensor.shape[1:]), dtype=tensor.dtype
+        )
+        padded[:frame_count] = tensor
+        sums = padded.reshape((window_count, self._factor) + tuple(tensor.shape[1:])).sum(1)
+        counts = torch.full((window_count,), self._factor, dtype=tensor.dtype)
+        counts[-1] = frame_count - (window_count - 1) * self._factor
+        return sums / counts.reshape((window_count,) + (1,) * (tensor.dim() - 1))
+
+    def get(self, uuid):
+        tensor = self._source.get(uuid)
+        return None if tensor is None else self.downsample(tensor)
+
+    def put(self, uuid, tensor):
+        raise TypeError("A downsampled tensor store is read only")
+
+    def contains(self, uuid):
+        return self._source.contains(uuid)
+
+    def delete(self, uuid):
+        raise TypeError("A downsampled tensor store is read only")
+
+    def uuids(self):
+        return self._source.uuids()
+
+    def get_lengths(self, uuids):
+        return {
+            uuid: -(-length // self._factor)
+            for uuid, length in self._source.get_lengths(uuids).items()
+        }
+
+    def storage_order(self, uuids):
+        return self._source.storage_order(uuids)
+
+
+class MetaStore(abc.ABC):
+    """A keyed store of :py:class:`ReplayMeta`."""
+
+    @abc.abstractmethod
+    def get(self, uuid) -> ReplayMeta:
+        """Get the meta stored for uuid, or None if there is none."""
+        pass
+
+    @abc.abstractmethod
+    def put(self, uuid, meta: ReplayMeta):
+        pass
+
+    @abc.abstractmethod
+    def contains(self, uuid) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def delete(self, uuid):
+        pass
+
+    @abc.abstractmethod
+    def items(self):
+        """Iterate over (uuid, meta) pairs for every stored meta."""
+        pass
+
+    def uuids(self):
+        """Iterate over the uuids that have a stored meta."""
+        for uuid, _ in self.items():
+            yield uuid
+
+    def compact(self):
+        """Reclaim the space held by deleted entries and interrupted writes."""
+        pass
+
+    def get_many(self, uuids) -> dict:
+        """Get a dictionary from uuid to meta for each of the uuids that has a stored meta."""
+        result = {}
+        for uuid in uuids:
+            meta = self.get(uuid)
+            if meta is not None:
+                result[uuid] = meta
+        return result
+
+    def put_many(self, pairs):
+        for uuid, meta in pairs:
+            self.put(uuid, meta)
+
+
+class JSONDirectoryMetaStore(MetaStore):
+    """Store each meta as its own json file in a :py:class:`FileLayout`."""
+
+    def __init__(self, directory, extension="replay_meta"):
+        self._directory = directory
+        self._extension = extension
+        os.makedirs(self._directory, exist_ok=True)
+        self._layout = FileLayout(directory, extension)
+
+    def path(self, uuid):
+        return self._layout.path(uuid)
+
+    def get(self, uuid):
+        try:
+            with open(self.path(uuid), 'rb') as f:
+                return ReplayMeta.from_dict(json.loads(f.read()))
+        except FileNotFoundError:
+            return None
+
+    def put(self, uuid, meta):
+        with atomic_write(self._layout.writable_path(uuid), 'w') as f:
+            f.write(json.dumps(meta.to_dict()))
+
+    def contains(self, uuid):
+        return os.path.exists(self.path(uuid))
+
+    def delete(self, uuid):
+        path = self.path(uuid)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def uuids(self):
+        return self._layout.uuids()
+
+    def migrate_layout(self):
+        """Move the metas of a flat directory into the fanned out layout."""
+        return self._layout.migrate()
+
+    def compact(self):
+        removed = sum(map(remove_stale_temporary_files, self._layout.directories()))
+        logger.info(f"Removed {removed} temporary files from {self._directory}")
+
+    def items(self):
+        for uuid in self.uuids():
+            try:
+                meta = self.get(uuid)
+            except Exception as e:
+                logger.warn(f"Could not decode meta for {uuid}: {e}")
+                continue
+            if meta is not None:
+                yield uuid, meta
+
+
+def copy_tensor_store(source: TensorStore, destination: TensorStore, skip_existing=True):
+    """Copy every tensor in source into destination."""
+    copied = 0
+    for uuid in source.uuids():
+        if skip_existing and destination.contains(uuid):
+            continue
+        try:
+            tensor = source.get(uuid)
+        except Exception as e:
+            logger.warn(f"Could not read {uuid} from {source}: {e}")
+            continue
+        destination.put(uuid, tensor)
+        copied += 1
+    return copied
+
+
+_worker_shard_fn = None
+_worker_shard_state = None
+
+
+def _initialize_shard_worker(shard_fn, state):
+    global _worker_shard_fn, _worker_shard_state
+    _worker_shard_fn = shard_fn
+    _worker_shard_state = state
+
+
+def _run_shard(shard):
+    return _worker_shard_fn(_worker_shard_state, shard)
+
+
+def map_shards(shard_fn, shards, state, processes=None, description="shards"):
+    """Yield shard_fn(state, shard) for each of shards, computed in a pool of processes.
+
+    Workers are forked, so `state`, such as a store, reaches them without
+    being pickled; stores reopen their handles in each process. Results are
+    yielded in the order of shards and progress is logged as each arrives.
+    """
+    start = time.monotonic()
+    executor = ProcessPoolExecutor(
+        max_workers=processes or multiprocessing.cpu_count(),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_initialize_shard_worker,
+        initargs=(shard_fn, state),
+    )
+    with executor:
+        for completed, result in enumerate(executor.map(_run_shard, shards)):
+            logger.info(
+                f"Finished {completed + 1} of {len(shards)} {description} "
+                f"in {time.monotonic() - start:.1f}s"
+            )
+            yield result
+
+
+def map_storage_order_shards(
+        tensor_store: TensorStore, uuids, shard_fn, processes=None, shards_per_process=4,
+        description="shards"
+):
+    """Yield shard_fn(tensor_store, shard) for contiguous shards of uuids in storage order.
+
+    Each worker of :py:func:`map_shards` then reads its part of the cache
+    sequentially.
+    """
+    uuids = tensor_store.storage_order(list(uuids))
+    processes = processes or multiprocessing.cpu_count()
+    shard_count = max(1, min(len(uuids), processes * shards_per_process))
+    shards = [
+        uuids[len(uuids) * i // shard_count:len(uuids) * (i + 1) // shard_count]
+        for i in range(shard_count)
+    ]
+    return map_shards(shard_fn, shards, tensor_store, processes, description=description)
@@ -0,0 +1,170 @@
+"""Side by side tensor caches for different boxcar frames arguments."""
+import collections
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+
+from .cache_store import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+
+ARGUMENTS_FILENAME = ".boxcars_frames_arguments"
+LAST_USED_FILENAME = ".last_used"
+
+
+def variant_key(boxcar_frames_arguments) -> str:
+    """Get the canonical key of the cache variant for boxcar_frames_arguments."""
+    return hashlib.sha1(
+        json.dumps(boxcar_frames_arguments, sort_keys=True).encode('utf-8')
+    ).hexdigest()[:16]
+
+
+def directory_size(directory) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _move_tree(source, destination, skip) -> int:
+    """Move the files under source into destination except those whose name skip accepts.
+
+    Directories are merged recursively and removed once they are empty.
+    """
+    moved = 0
+    os.makedirs(destination, exist_ok=True)
+    with os.scandir(source) as entries:
+        for entry in entries:
+            if skip(entry.name):
+                continue
+            target = os.path.join(destination, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                moved += _move_tree(entry.path, target, skip)
+                if not os.listdir(entry.path):
+                    os.rmdir(entry.path)
+            else:
+                os.replace(entry.path, target)
+                moved += 1
+    return moved
+
+
+CacheVariant = collections.namedtuple(
+    "CacheVariant", "key boxcar_frames_arguments directory size last_used"
+)
+
+
+class TensorCacheVariants:
+    """Keep one tensor cache directory per set of boxcar frames arguments under root.
+
+    Variants live in `root/variants/<key>` where key is
+    :py:func:`variant_key` of the arguments, so switching between
+    configurations reuses whatever was already parsed for each of them.
+    Replay metadata does not depend on the arguments and is shared, so only
+    tensors are kept per variant.
+    """
+
+    def __init__(self, root):
+        self._root = root
+
+    @property
+    def _variants_directory(self):
+        return os.path.join(self._root, "variants")
+
+    def variant_directory(self, key):
+        return os.path.join(self._variants_directory, key)
+
+    def directory_for(self, boxcar_frames_arguments):
+        """Get the cache directory of boxcar_frames_arguments, creating it if necessary."""
+        directory = self.variant_directory(variant_key(boxcar_frames_arguments))
+        arguments_path = os.path.join(directory, ARGUMENTS_FILENAME)
+        if not os.path.exists(arguments_path):
+            os.makedirs(directory, exist_ok=True)
+            with atomic_write(arguments_path, 'w') as f:
+                f.write(json.dumps(boxcar_frames_arguments))
+        with atomic_write(os.path.join(directory, LAST_USED_FILENAME), 'w') as f:
+            f.write(str(time.time()))
+        return directory
+
+    def variants(self, with_size=True):
+        """Describe every variant, including its size on disk when with_size is set."""
+        try:
+            keys = sorted(os.listdir(self._variants_directory))
+        except FileNotFoundError:
+            return []
+        return [self._describe(key, with_size) for key in keys]
+
+    def frame_rate_sources(self, boxcar_frames_arguments):
+        """Find the variants that boxcar_frames_arguments can be derived from by downsampling.
+
+        These are the variants whose arguments differ only in an fps that is
+        an integer multiple of the requested one. Pairs of (factor, variant)
+        are returned with the smallest factor first.
+        """
+        requested = dict(boxcar_frames_arguments)
+        fps = requested.pop('fps', None)
+        if not fps:
+            return []
+        sources = []
+        for variant in self.variants(with_size=False):
+            arguments = dict(variant.boxcar_frames_arguments or {})
+            source_fps = arguments.pop('fps', None)
+            if arguments != requested or not source_fps or source_fps <= fps:
+                continue
+            factor = source_fps / fps
+            if factor == int(factor):
+                sources.append((int(factor), variant))
+        return sorted(sources, key=lambda pair: pair[0])
+
+    def _describe(self, key, with_size=True):
+        directory = self.variant_directory(key)
+        try:
+            with open(os.path.join(directory, ARGUMENTS_FILENAME), 'r') as f:
+                arguments = json.loads(f.read())
+        except (FileNotFoundError, ValueError):
+            arguments = None
+        try:
+            with open(os.path.join(directory, LAST_USED_FILENAME), 'r') as f:
+                last_used = float(f.read())
+        except (FileNotFoundError, ValueError):
+            last_used = None
+        size = directory_size(directory) if with_size else None
+        return CacheVariant(key, arguments, directory, size, last_used)
+
+    def remove(self, key):
+        """Delete the variant with key and everything cached in it."""
+        directory = self.variant_directory(key)
+        if not os.path.isdir(directory):
+            raise KeyError(key)
+        shutil.rmtree(directory)
+
+    def migrate_legacy_cache(self, is_meta_filename=lambda name: name.endswith(".replay_meta")):
+        """Move the tensors of a cache that predates variants into its variant directory.
+
+        The legacy layout kept tensors directly in root next to a
+        `.boxcars_frames_arguments` file. Moving them is a rename on the same
+        filesystem. Metadata files are left in place because they are shared,
+        including those in the uuid prefix directories of a fanned out cache.
+        Returns the key of the variant that was populated, or None.
+        """
+        arguments_path = os.path.join(self._root, ARGUMENTS_FILENAME)
+        if not os.path.exists(arguments_path):
+            return None
+        with open(arguments_path, 'r') as f:
+            arguments = json.loads(f.read())
+        directory = self.directory_for(arguments)
+        moved = _move_tree(
+            self._root, directory,
+            lambda name: name in ("variants", ARGUMENTS_FILENAME) or is_meta_filename(name)
+        )
+        os.remove(arguments_path)
+        logger.info(f"Moved {moved} legacy tensor cache entries into variant {directory}")
+        return variant_key(arguments)
@@ -1,14 +1,18 @@
 """Defines command line entrypoints to the this library."""
 import argparse
+import asyncio
 import boxcars_py
 import backoff
 import coloredlogs
 import datetime
 import functools
+import itertools
 import logging
 import os
 import requests
+import time
 import torch
+import tqdm
 import json
 import xdg_base_dirs
 import numpy as np
@@ -17,12 +21,21 @@ from pathlib import Path
 
 from . import _http_graph_server
 from . import assess
+from . import cache_fsck
+from . import cache_store
+from . import cache_variants
+from . import feature_stats
+from . import label_table
 from . import load
 from . import logger
 from . import loss
 from . import metadata
 from . import player_cache as pc
+from . import player_prefetch
+from . import prefetch
 from . import replay_attributes_db
+from . import replay_meta_db
+from . import response_archive
 from . import score
 from . import tracker_network
 from . import util
@@ -63,6 +76,10 @@ def _add_rlrml_args(parser=None):
         "player-cache": os.path.join(rlrml_data_directory, "player_cache"),
         "tensor-cache": os.path.join(rlrml_data_directory, "tensor_cache"),
         "replay-attributes-db": os.path.join(rlrml_data_directory, "replay_attributes_db"),
+        "replay-meta-db": os.path.join(rlrml_data_directory, "replay_meta_db"),
+        "response-archive": os.path.join(rlrml_data_directory, "tracker_response_archive"),
+        "replay-index-directory": os.path.join(rlrml_data_directory, "replay_index"),
+        "label-table": os.path.join(rlrml_data_directory, "label_table"),
         "replay-path": os.path.join(rlrml_data_directory, "replays"),
         "playlist": Playlist("Ranked Doubles 2v2"),
         "boxcar-frames-arguments": {
@@ -89,6 +106,61 @@ def _add_rlrml_args(parser=None):
         type=Path,
         default=defaults.get('replay-attributes-db')
     )
+    parser.add_argument(
+        '--replay-meta-db',
+        help="The directory where the lmdb database of cached replay metadata is located.",
+        type=Path,
+        default=defaults.get('replay-meta-db')
+    )
+    parser.add_argument(
+        '--response-archive',
+        help="The directory of the lmdb archive of raw tracker network responses.",
+        type=Path,
+        default=defaults.get('response-archive')
+    )
+    parser.add_argument(
+        '--no-archive-responses',
+        help="Do not record raw tracker network responses in the response archive.",
+        action='store_false', dest='archive_responses',
+        default=defaults.get('archive-responses', True)
+    )
+    parser.add_argument(
+        '--replay-index-directory',
+        help="The directory where persisted indexes of replay directories are kept.",
+        type=Path,
+        default=defaults.get('replay-index-directory')
+    )
+    parser.add_argument(
+        '--label-table',
+        help="The directory where the lmdb table of precomputed replay labels is located.",
+        type=Path,
+        default=defaults.get('label-table')
+    )
+    parser.add_argument(
+        '--no-derive-lower-fps',
+        help="Do not serve tensors from a cached variant at a multiple of the requested fps.",
+        dest='derive_lower_fps',
+        action='store_false',
+        default=True
+    )
+    parser.add_argument(
+        '--derived-fps-mode',
+        help="How frames are combined when deriving tensors from a higher fps variant.",
+        choices=cache_store.DownsampledTensorStore.modes,
+        default=defaults.get('derived-fps-mode', 'stride')
+    )
+    parser.add_argument(
+        '--persist-derived-tensors',
+        help="Save tensors derived from a higher fps variant into the current variant.",
+        action='store_true',
+        default=False
+    )
+    parser.add_argument(
+        '--meta-cache-backend',
+        help="How replay metadata is stored in the tensor cache.",
+        choices=["json", "lmdb"],
+        default=defaults.get('meta-cache-backend', 'lmdb')
+    )
     parser.add_argument(
         '--num-workers',
         type=int,
@@ -100,12 +172,48 @@ def _add_rlrml_args(parser=None):
         action='store_true',
         default=False
     )
+    parser.add_argument(
+        '--streaming',
+        help="Stream the dataset in storage order, split across workers and ranks.",
+        action='store_true',
+        default=False
+    )
+    parser.add_argument(
+        '--shuffle-buffer-size',
+        help="The number of replays each streaming reader shuffles between.",
+        type=int,
+        default=defaults.get('shuffle-buffer-size', 1000)
+    )
+    parser.add_argument(
+        '--prefetch-batches',
+        help="Pad this many batches ahead in a background thread, reusing their buffers.",
+        type=int,
+        default=defaults.get('prefetch-batches', 0)
+    )
+    parser.add_argument(
+        '--preload-gigabytes',
+        help="The most tensor data that --preload may hold in shared memory.",
+        type=float,
+        default=defaults.get('preload-gigabytes')
+    )
+    parser.add_argument(
+        '--tensor-lru-gigabytes',
+        help="The size of each process's cache of recently used tensors not preloaded.",
+        type=float,
+        default=defaults.get('tensor-lru-gigabytes', 0.0)
+    )
     parser.add_argument(
         '--tensor-cache',
         help="The directory where the tensor cache is held",
         type=Path,
         default=defaults.get('tensor-cache', '~/.local/share/rlrml/tensor_cache')
     )
+    parser.add_argument(
+        '--tensor-cache-backend',
+        help="How tensors are stored in the tensor cache.",
+        choices=["pickle", "packed"],
+        default=defaults.get('tensor-cache-backend', 'pickle')
+    )
     parser.add_argument(
         '--playlist',
         help="The name (or number) of the playlist that is being used.",
@@ -124,6 +232,24 @@ def _add_rlrml_args(parser=None):
         default=False,
         help="Whether or not to scale positions the position values in the replay tensors.",
     )
+    parser.add_argument(
+        '--scale-positions-per-batch',
+        help=(
+            "Cache unscaled tensors and scale positions in each batch instead, so that "
+            "changing the position scale does not invalidate the tensor cache."
+        ),
+        action='store_true',
+        default=False
+    )
+    parser.add_argument(
+        '--normalize-features',
+        help=(
+            "Standardize model inputs with the statistics computed by "
+            "compute_feature_statistics for the current tensor cache variant."
+        ),
+        action='store_true',
+        default=False
+    )
     parser.add_argument(
         '--model-path',
         help="The path from which to load a model",
@@ -146,6 +272,12 @@ def _add_rlrml_args(parser=None):
         type=int,
         default=3,
     )
+    parser.add_argument(
+        '--packed-sequences',
+        help="Run the lstm over packed sequences so that padding is skipped.",
+        action='store_true',
+        default=defaults.get('packed-sequences', False)
+    )
     parser.add_argument(
         '--lmdb',
         action='store_const',
@@ -159,6 +291,16 @@ def _add_rlrml_args(parser=None):
         const='leveldb',
         dest='db_backend',
     )
+    parser.add_argument(
+        '--player-cache-codec',
+        help="The encoding of values written to the player cache.",
+        choices=list(pc.codecs), default=defaults.get('player-cache-codec', pc.default_codec.name)
+    )
+    parser.add_argument(
+        '--player-summary-lru-size', type=int,
+        help="The number of player summaries to keep decoded in memory.",
+        default=defaults.get('player-summary-lru-size', 20000)
+    )
     parser.add_argument(
         '--loss-type',
         type=loss.LossType,
@@ -179,6 +321,12 @@ def _add_rlrml_args(parser=None):
         type=int,
         default=defaults.get('batch-size', 16)
     )
+    parser.add_argument(
+        '--bucket-by-length',
+        help="Batch replays of similar length together to reduce padding.",
+        action='store_true',
+        default=defaults.get('bucket-by-length', False)
+    )
     parser.add_argument(
         '--learning-rate',
         type=float,
@@ -273,24 +421,43 @@ class _RLRMLBuilder:
         os.makedirs(self.args.replay_attributes_db, exist_ok=True)
         return replay_attributes_db.ReplayAttributesDB(str(self.args.replay_attributes_db))
 
-    def replay_is_blacklisted(self, uuid):
-        return self.replay_attributes_db.get_replay_attributes(uuid).get(
-            "blacklisted", False
+    @functools.cached_property
+    def replays_with_load_errors(self):
+        return self.replay_attributes_db.uuids_with_attribute(
+            replay_attributes_db.ReplayAttributesDB.load_error_attribute
         )
 
+    @functools.cached_property
+    def blacklisted_replays(self):
+        """The uuids of every blacklisted replay, read in one scan.
+
+        Replays blacklisted through this builder are added to it.
+        """
+        return self.replay_attributes_db.uuids_with_attribute("blacklisted")
+
+    def replay_is_blacklisted(self, uuid):
+        return uuid in self.blacklisted_replays
+
     @functools.cached_property
     def player_cache(self):
         return (
             pc.PlayerCache.plyvel
             if self.args.db_backend == "leveldb"
             else pc.PlayerCache.lmdb
-        )(str(self.args.player_cache))
+        )(
+            str(self.args.player_cache), codec=pc.codecs[self.args.player_cache_codec],
+            summary_lru_size=self.args.player_summary_lru_size,
+        )
 
     @functools.cached_property
-    def cached_get_player_data(self):
-        getter = pc.CachedGetPlayerData(
+    def cached_player_getter(self):
+        return pc.CachedGetPlayerData(
             self.player_cache, self.network_get_player_data, retry_errors=("500",)
         )
+
+    @functools.cached_property
+    def cached_get_player_data(self):
+        getter = self.cached_player_getter
         ids_to_check = ['14d9cf07-ad46-440c-bac5-000d778449c2']
 
         def _hack_to_check_for_bad_data(player, *args, **kwargs):
@@ -313,9 +480,15 @@ class _RLRMLBuilder:
     @functools.cached_property
     def tracker_network_cloud_scraper(self):
         return tracker_network.CloudScraperTrackerNetwork(
-            proxy_uris=self.args.socks_proxy_urls
+            proxy_uris=self.args.socks_proxy_urls, response_archive=self.response_archive
         )
 
+    @functools.cached_property
+    def response_archive(self):
+        if not self.args.archive_responses:
+            return None
+        return response_archive.ResponseArchive(str(self.args.response_archive))
+
     @functools.cached_property
     def bare_get_player_data(self):
         return self.tracker_network_cloud_scraper.get_player_data
@@ -325,7 +498,7 @@ class _RLRMLBuilder:
         if self.args.cycle_vpn:
             return self.vpn_cycled_get_player_data
         else:
-            return tracker_network.get_player_data_with_429_retry()
+            return tracker_network.get_player_data_with_429_retry(self.bare_get_player_data)
 
     @functools.cached_property
     def playlist(self):
@@ -350,16 +523,89 @@ class _RLRMLBuilder:
     def player_mmr_estimate_scorer(self):
         return score.MMREstimateScorer(
             self.cached_get_player_data,
-            truncate_lowest_count=self.args.mmr_required_for_all_but
+            truncate_lowest_count=self.args.mmr_required_for_all_but,
+            get_player_summary=self.cached_player_getter.get_player_summary,
+            get_player_summaries=self.cached_player_getter.get_player_summaries,
         )
 
+    @functools.cached_property
+    def tensor_cache_variants(self):
+        variants = cache_variants.TensorCacheVariants(str(self.args.tensor_cache))
+        variants.migrate_legacy_cache()
+        return variants
+
+    @functools.cached_property
+    def tensor_cache_arguments(self):
+        """The arguments that determine the contents of the tensor cache variant in use."""
+        if self.args.scale_positions_per_batch:
+            return dict(self.args.bcf_args, raw_positions=True)
+        return self.args.bcf_args
+
+    @functools.cached_property
+    def tensor_cache_directory(self):
+        """The tensor cache directory of the current boxcar frames arguments."""
+        return self.tensor_cache_variants.directory_for(self.tensor_cache_arguments)
+
+    @property
+    def cached_tensor_transformer(self):
+        """The transformation applied to replay tensors before they are cached."""
+        if self.args.scale_positions_per_batch:
+            return lambda tensor: tensor
+        return self.position_scaler.scale_position_columns
+
+    def _tensor_store_in(self, directory):
+        if self.args.tensor_cache_backend == "packed":
+            return cache_store.PackedTensorStore(os.path.join(directory, "packed"))
+        return cache_store.PickleTensorStore(directory)
+
+    @functools.cached_property
+    def tensor_store(self):
+        return self._tensor_store_in(self.tensor_cache_directory)
+
+    @functools.cached_property
+    def fallback_tensor_store(self):
+        """A downsampled view of the closest cached variant at a multiple of the current fps."""
+        if not self.args.derive_lower_fps:
+            return None
+        for factor, variant in self.tensor_cache_variants.frame_rate_sources(
+                self.tensor_cache_arguments
+        ):
+            logger.info(
+                f"Deriving tensors missing from the cache from variant {variant.key} "
+                f"at {factor}x the fps"
+            )
+            return cache_store.DownsampledTensorStore(
+                self._tensor_store_in(variant.directory), factor,
+                mode=self.args.derived_fps_mode
+            )
+
+    @functools.cached_property
+    def meta_store(self):
+        if self.args.meta_cache_backend == "json":
+            return cache_store.JSONDirectoryMetaStore(self.args.tensor_cache)
+        meta_db = replay_meta_db.ReplayMetaDB(str(self.args.replay_meta_db))
+        if meta_db.is_empty() and os.path.exists(self.args.tensor_cache):
+            logger.warn(
+                "The replay meta database is empty. If the tensor cache has .replay_meta "
+                "files from before it existed, run migrate_replay_meta to avoid "
+                "parsing their replays again."
+            )
+        return meta_db
+
     @functools.cached_property
     def cached_directory_replay_set(self):
-        return load.DirectoryReplaySet.cached(
-            self.args.tensor_cache, self.args.replay_path,
-            boxcar_frames_arguments=self.args.bcf_args,
-            tensor_transformer=self.position_scaler.scale_position_columns,
-            skip_uuid_fn=self.replay_is_blacklisted
+        return load.CachedReplaySet(
+            load.DirectoryReplaySet(
+                self.args.replay_path,
+                boxcar_frames_arguments=self.args.bcf_args,
+                tensor_transformer=self.cached_tensor_transformer,
+                skip_uuid_fn=self.replay_is_blacklisted,
+                index_directory=self.args.replay_index_directory
+            ),
+            self.tensor_cache_directory, tensor_store=self.tensor_store,
+            meta_store=self.meta_store, boxcar_frames_arguments=self.tensor_cache_arguments,
+            fallback_tensor_store=self.fallback_tensor_store,
+            persist_fallback=self.args.persist_derived_tensors,
         )
 
     @functools.cached_property
@@ -370,24 +616,54 @@ class _RLRMLBuilder:
             playlist=self.playlist
         )
 
-    @functools.cached_property
-    def lookup_label(self):
+    def _lookup_label_with(self, scorer):
         def get_player_label(player, date):
             if isinstance(date, datetime.datetime):
                 date = date.date()
-            return self.player_mmr_estimate_scorer.score_player_mmr_estimate(
+            return scorer.score_player_mmr_estimate(
                 player, date, playlist=self.playlist
             )[0]
         return get_player_label
 
+    @functools.cached_property
+    def lookup_label(self):
+        return self._lookup_label_with(self.player_mmr_estimate_scorer)
+
+    @functools.cached_property
+    def cache_only_lookup_label(self):
+        """A version of lookup_label that never fetches missing players from the network."""
+        return self._lookup_label_with(
+            self.player_mmr_estimate_scorer.with_get_player_data(
+                self.player_cache.get_player_data, self.player_cache.get_player_summary,
+                self.player_cache.get_player_summaries,
+            )
+        )
+
+    @functools.cached_property
+    def label_table(self):
+        return label_table.LabelTable(
+            str(self.args.label_table),
+            label_table.label_table_version(self.player_mmr_estimate_scorer, self.playlist),
+            self.player_cache.get_player_summaries,
+        )
+
     @functools.cached_property
     def torch_dataset(self):
         return load.ReplayDataset(
             self.cached_directory_replay_set, self.lookup_label,
             self.playlist, self.header_info, preload=self.args.preload,
-            label_scaler=self.label_scaler, skip_uuid_fn=self.replay_is_blacklisted
+            label_scaler=self.label_scaler, skip_uuid_fn=self.replay_is_blacklisted,
+            preload_bytes=self._gigabytes_to_bytes(self.args.preload_gigabytes),
+            lru_bytes=self._gigabytes_to_bytes(self.args.tensor_lru_gigabytes) or 0,
+            label_table=self.label_table,
+            exclude_uuids=self.replays_with_load_errors,
+            on_load_error=self.replay_attributes_db.record_load_error,
         )
 
+    @staticmethod
+    def _gigabytes_to_bytes(gigabytes):
+        return None if gigabytes is None else int(gigabytes * 1024 ** 3)
+
     @functools.cached_property
     def header_info(self):
         headers_args = dict(self.args.bcf_args)
@@ -448,11 +724,34 @@ class _RLRMLBuilder:
     def loss_function(self):
         return self.args.loss_type.get_fn_from_args(**self.args.loss_params)
 
+    @functools.cached_property
+    def training_dataset(self):
+        if self.args.streaming:
+            return load.ReplayStreamDataset(
+                self.torch_dataset, shuffle_buffer_size=self.args.shuffle_buffer_size
+            )
+        return self.torch_dataset
+
     @functools.cached_property
     def data_loader(self):
+        batch_transform = (
+            self.position_scaler.scale_position_columns
+            if self.args.scale_positions_per_batch else None
+        )
+        if self.args.prefetch_batches:
+            return prefetch.BatchPrefetcher(
+                load.batched_packed_loader(
+                    self.training_dataset, batch_size=self.args.batch_size,
+                    num_workers=self.args.num_workers,
+                    bucket_by_length=self.args.bucket_by_length, pad_sequences=False
+                ),
+                depth=self.args.prefetch_batches, batch_transform=batch_transform,
+                pin_memory=self.device.type == "cuda"
+            )
         return load.batched_packed_loader(
-            self.torch_dataset, batch_size=self.args.batch_size,
-            num_workers=self.args.num_workers
+            self.training_dataset, batch_size=self.args.batch_size,
+            num_workers=self.args.num_workers, bucket_by_length=self.args.bucket_by_length,
+            batch_transform=batch_transform
         )
 
     @functools.cached_property
@@ -463,11 +762,39 @@ class _RLRMLBuilder:
             device=self.device,
         )
 
+    @property
+    def feature_statistics_path(self):
+        return os.path.join(
+            self.tensor_cache_directory, feature_stats.FEATURE_STATISTICS_FILENAME
+        )
+
+    @functools.cached_property
+    def feature_statistics(self):
+        """The statistics of the model inputs, or None if they have not been computed."""
+        if not os.path.exists(self.feature_statistics_path):
+            return None
+        statistics = feature_stats.FeatureStatistics.load(self.feature_statistics_path)
+        if self.args.scale_positions_per_batch:
+            # The cache holds unscaled positions, but the model sees scaled ones.
+            statistics = statistics.linearly_transformed(
+                self.position_scaler.multipliers, self.position_scaler.offsets
+            )
+        return statistics
+
     @functools.cached_property
     def model(self):
+        feature_statistics = None
+        if self.args.normalize_features:
+            feature_statistics = self.feature_statistics
+            if feature_statistics is None:
+                raise Exception(
+                    f"No feature statistics at {self.feature_statistics_path}, "
+                    "run compute_feature_statistics first"
+                )
         model = build.ReplayModel(
             self.header_info, self.playlist, lstm_width=self.args.lstm_width,
-            lstm_depth=self.args.lstm_depth
+            lstm_depth=self.args.lstm_depth, packed_sequences=self.args.packed_sequences,
+            feature_statistics=feature_statistics
         )
         if self.args.model_path and os.path.exists(self.args.model_path):
             logger.info(f"Loading model path from {self.args.model_path}")
@@ -487,12 +814,16 @@ class _RLRMLBuilder:
         session.headers.update(Authorization=self.args.ballchasing_token)
         return session
 
-    @functools.cached_property
-    def uuid_to_path(self):
+    def replay_uuid_to_path(self, directory):
+        """Get a uuid to path dictionary for the replays in directory from its persisted index."""
         return dict(util.get_replay_uuids_in_directory(
-            self.args.replay_path
+            directory, index_directory=self.args.replay_index_directory
         ))
 
+    @functools.cached_property
+    def uuid_to_path(self):
+        return self.replay_uuid_to_path(self.args.replay_path)
+
     def get_game_filepath_by_uuid(self, uuid):
         try:
             filepath = self.uuid_to_path[uuid]
@@ -769,6 +1100,386 @@ def lmdb_migrate(builder: _RLRMLBuilder):
     migrate_cache_raw(builder.player_cache, lmdb_cache)
 
 
+@_RLRMLBuilder.with_default
+def reencode_player_cache(builder: _RLRMLBuilder):
+    """Rewrite the player cache values that do not use the configured codec."""
+    reencoded = builder.player_cache.reencode()
+    logger.info(f"Re-encoded {reencoded} player cache values as {builder.args.player_cache_codec}")
+
+
+@_RLRMLBuilder.with_default
+def build_player_summaries(builder: _RLRMLBuilder):
+    """Write the summary of every player whose stored summary is missing or out of date."""
+    built = builder.player_cache.build_summaries()
+    logger.info(f"Built {built} player summaries")
+
+
+def benchmark_player_cache():
+    """Compare the per player cost of reading the player cache one player at a time and batched."""
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--player-count', type=int, default=20000,
+        help="The number of players from the start of the cache to read."
+    )
+    parser.add_argument(
+        '--players-per-read', type=int, default=4,
+        help="The number of players read together, like the players of a replay."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    player_cache = builder.player_cache
+    players = [
+        {"__tracker_suffix__": bytes(key)}
+        for key, _ in itertools.islice(player_cache._db.iterator(), builder.args.player_count)
+    ]
+    batches = [
+        players[start:start + builder.args.players_per_read]
+        for start in range(0, len(players), builder.args.players_per_read)
+    ]
+
+    def per_player_microseconds(read_batch):
+        start = time.perf_counter()
+        for batch in batches:
+            read_batch(batch)
+        return (time.perf_counter() - start) / max(len(players), 1) * 1e6
+
+    timings = {
+        "data, one read per player": lambda batch: [
+            player_cache.get_player_data(player) for player in batch
+        ],
+        "data, get_many": player_cache.get_many,
+        "summaries, one read per player": lambda batch: [
+            player_cache.get_player_summary(player) for player in batch
+        ],
+        "summaries, get_player_summaries": player_cache.get_player_summaries,
+    }
+    for description, read_batch in timings.items():
+        player_cache.clear_lru()
+        print(f"{description:>36}: {per_player_microseconds(read_batch):8.1f}us per player")
+    # The last timing left the summaries of every player it read in memory.
+    print(
+        f"{'summaries, in memory':>36}: "
+        f"{per_player_microseconds(player_cache.get_player_summaries):8.1f}us per player"
+    )
+    print(player_cache.lru_stats())
+
+
+def prefetch_players():
+    """Fetch the uncached players of every cached replay, those completing the most replays first.
+
+    Fetched players are written to the player cache as they arrive, so an
+    interrupted prefetch resumes where it left off when run again.
+    """
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--concurrency-per-proxy', type=int, default=4,
+        help="The number of requests in flight through each proxy at once."
+    )
+    parser.add_argument(
+        '--max-players', type=int, default=None,
+        help="Stop after fetching this many players."
+    )
+    parser.add_argument(
+        '--write-batch-size', type=int, default=100,
+        help="The number of fetched players written to the player cache at once."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    retry_errors = ("500",)
+    plan = player_prefetch.plan_prefetch(
+        builder.meta_store, builder.player_cache, retry_errors=retry_errors
+    )
+    players = plan.players[:builder.args.max_players]
+    logger.info(
+        f"{plan.labeled} of {plan.replays} replays are fully labeled and "
+        f"{plan.unlabelable} have a player that can not be fetched. Fetching "
+        f"{len(players)} of {len(plan.players)} players would label "
+        f"{plan.unlocks[len(players) - 1] if players else 0} more"
+    )
+    proxy_uris = builder.args.socks_proxy_urls or (None,)
+    archive = response_archive.ResponseArchive(
+        str(builder.args.response_archive), batch_size=builder.args.write_batch_size
+    ) if builder.args.archive_responses else None
+
+    async def run():
+        async with tracker_network.AsyncTrackerNetwork(
+                proxy_uris=proxy_uris,
+                concurrency_per_proxy=builder.args.concurrency_per_proxy,
+                response_archive=archive,
+        ) as network:
+            getter = pc.AsyncCachedGetPlayerData(
+                builder.player_cache, network.get_player_data, retry_errors=retry_errors,
+                batch_size=builder.args.write_batch_size,
+            )
+            with tqdm.tqdm(total=len(players), unit="player") as pbar:
+                # Players finish out of order, but unlocks[index] only holds
+                # once every player before index is done, so the count
+                # follows the longest completed prefix of players.
+                done = set()
+                prefix = 0
+
+                def on_fetched(index, _):
+                    nonlocal prefix
+                    done.add(index)
+                    while prefix in done:
+                        done.remove(prefix)
+                        prefix += 1
+                    pbar.update(1)
+                    pbar.set_postfix(
+                        replays_labeled=plan.unlocks[prefix - 1] if prefix else 0,
+                        refresh=False,
+                    )
+                try:
+                    return await player_prefetch.prefetch_players(
+                        players, getter.get_player_data,
+                        workers=builder.args.concurrency_per_proxy * len(proxy_uris),
+                        on_fetched=on_fetched,
+                    )
+                finally:
+                    getter.flush()
+                    if archive is not None:
+                        archive.flush()
+                    network.log_proxy_stats()
+
+    failed = asyncio.run(run())
+    logger.info(f"Fetched {len(players) - failed} players, {failed} could not be fetched")
+
+
+@_RLRMLBuilder.with_default
+def pack_tensor_cache(builder: _RLRMLBuilder):
+    """Copy the pickled tensors in the tensor cache into the packed tensor store."""
+    copied = cache_store.copy_tensor_store(
+        cache_store.PickleTensorStore(builder.tensor_cache_directory),
+        cache_store.PackedTensorStore(os.path.join(builder.tensor_cache_directory, "packed"))
+    )
+    logger.info(f"Packed {copied} tensors")
+
+
+def compute_feature_statistics():
+    """Compute the per column statistics of every tensor in the current cache variant."""
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help="The number of processes reading the cache, defaults to the cpu count."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    statistics = feature_stats.compute_feature_statistics(
+        builder.tensor_store, processes=builder.args.processes
+    )
+    statistics.save(builder.feature_statistics_path)
+    logger.info(
+        f"Saved statistics of {statistics.count} frames to {builder.feature_statistics_path}"
+    )
+
+
+def rebuild_player_cache():
+    """Regenerate player cache records from the response archive without using the network."""
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help="The number of processes parsing archived responses, defaults to the cpu count."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    rebuilt = response_archive.rebuild_player_cache(
+        response_archive.ResponseArchive(str(builder.args.response_archive)),
+        builder.player_cache, processes=builder.args.processes,
+    )
+    logger.info(f"Rebuilt {rebuilt} players from archived responses")
+
+
+def fsck_cache():
+    """Check the current tensor cache variant for damage left by interrupted writes."""
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help="The number of processes reading the cache, defaults to the cpu count."
+    )
+    parser.add_argument(
+        '--repair', action='store_true', default=False,
+        help="Delete unreadable tensors and tensors whose meta can not be rebuilt."
+    )
+    parser.add_argument(
+        '--rebuild-meta', action='store_true', default=False,
+        help="When repairing, recompute missing metas from the replay files."
+    )
+    parser.add_argument(
+        '--compact', action='store_true', default=False,
+        help="Reclaim the space of deleted entries and interrupted writes."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    report = cache_fsck.fsck_cache(
+        builder.tensor_store, builder.meta_store, repair=builder.args.repair,
+        rebuild_meta=(
+            builder.cached_directory_replay_set.rebuild_meta
+            if builder.args.rebuild_meta else None
+        ),
+        compact=builder.args.compact, processes=builder.args.processes,
+    )
+    logger.info(
+        f"Checked {report.checked} tensors: {report.unreadable} unreadable, "
+        f"{report.orphaned} without a meta, {report.rebuilt} metas rebuilt, "
+        f"{report.deleted} tensors deleted, "
+        f"{report.metas_without_tensors} metas not cached in this variant"
+    )
+
+
+def migrate_cache_layout():
+    """Fan the files of flat tensor and meta cache directories out by uuid prefix."""
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--all-variants', action='store_true', default=False,
+        help="Migrate every tensor cache variant rather than only the current one."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    directories = (
+        [variant.directory for variant in builder.tensor_cache_variants.variants(with_size=False)]
+        if builder.args.all_variants else [builder.tensor_cache_directory]
+    )
+    stores = [
+        (directory, cache_store.PickleTensorStore(directory)) for directory in directories
+    ]
+    stores.append(
+        (builder.args.tensor_cache, cache_store.JSONDirectoryMetaStore(builder.args.tensor_cache))
+    )
+    for directory, store in stores:
+        moved = store.migrate_layout()
+        logger.info(f"Moved {moved} files in {directory} into the fanned out layout")
+
+
+def tensor_cache_variants():
+    """List the tensor cache variants with their sizes, optionally removing some of them."""
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--remove', nargs='*', default=[],
+        help="The keys of variants to delete."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    variants = builder.tensor_cache_variants
+    for key in builder.args.remove:
+        variants.remove(key)
+        logger.info(f"Removed tensor cache variant {key}")
+
+    current_key = cache_variants.variant_key(builder.tensor_cache_arguments)
+    for variant in variants.variants():
+        last_used = (
+            "never" if variant.last_used is None
+            else datetime.datetime.fromtimestamp(variant.last_used).isoformat(timespec='seconds')
+        )
+        print(
+            f"{'*' if variant.key == current_key else ' '} {variant.key} "
+            f"{variant.size / 1024 ** 3:8.2f} GiB  last used {last_used}  "
+            f"{json.dumps(variant.boxcar_frames_arguments, sort_keys=True)}"
+        )
+
+
+@_RLRMLBuilder.with_default
+def migrate_replay_meta(builder: _RLRMLBuilder):
+    """Copy the .replay_meta files in the tensor cache into the replay meta database."""
+    migrated = replay_meta_db.migrate_meta_directory(
+        builder.args.tensor_cache,
+        replay_meta_db.ReplayMetaDB(str(builder.args.replay_meta_db))
+    )
+    logger.info(f"Migrated {migrated} replay metas")
+
+
+def warm_tensor_cache():
+    """Parse every uncached replay in a pool of processes and save it to the tensor cache."""
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help="The number of parsing processes, defaults to the cpu count."
+    )
+    parser.add_argument(
+        '--max-in-flight', type=int, default=None,
+        help="The maximum number of outstanding parses, defaults to twice the process count."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    assess.TensorCacheWarmer(
+        builder.cached_directory_replay_set, processes=builder.args.processes,
+        max_in_flight=builder.args.max_in_flight,
+        on_failure=builder.replay_attributes_db.record_load_errors
+    ).warm(
+        uuid for uuid in builder.cached_directory_replay_set.get_replay_uuids()
+        if uuid not in builder.replays_with_load_errors
+    )
+
+
+def revalidate_failed_replays():
+    """Parse every replay with a recorded load error again, clearing the errors that are gone.
+
+    Run this after upgrading boxcars to bring replays that used to fail back
+    into the dataset.
+    """
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help="The number of parsing processes, defaults to the cpu count."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+    replay_set = builder.cached_directory_replay_set
+    available = set(replay_set.get_replay_uuids())
+    failed = [uuid for uuid in builder.replays_with_load_errors if uuid in available]
+    logger.info(f"Revalidating {len(failed)} replays with load errors")
+
+    # The warmer skips cached replays, so their cached tensors are checked here.
+    loadable = []
+    for uuid in failed:
+        if not replay_set.is_cached(uuid):
+            continue
+        try:
+            cached = replay_set.get_cached_replay_tensor(uuid)
+            if cached is None:
+                raise ValueError("The cached tensor could not be found")
+            cache_fsck.check_tensor(cached[0])
+        except Exception as e:
+            logger.warn(f"The cached tensor of {uuid} does not load, parsing it again: {e}")
+            replay_set.bust_cache(uuid)
+        else:
+            loadable.append(uuid)
+    builder.replay_attributes_db.clear_load_errors(loadable)
+
+    stats = assess.TensorCacheWarmer(
+        replay_set, processes=builder.args.processes,
+        on_success=builder.replay_attributes_db.clear_load_errors,
+        on_failure=builder.replay_attributes_db.record_load_errors
+    ).warm(failed)
+    logger.info(f"{stats.parsed} replays now load, {stats.failed} still fail")
+
+
+def build_label_table():
+    """Compute the labels of every cached replay into the label table."""
+    parser = _add_rlrml_args()
+    parser.add_argument(
+        '--processes', type=int, default=None,
+        help="The number of labelling processes, defaults to the cpu count."
+    )
+    builder = _RLRMLBuilder(parser.parse_args())
+    builder._setup_default_logging()
+
+    def make_label_functions():
+        # Each worker needs its own player cache handle.
+        worker_builder = _RLRMLBuilder(builder.args)
+        return (
+            worker_builder.cache_only_lookup_label,
+            worker_builder.player_cache.get_player_summaries,
+        )
+
+    stats = label_table.build_label_table(
+        builder.label_table,
+        builder.cached_directory_replay_set.get_cached_replay_metas().items(),
+        make_label_functions, builder.playlist.player_count,
+        processes=builder.args.processes
+    )
+    logger.info(f"Finished building the label table: {stats}")
+
+
 @_RLRMLBuilder.add_args("port")
 def websocket_host(builder: _RLRMLBuilder):
     websocket.FrontendManager(
@@ -783,6 +1494,17 @@ def websocket_host(builder: _RLRMLBuilder):
             sys.exit()
 
 
+def _copy_backend(source: pc.DatabaseBackend, dest: pc.DatabaseBackend, batch_size=5000):
+    pairs = []
+    for key, value in source.iterator():
+        pairs.append((bytes(key), bytes(value)))
+        if len(pairs) >= batch_size:
+            dest.put_many(pairs)
+            pairs = []
+    dest.put_many(pairs)
+
+
 def migrate_cache_raw(source_cache: pc.PlayerCache, dest_cache: pc.PlayerCache):
-    for key, value in source_cache._db.iterator():
-        dest_cache._db.put(key, value)
+    _copy_backend(source_cache._db, dest_cache._db)
+    if source_cache._summary_db is not None and dest_cache._summary_db is not None:
+        _copy_backend(source_cache._summary_db, dest_cache._summary_db)
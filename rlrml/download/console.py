@@ -12,7 +12,6 @@ from .progress import BarProgressHandler
 from . import sync
 
 from .. import console
-from .. import util
 from .. import metadata
 
 
@@ -69,9 +68,8 @@ def run():
 
     all_replays_dir = args.all_replays_dir or args.path
 
-    existing_replay_uuids = set(
-        uuid for uuid, _ in util.get_replay_uuids_in_directory(all_replays_dir)
-    )
+    all_replays_uuid_to_path = builder.replay_uuid_to_path(all_replays_dir)
+    existing_replay_uuids = set(all_replays_uuid_to_path)
 
     def replay_exists(uuid):
         return uuid in existing_replay_uuids
@@ -82,15 +80,11 @@ def run():
         except Exception:
             return False
 
-        error_count = 0
-
-        for player in meta.player_order:
-            data = builder.player_cache.get_player_data(player)
-            if data and '__error__' in data:
-                error_count += 1
-            if error_count > args.mmr_required_for_all_but:
-                return False
-        return True
+        error_count = sum(
+            1 for summary in builder.player_cache.get_player_summaries(meta.player_order)
+            if summary is not None and summary.error is not None
+        )
+        return error_count <= args.mmr_required_for_all_but
 
     def filter_by_replay_score(replay_meta):
         try:
@@ -162,7 +156,8 @@ def run():
                 (filter_by_known_miss, "Too many players with known 404"),
                 (filter_by_replay_score, "Replay score was too low"),
                 (filter_by_disparity, "Disparity wasn't high enough")
-            ), symlink_if_known=args.symlink_if_known, all_replays_directory=all_replays_dir
+            ), symlink_if_known=args.symlink_if_known, all_replays_directory=all_replays_dir,
+            uuid_to_path=all_replays_uuid_to_path
         ).download_replays(args.count)
     else:
         with tqdm.tqdm(total=args.count) as pbar:
@@ -18,6 +18,7 @@ class SynchronousReplayDownloader:
             ballchasing_base_uri="https://ballchasing.com/api/",
             all_replays_directory=None,
             symlink_if_known=False,
+            uuid_to_path=None,
             **kwargs
     ):
         self._auth_token = auth_token
@@ -29,7 +30,9 @@ class SynchronousReplayDownloader:
         self._session.headers = {'Authorization': self._auth_token}
         self._all_replays_directory = all_replays_directory
         self._symlink_if_known = symlink_if_known
-        if all_replays_directory:
+        if uuid_to_path is not None:
+            self._uuid_to_path = uuid_to_path
+        elif all_replays_directory:
             self._uuid_to_path = dict(util.get_replay_uuids_in_directory(all_replays_directory))
         else:
             self._uuid_to_path = {}
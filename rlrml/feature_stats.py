@@ -0,0 +1,127 @@
+"""Per column statistics of the frames in a tensor cache."""
+import json
+import logging
+import numpy as np
+
+from .cache_store import atomic_write, map_storage_order_shards, TensorStore
+
+
+logger = logging.getLogger(__name__)
+
+
+FEATURE_STATISTICS_FILENAME = "feature_statistics.json"
+
+
+class FeatureStatistics:
+    """Running count, mean, variance, min and max of every column of a stream of frames.
+
+    Each update folds a whole block of frames in with Chan et al.'s parallel
+    form of Welford's algorithm, and the same merge combines statistics that
+    were accumulated separately, so shards can be summarized in parallel.
+    """
+
+    def __init__(self, count=0, mean=None, m2=None, minimum=None, maximum=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def update(self, frames):
+        frames = np.asarray(frames, dtype=np.float64)
+        if frames.shape[0] == 0:
+            return self
+        mean = frames.mean(axis=0)
+        self.merge(FeatureStatistics(
+            frames.shape[0], mean, ((frames - mean) ** 2).sum(axis=0),
+            frames.min(axis=0), frames.max(axis=0)
+        ))
+        return self
+
+    def merge(self, other: "FeatureStatistics"):
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.minimum, self.maximum = other.minimum, other.maximum
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / count)
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.count = count
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.count)
+
+    def linearly_transformed(self, multipliers, offsets):
+        """Get the statistics of the frames after x -> multipliers * x + offsets."""
+        multipliers = np.asarray(multipliers, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.float64)
+        bounds = (self.minimum * multipliers + offsets, self.maximum * multipliers + offsets)
+        return FeatureStatistics(
+            self.count, self.mean * multipliers + offsets, self.m2 * multipliers ** 2,
+            np.minimum(*bounds), np.maximum(*bounds)
+        )
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.mean.tolist(),
+            "std": self.std.tolist(),
+            "m2": self.m2.tolist(),
+            "min": self.minimum.tolist(),
+            "max": self.maximum.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["count"], np.array(data["mean"]), np.array(data["m2"]),
+            np.array(data["min"]), np.array(data["max"])
+        )
+
+    def save(self, path):
+        with atomic_write(path, 'w') as f:
+            f.write(json.dumps(self.to_dict()))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.loads(f.read()))
+
+
+def _shard_statistics(tensor_store, uuids):
+    statistics = FeatureStatistics()
+    for uuid in uuids:
+        try:
+            tensor = tensor_store.get(uuid)
+        except Exception as e:
+            logger.warn(f"Skipping {uuid} in feature statistics because of {e}")
+            continue
+        if tensor is not None:
+            statistics.update(tensor.numpy())
+    return statistics
+
+
+def compute_feature_statistics(
+        tensor_store: TensorStore, uuids=None, processes=None, shards_per_process=4
+) -> FeatureStatistics:
+    """Summarize every frame in tensor_store in a pool of processes.
+
+    The uuids are put in storage order and cut into contiguous shards so that
+    each worker reads its part of the cache sequentially.
+    """
+    statistics = FeatureStatistics()
+    for shard_statistics in map_storage_order_shards(
+            tensor_store, tensor_store.uuids() if uuids is None else uuids, _shard_statistics,
+            processes=processes, shards_per_process=shards_per_process,
+            description="feature statistics shards",
+    ):
+        statistics.merge(shard_statistics)
+    logger.info(f"Summarized {statistics.count} frames")
+    return statistics
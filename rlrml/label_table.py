@@ -0,0 +1,262 @@
+"""A persisted table of the labels of every cached replay."""
+import collections
+import hashlib
+import itertools
+import json
+import lmdb
+import logging
+import multiprocessing
+import numpy as np
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+logger = logging.getLogger(__name__)
+
+
+# Bumped whenever the layout of the stored rows changes.
+_format_version = 2
+_fingerprint_size = 8
+
+
+def label_table_version(scorer, playlist):
+    """Get the version of the labels produced by scorer for playlist.
+
+    The version does not depend on the player cache: each row records a
+    :py:func:`players_fingerprint` of the data its labels were computed from
+    instead, so that a write to the player cache only invalidates the rows of
+    the replays of the players that were written.
+    """
+    return hashlib.sha1(json.dumps({
+        "scorer": scorer.parameter_fingerprint(),
+        "playlist": str(playlist),
+        "format": _format_version,
+    }, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def players_fingerprint(player_summaries) -> bytes:
+    """Fingerprint the player data of a replay from the summaries of its players.
+
+    `player_summaries` are :py:class:`player_cache.PlayerSummary`, or None
+    for players without data, so the fingerprint changes whenever the data
+    of any of the players is written.
+    """
+    digest = hashlib.blake2b(digest_size=_fingerprint_size)
+    for summary in player_summaries:
+        digest.update(b"\x00" if summary is None else b"\x01" + (summary.data_digest or b""))
+    return digest.digest()
+
+
+class LabelTable:
+    """An lmdb backed table of the raw player labels of each replay, keyed by uuid.
+
+    Labels are stored unscaled in `meta.player_order` with NaN where no label
+    could be computed, so the same table serves any label scaler. The table
+    records the version it was built for and is ignored by readers when that
+    does not match `version`. Each row also records the
+    :py:func:`players_fingerprint` of its players, and is ignored when that
+    no longer matches the summaries returned by `get_player_summaries`.
+    """
+
+    version_key = b"version"
+
+    def __init__(self, filepath, version, get_player_summaries, **kwargs):
+        self._filepath = filepath
+        self._version = version
+        self._get_player_summaries = get_player_summaries
+        kwargs.setdefault("max_dbs", 4)
+        kwargs.setdefault("map_size", 2 * 1024 ** 3)
+        self._lmdb_kwargs = kwargs
+        self._env_pid = None
+        self._is_current = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_env_pid'] = None
+        for name in ('_env_instance', '_labels_db', '_info_db'):
+            state.pop(name, None)
+        return state
+
+    @property
+    def _env(self):
+        # Reopen after a fork so that DataLoader workers get their own handle.
+        if self._env_pid != os.getpid():
+            os.makedirs(self._filepath, exist_ok=True)
+            self._env_instance = lmdb.open(self._filepath, **self._lmdb_kwargs)
+            self._labels_db = self._env_instance.open_db(b"labels")
+            self._info_db = self._env_instance.open_db(b"info")
+            self._env_pid = os.getpid()
+        return self._env_instance
+
+    @property
+    def version(self):
+        return self._version
+
+    def stored_version(self):
+        env = self._env
+        with env.begin(db=self._info_db) as txn:
+            value = txn.get(self.version_key)
+        return None if value is None else bytes(value).decode('utf-8')
+
+    def is_current(self):
+        if self._is_current is None:
+            self._is_current = (
+                self._version is not None and self.stored_version() == self._version
+            )
+            if not self._is_current:
+                logger.warn(
+                    f"The label table at {self._filepath} is out of date, "
+                    "labels will be computed on demand"
+                )
+        return self._is_current
+
+    def reset(self):
+        """Empty the table and mark it as holding labels of the current version."""
+        env = self._env
+        with env.begin(write=True) as txn:
+            txn.drop(self._labels_db, delete=False)
+            txn.put(self.version_key, self._version.encode('utf-8'), db=self._info_db)
+        self._is_current = True
+
+    def fingerprint(self, players) -> bytes:
+        return players_fingerprint(self._get_player_summaries(list(players)))
+
+    def get(self, uuid, players):
+        """Get the raw labels of uuid, with None for missing labels.
+
+        Returns None if the table holds no labels for uuid, or if the data of
+        any of players, the `meta.player_order` of uuid, changed since they
+        were computed.
+        """
+        if not self.is_current():
+            return None
+        env = self._env
+        with env.begin(db=self._labels_db) as txn:
+            value = txn.get(uuid.encode('utf-8'))
+        if value is None:
+            return None
+        fingerprint, labels = self._decode_value(value)
+        if fingerprint != self.fingerprint(players):
+            return None
+        return labels
+
+    def put_many(self, rows):
+        """Store each (uuid, labels, fingerprint) row."""
+        env = self._env
+        with env.begin(db=self._labels_db, write=True) as txn:
+            for uuid, labels, fingerprint in rows:
+                txn.put(uuid.encode('utf-8'), self._encode_value(fingerprint, labels))
+
+    def uuids(self):
+        env = self._env
+        with env.begin(db=self._labels_db) as txn:
+            for key in txn.cursor().iternext(values=False):
+                yield bytes(key).decode('utf-8')
+
+    def _encode_value(self, fingerprint, labels):
+        return fingerprint + np.array(
+            [np.nan if label is None else label for label in labels], dtype=np.float32
+        ).tobytes()
+
+    def _decode_value(self, value_bytes):
+        value_bytes = bytes(value_bytes)
+        return value_bytes[:_fingerprint_size], [
+            None if np.isnan(label) else float(label)
+            for label in np.frombuffer(value_bytes, dtype=np.float32, offset=_fingerprint_size)
+        ]
+
+
+LabelBuildStats = collections.namedtuple("LabelBuildStats", "built failed skipped seconds")
+
+
+_worker_lookup_label = None
+_worker_get_player_summaries = None
+
+
+def _initialize_label_worker(make_label_functions):
+    global _worker_lookup_label, _worker_get_player_summaries
+    _worker_lookup_label, _worker_get_player_summaries = make_label_functions()
+
+
+def _compute_labels_in_worker(uuid_metas):
+    results = []
+    for uuid, meta in uuid_metas:
+        try:
+            # Fingerprint first, so that a concurrent write makes the row stale.
+            fingerprint = players_fingerprint(
+                _worker_get_player_summaries(list(meta.player_order))
+            )
+            labels = [
+                _worker_lookup_label(player, meta.datetime)
+                for player in meta.player_order
+            ]
+        except Exception as e:
+            logger.warn(f"Could not compute labels for {uuid}: {e}")
+            fingerprint, labels = None, None
+        results.append((uuid, labels, fingerprint))
+    return results
+
+
+def build_label_table(
+        label_table: LabelTable, uuid_metas, make_label_functions, label_count,
+        processes=None, chunk_size=256
+) -> LabelBuildStats:
+    """Compute the labels of every (uuid, meta) pair in a pool of processes.
+
+    `make_label_functions` is called once in every worker and must return a
+    `lookup_label(player, datetime)` function and a
+    `get_player_summaries(players)` function, like those of
+    :py:class:`player_cache.PlayerCache`, that open their own handles to any
+    databases that they use. Uuids that the table already holds at the
+    current version and fingerprint are skipped, so an interrupted build can
+    be restarted and a later build only recomputes the replays of players
+    whose data changed.
+    """
+    if label_table.stored_version() != label_table.version:
+        label_table.reset()
+    present = set(label_table.uuids())
+    processes = processes or multiprocessing.cpu_count()
+    stats = collections.Counter(built=0, failed=0, skipped=0)
+    start = time.monotonic()
+
+    def pending():
+        for uuid, meta in uuid_metas:
+            if uuid in present and label_table.get(uuid, meta.player_order) is not None:
+                stats['skipped'] += 1
+            else:
+                yield uuid, meta
+
+    def save(futures):
+        rows = []
+        for future in futures:
+            for uuid, labels, fingerprint in future.result():
+                if labels is None or len(labels) != label_count:
+                    stats['failed'] += 1
+                else:
+                    rows.append((uuid, labels, fingerprint))
+        label_table.put_many(rows)
+        stats['built'] += len(rows)
+        logger.info(
+            f"Built labels for {stats['built']} replays, failed: {stats['failed']}, "
+            f"already present: {stats['skipped']}"
+        )
+
+    executor = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_initialize_label_worker,
+        initargs=(make_label_functions,),
+    )
+    with executor:
+        in_flight = set()
+        uuid_meta_iterator = pending()
+        while chunk := list(itertools.islice(uuid_meta_iterator, chunk_size)):
+            if len(in_flight) >= processes * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                save(done)
+            in_flight.add(executor.submit(_compute_labels_in_worker, chunk))
+        save(wait(in_flight)[0])
+
+    return LabelBuildStats(seconds=time.monotonic() - start, **stats)
@@ -9,8 +9,10 @@ import random
 import torch
 
 from pathlib import Path
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset
 
+from . import cache_store
+from . import sampler
 from . import util
 from .metadata import ReplayMeta
 
@@ -47,6 +49,14 @@ class ReplaySet(abc.ABC):
         """Get the replay tensor and player order associated with the provided uuid."""
         pass
 
+    def get_replay_lengths(self, uuids) -> dict:
+        """Get the frame counts that are known without parsing for any of the provided uuids."""
+        return {}
+
+    def storage_order(self, uuids) -> list:
+        """Order uuids so that loading them one after another reads storage sequentially."""
+        return list(uuids)
+
 
 class CachedReplaySet(ReplaySet):
     """Wrapper for a replay set that caches the tensors that are provided by `get_replay_tensor`."""
@@ -55,9 +65,20 @@ class CachedReplaySet(ReplaySet):
 
     def __init__(
             self, replay_set: ReplaySet, cache_directory: Path, cache_extension="pt",
-            backup_get_meta=get_meta_boxcars, ensure_bcf_arg_match=True, **kwargs
+            backup_get_meta=get_meta_boxcars, ensure_bcf_arg_match=True,
+            tensor_store: cache_store.TensorStore = None,
+            meta_store: cache_store.MetaStore = None,
+            fallback_tensor_store: cache_store.TensorStore = None, persist_fallback=False,
+            **kwargs
     ):
-        """Initialize the cached replay set."""
+        """Initialize the cached replay set.
+
+        Tensors missing from `tensor_store` are taken from
+        `fallback_tensor_store` when it has them, such as a
+        :py:class:`cache_store.DownsampledTensorStore` over a higher frame rate
+        variant, before resorting to parsing the replay. They are copied into
+        `tensor_store` only when `persist_fallback` is set.
+        """
         self._replay_set = replay_set
         self._cache_directory = cache_directory
         self._cache_extension = cache_extension
@@ -65,23 +86,30 @@ class CachedReplaySet(ReplaySet):
         self._boxcar_frames_arguments = kwargs.get("boxcar_frames_arguments", {})
         if not os.path.exists(self._cache_directory):
             os.makedirs(self._cache_directory)
-
+        # Checked before the default stores write their layout markers.
         if ensure_bcf_arg_match:
             self._check_boxcar_frames_arguments_match()
+        self._tensor_store = tensor_store or cache_store.PickleTensorStore(
+            self._cache_directory, extension=self._cache_extension
+        )
+        self._meta_store = meta_store or cache_store.JSONDirectoryMetaStore(
+            self._cache_directory, extension=self._meta_extension
+        )
+
+        self._fallback_tensor_store = fallback_tensor_store
+        self._persist_fallback = persist_fallback
 
     def bust_cache(self, uuid):
-        paths = self._get_tensor_and_meta_path(uuid)
-        for path in paths:
-            if os.path.exists(path):
-                os.remove(path)
+        self._tensor_store.delete(uuid)
+        self._meta_store.delete(uuid)
 
     @property
     def _boxcar_frames_arguments_path(self):
         return os.path.join(self._cache_directory, ".boxcars_frames_arguments")
 
     def _check_boxcar_frames_arguments_match(self):
-        if len(os.listdir(self._cache_directory)) == 0:
-            with open(self._boxcar_frames_arguments_path, 'w') as f:
+        if cache_store.directory_is_empty(self._cache_directory):
+            with cache_store.atomic_write(self._boxcar_frames_arguments_path, 'w') as f:
                 f.write(json.dumps(self._boxcar_frames_arguments))
         elif os.path.exists(self._boxcar_frames_arguments_path):
             with open(self._boxcar_frames_arguments_path, 'r') as f:
@@ -104,69 +132,62 @@ class CachedReplaySet(ReplaySet):
     def get_replay_tensor_with_headers(self, uuid):
         return self._replay_set.get_replay_tensor_with_headers(uuid)
 
-    def _cache_path_for_replay_with_extension(self, replay_id, extension):
-        return os.path.join(self._cache_directory, f"{replay_id}.{extension}")
-
-    def _get_tensor_and_meta_path(self, uuid):
-        tensor_path = self._cache_path_for_replay_with_extension(uuid, self._cache_extension)
-        meta_path = self._cache_path_for_replay_with_extension(uuid, self._meta_extension)
-        return tensor_path, meta_path
+    def _get_fallback_tensor(self, uuid):
+        tensor = self._fallback_tensor_store.get(uuid)
+        if tensor is not None and self._persist_fallback:
+            self._tensor_store.put(uuid, tensor)
+        return tensor
 
     def _maybe_load_from_cache(self, uuid):
-        tensor_path, meta_path = self._get_tensor_and_meta_path(uuid)
-        tensor_present = os.path.exists(tensor_path)
-        meta_present = os.path.exists(meta_path)
-        if tensor_present and meta_present:
-            logger.debug(f"Cache hit for {uuid}")
-            with open(tensor_path, 'rb') as f:
-                tensor = torch.load(f)
-            with open(meta_path, 'rb') as f:
-                meta = ReplayMeta.from_dict(json.loads(f.read()))
-            return tensor, meta
-        elif tensor_present != meta_present:
-            logger.debug(
-                f"{tensor_path} exists: {tensor_present} "
-                f"meta_present, {meta_path} exists: {meta_present}"
-            )
-            if not meta_present:
-                # XXX: this is not great since its assuming directory replay set
-                try:
-                    replay_filepath = self._replay_set.replay_path(uuid)
-                except Exception as e:
-                    logger.warn(f"Error trying to get only player meta {e}")
-                    return None
-                else:
-                    meta = self._backup_get_meta(uuid, replay_filepath)
-                    if meta is not None:
-                        self._json_dump_meta(meta, meta_path)
-                        return self._maybe_load_from_cache(uuid)
+        # Tensors are always written before their meta and both writes are
+        # atomic, so a meta means that the replay was fully cached unless it
+        # was cached for another variant. fsck_cache cleans up whatever
+        # an interrupted write leaves behind.
+        meta = self._meta_store.get(uuid)
+        if meta is None:
+            return None
+        tensor = self._tensor_store.get(uuid)
+        if tensor is None and self._fallback_tensor_store is not None:
+            tensor = self._get_fallback_tensor(uuid)
+        if tensor is None:
+            return None
+        logger.debug(f"Cache hit for {uuid}")
+        return tensor, meta
+
+    def rebuild_meta(self, uuid):
+        """Recompute and store the meta of uuid from its replay file, returning it."""
+        # XXX: this is not great since its assuming directory replay set
+        replay_filepath = self._replay_set.replay_path(uuid)
+        meta = self._backup_get_meta(uuid, replay_filepath)
+        if meta is not None:
+            self._meta_store.put(uuid, meta)
+        return meta
 
     def _save_to_cache(self, replay_id, replay_data, meta):
-        tensor_path, meta_path = self._get_tensor_and_meta_path(replay_id)
-        with open(tensor_path, 'wb') as f:
-            torch.save(replay_data, f)
-        self._json_dump_meta(meta, meta_path)
+        self._tensor_store.put(replay_id, replay_data)
+        self._meta_store.put(replay_id, meta)
         return replay_data, meta
 
-    def _json_dump_meta(self, meta: ReplayMeta, path):
-        with open(path, 'w') as f:
-            f.write(json.dumps(meta.to_dict()))
-
     def get_replay_meta(self, uuid) -> ReplayMeta:
-        meta_path = self._cache_path_for_replay_with_extension(
-            uuid, self._meta_extension
-        )
-        if not os.path.exists(meta_path):
+        meta = self._meta_store.get(uuid)
+        if meta is None:
             meta = self._replay_set.get_replay_meta(uuid)
             if meta is not None:
-                self._json_dump_meta(meta, meta_path)
-            return meta
-        with open(meta_path, 'rb') as f:
-            try:
-                return ReplayMeta.from_dict(json.loads(f.read()))
-            except Exception as e:
-                e = e
-                import ipdb; ipdb.set_trace()
+                self._meta_store.put(uuid, meta)
+        return meta
+
+    def get_cached_replay_metas(self, uuids=None) -> dict:
+        """Get a dictionary from uuid to meta for every cached meta, without computing any.
+
+        When no uuids are provided the whole meta store is scanned.
+        """
+        if uuids is None:
+            return dict(self._meta_store.items())
+        return self._meta_store.get_many(uuids)
+
+    def get_cached_replay_tensor(self, uuid):
+        """Get the cached replay tensor and meta of uuid, or None if it is not cached."""
+        return self._maybe_load_from_cache(uuid)
 
     def get_replay_tensor(self, uuid) -> (torch.Tensor, ReplayMeta):
         """Get the replay tensor and player meta associated with the provided uuid."""
@@ -174,9 +195,25 @@ class CachedReplaySet(ReplaySet):
             uuid, *self._replay_set.get_replay_tensor(uuid)
         )
 
+    def get_replay_lengths(self, uuids) -> dict:
+        """Get the cached frame count of each of uuids that has a cached tensor."""
+        lengths = self._tensor_store.get_lengths(uuids)
+        if self._fallback_tensor_store is not None:
+            lengths.update(self._fallback_tensor_store.get_lengths(
+                [uuid for uuid in uuids if uuid not in lengths]
+            ))
+        return lengths
+
+    def storage_order(self, uuids) -> list:
+        return self._tensor_store.storage_order(uuids)
+
     def is_cached(self, uuid) -> bool:
-        tensor_path, meta_path = self._get_tensor_and_meta_path(uuid)
-        return os.path.exists(tensor_path) and os.path.exists(meta_path)
+        return (
+            self._tensor_store.contains(uuid) or (
+                self._fallback_tensor_store is not None
+                and self._fallback_tensor_store.contains(uuid)
+            )
+        ) and self._meta_store.contains(uuid)
 
     def __getattr__(self, name):
         """Defer to self._replay_set."""
@@ -191,14 +228,16 @@ class DirectoryReplaySet(ReplaySet):
 
     def __init__(
             self, filepath, replay_extension="replay", boxcar_frames_arguments=None,
-            tensor_transformer=lambda meta, t: t, skip_uuid_fn=lambda _uuid: False
+            tensor_transformer=lambda meta, t: t, skip_uuid_fn=lambda _uuid: False,
+            index_directory=None
     ):
         self._filepath = filepath
         self._replay_extension = replay_extension
         self._replay_id_paths = [
             (path, uuid)
             for path, uuid in util.get_replay_uuids_in_directory(
-                self._filepath, replay_extension=self._replay_extension
+                self._filepath, replay_extension=self._replay_extension,
+                index_directory=index_directory
             )
             if not skip_uuid_fn(uuid)
         ]
@@ -239,10 +278,111 @@ class DirectoryReplaySet(ReplaySet):
         return self.get_replay_tensor(self._replay_id_paths[index][0])
 
 
+# Failures that say nothing about the replay itself, so it may well load on a later run.
+transient_load_errors = (OSError, MemoryError)
+
+
 VariableLengthSequenceTensor = collections.namedtuple("VariableLengthSequenceTensor", "tensor")
 
 
-TrainingData = collections.namedtuple("TrainingData", "X y mask uuids meta")
+TrainingData = collections.namedtuple(
+    "TrainingData", "X y mask uuids meta lengths", defaults=(None,)
+)
+
+
+class ResidentTensorCache:
+    """Keep replay tensors in RAM so that repeated epochs do no disk I/O or unpickling.
+
+    :py:meth:`preload` packs as many replays as fit in `preload_bytes` into
+    a single shared memory arena. Entries are views into that arena, so
+    DataLoader workers read them without copying and only one shared memory
+    segment is created however many replays there are. Replays that do not
+    fit go through a per-process LRU capped at `lru_bytes`.
+    """
+
+    def __init__(self, preload_bytes=None, lru_bytes=0):
+        self._preload_bytes = preload_bytes
+        self._lru_bytes = lru_bytes
+        self._arena = None
+        self._resident = {}
+        self._lru = collections.OrderedDict()
+        self._lru_used_bytes = 0
+
+    @staticmethod
+    def _tensor_bytes(tensor):
+        return tensor.element_size() * tensor.nelement()
+
+    def _plan(self, uuids, lengths, frame_bytes):
+        planned, total_frames = [], 0
+        for uuid in uuids:
+            length = lengths.get(uuid)
+            if length is None:
+                continue
+            if self._preload_bytes is not None and (
+                    (total_frames + length) * frame_bytes > self._preload_bytes
+            ):
+                break
+            planned.append(uuid)
+            total_frames += length
+        return planned, total_frames
+
+    def preload(self, uuids, get_replay_tensor, lengths):
+        """Load uuids into the arena, using lengths to size it before anything is copied."""
+        uuids = [uuid for uuid in uuids if uuid in lengths]
+        if not uuids:
+            return
+        first_tensor, _ = get_replay_tensor(uuids[0])
+        frame_bytes = self._tensor_bytes(first_tensor[:1])
+        planned, total_frames = self._plan(uuids, lengths, frame_bytes)
+        self._arena = torch.empty(
+            (total_frames,) + tuple(first_tensor.shape[1:]), dtype=first_tensor.dtype
+        ).share_memory_()
+
+        offset = 0
+        for uuid in planned:
+            try:
+                tensor, meta = get_replay_tensor(uuid)
+            except Exception as e:
+                logger.warn(f"Not preloading {uuid} because of {e}")
+                continue
+            if tensor.shape[0] != lengths[uuid] or tensor.shape[1:] != self._arena.shape[1:]:
+                logger.warn(f"Not preloading {uuid} because its shape {tensor.shape} is unexpected")
+                continue
+            self._arena[offset:offset + lengths[uuid]].copy_(tensor)
+            self._resident[uuid] = (offset, lengths[uuid], meta)
+            offset += lengths[uuid]
+
+        logger.info(
+            f"Preloaded {len(self._resident)} replays "
+            f"({offset * frame_bytes / 1024 ** 3:.2f} GiB)"
+        )
+
+    def get(self, uuid):
+        try:
+            offset, length, meta = self._resident[uuid]
+        except KeyError:
+            pass
+        else:
+            return self._arena[offset:offset + length], meta
+
+        try:
+            self._lru.move_to_end(uuid)
+        except KeyError:
+            return None
+        return self._lru[uuid]
+
+    def put(self, uuid, tensor, meta):
+        tensor_bytes = self._tensor_bytes(tensor)
+        if uuid in self._resident or tensor_bytes > self._lru_bytes:
+            return
+        while self._lru_used_bytes + tensor_bytes > self._lru_bytes:
+            _, (evicted, _) = self._lru.popitem(last=False)
+            self._lru_used_bytes -= self._tensor_bytes(evicted)
+        self._lru[uuid] = (tensor, meta)
+        self._lru_used_bytes += tensor_bytes
+
+    def __contains__(self, uuid):
+        return uuid in self._resident or uuid in self._lru
 
 
 class ReplayDataset(Dataset):
@@ -252,22 +392,54 @@ class ReplayDataset(Dataset):
             self, replay_set: ReplaySet, lookup_label, playlist,
             header_info, label_scaler=util.HorribleHackScaler,
             preload=False, zero_is_missing=True, skip_exceptions=True,
-            skip_uuid_fn=lambda _uuid: False
+            skip_uuid_fn=lambda _uuid: False, preload_bytes=None, lru_bytes=0,
+            label_table=None, exclude_uuids=frozenset(), on_load_error=None
     ):
-        """Initialize the data loader."""
+        """Initialize the data loader.
+
+        Uuids in `exclude_uuids`, such as replays that are already known to
+        fail to load, are left out of the index entirely. `on_load_error` is
+        called with the uuid and exception whenever a replay fails to parse or
+        decode so that the failure can be recorded and excluded on the next
+        run. Replays that hit one of :py:data:`transient_load_errors` are only
+        skipped for the rest of this run.
+        """
         self._replay_set = replay_set
-        self._replay_ids = list(replay_set.get_replay_uuids())
+        self._replay_ids = [
+            uuid for uuid in replay_set.get_replay_uuids() if uuid not in exclude_uuids
+        ]
+        self._on_load_error = on_load_error
+        self._failed_uuids = set()
         self._playlist = playlist
         self._header_info = header_info
         self._lookup_label = lookup_label
         self._label_cache = {}
+        self._label_table = label_table
         self._label_scaler = label_scaler
         self._zero_is_missing = zero_is_missing
         self._skip_exceptions = skip_exceptions
         self._skip_uuid_fn = skip_uuid_fn
+        self._tensor_cache = ResidentTensorCache(
+            preload_bytes=preload_bytes, lru_bytes=lru_bytes
+        )
         if preload:
-            for i in range(len(self._replay_ids)):
-                self[i]
+            self._preload()
+
+    def _preload(self):
+        uuids = [uuid for uuid in self._replay_ids if not self._skip_uuid_fn(uuid)]
+        self._tensor_cache.preload(
+            uuids, self._replay_set.get_replay_tensor,
+            self._replay_set.get_replay_lengths(uuids)
+        )
+        # Labels are computed before any worker forks so that every worker
+        # inherits them instead of rebuilding its own label cache.
+        for uuid in uuids:
+            cached = self._tensor_cache.get(uuid)
+            if cached is not None:
+                try:
+                    self._get_replay_labels(uuid, cached[1])
+                except Exception as e:
+                    logger.warn(f"Could not compute labels for {uuid}: {e}")
 
     @property
     def features_per_frame(self):
@@ -286,9 +458,16 @@ class ReplayDataset(Dataset):
         except KeyError:
             pass
 
+        players = list(meta.player_order)
+        raw_labels = None
+        if self._label_table is not None:
+            raw_labels = self._label_table.get(uuid, players)
+        if raw_labels is None or len(raw_labels) != len(players):
+            raw_labels = [None] * len(players)
+        # The table is built from cached players only, so missing labels are looked up.
         raw_labels = [
-            self._lookup_label(player, meta.datetime)
-            for player in meta.player_order
+            self._lookup_label(player, meta.datetime) if label is None else label
+            for player, label in zip(players, raw_labels)
         ]
 
         if len(raw_labels) != self.label_count:
@@ -309,12 +488,28 @@ class ReplayDataset(Dataset):
         self._label_cache[uuid] = result
         return result
 
+    def get_replay_lengths(self, default_length):
+        """Get the frame count of the replay at each index without loading any tensors.
+
+        Replays whose length is not known yet are given `default_length`.
+        """
+        lengths = self._replay_set.get_replay_lengths(self._replay_ids)
+        return [lengths.get(uuid, default_length) for uuid in self._replay_ids]
+
     def bust_label_cache(self, uuid=None):
         if uuid is not None:
             del self._label_cache[uuid]
         else:
             self._label_cache = {}
 
+    @property
+    def replay_ids(self):
+        return self._replay_ids
+
+    def storage_order(self):
+        """Get the replay ids of this dataset in the order in which they are stored."""
+        return self._replay_set.storage_order(self._replay_ids)
+
     def __len__(self):
         """Simply return the length of the replay ids calculated in init."""
         return len(self._replay_ids)
@@ -330,40 +525,210 @@ class ReplayDataset(Dataset):
         if index < 0 or index > len(self._replay_ids):
             raise KeyError
 
-        uuid = self._replay_ids[index]
+        training_data = self.get_by_uuid(self._replay_ids[index])
+        return self.random_game() if training_data is None else training_data
 
+    def get_by_uuid(self, uuid):
+        """Get the training data of uuid, or None if it is skipped or fails to load."""
         if self._skip_uuid_fn(uuid):
             logger.warn(f"Skipping {uuid} because of skip_uuid_fn")
-            return self.random_game()
+            return None
+
+        if uuid in self._failed_uuids:
+            return None
 
         try:
-            replay_tensor, meta = self._replay_set.get_replay_tensor(uuid)
+            replay_tensor, meta = self._get_replay_tensor(uuid)
         except Exception as e:
-            if self._skip_exceptions:
-                logger.warn(f"Hit exception {e} on {uuid}")
-                return self.random_game()
-            else:
+            if not self._skip_exceptions:
                 raise e
+            if isinstance(e, transient_load_errors):
+                logger.warn(f"Skipping {uuid} for this run because of {type(e).__name__}: {e}")
+                self._failed_uuids.add(uuid)
+            else:
+                logger.warn(f"Hit exception {e} on {uuid}")
+                self._record_load_error(uuid, e)
+            return None
 
         labels, mask = self._get_replay_labels(uuid, meta)
 
         return TrainingData(
-            VariableLengthSequenceTensor(replay_tensor), labels, mask, uuid, meta
+            VariableLengthSequenceTensor(replay_tensor), labels, mask, uuid, meta,
+            replay_tensor.shape[0]
         )
 
+    def _record_load_error(self, uuid, exception):
+        self._failed_uuids.add(uuid)
+        if self._on_load_error is not None:
+            try:
+                self._on_load_error(uuid, exception)
+            except Exception as e:
+                logger.warn(f"Could not record the load error of {uuid}: {e}")
+
+    def _get_replay_tensor(self, uuid):
+        cached = self._tensor_cache.get(uuid)
+        if cached is not None:
+            return cached
+        replay_tensor, meta = self._replay_set.get_replay_tensor(uuid)
+        self._tensor_cache.put(uuid, replay_tensor, meta)
+        return replay_tensor, meta
+
     def iter_with_uuid(self):
         for i in range(len(self._replay_ids)):
             yield self.get_with_uuid(i)
 
 
+class ReplayStreamDataset(IterableDataset):
+    """Stream a :py:class:`ReplayDataset` in storage order, split across ranks and workers.
+
+    The replays are put in storage order and cut into blocks of
+    `block_size` consecutive replays. Every epoch the order of the blocks is
+    shuffled with a seed derived from `seed` and the epoch, and the blocks are
+    dealt round robin to each (rank, worker) pair, so every replay is read
+    exactly once per epoch across all readers. Each reader reads its blocks
+    sequentially and draws from a shuffle buffer of `shuffle_buffer_size`
+    items to decorrelate neighbouring samples.
+
+    `rank` and `world_size` default to those of the initialized
+    torch.distributed process group, or to the `RANK` and `WORLD_SIZE`
+    environment variables.
+    """
+
+    def __init__(
+            self, dataset: ReplayDataset, shuffle_buffer_size=1000, block_size=64,
+            seed=0, rank=None, world_size=None
+    ):
+        self._dataset = dataset
+        self._shuffle_buffer_size = shuffle_buffer_size
+        self._block_size = block_size
+        self._seed = seed
+        self._epoch = 0
+        default_rank, default_world_size = self._distributed_defaults()
+        self._rank = default_rank if rank is None else rank
+        self._world_size = default_world_size if world_size is None else world_size
+        self._ordered_uuids = dataset.storage_order()
+
+    @staticmethod
+    def _distributed_defaults():
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            return torch.distributed.get_rank(), torch.distributed.get_world_size()
+        return int(os.environ.get("RANK", 0)), int(os.environ.get("WORLD_SIZE", 1))
+
+    def set_epoch(self, epoch):
+        """Set the epoch that determines the order of the next iteration, like DistributedSampler."""
+        self._epoch = epoch
+
+    def _reader(self):
+        worker_info = torch.utils.data.get_worker_info()
+        worker_id, num_workers = (
+            (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+        )
+        return self._rank * num_workers + worker_id, self._world_size * num_workers
+
+    def _epoch_generator(self):
+        generator = torch.Generator()
+        generator.manual_seed(self._seed * 1000003 + self._epoch)
+        return generator
+
+    def reader_uuids(self, reader_index, reader_count):
+        """Get the uuids that the given reader reads this epoch, in the order they are read."""
+        blocks = [
+            self._ordered_uuids[start:start + self._block_size]
+            for start in range(0, len(self._ordered_uuids), self._block_size)
+        ]
+        block_order = torch.randperm(len(blocks), generator=self._epoch_generator()).tolist()
+        return [
+            uuid
+            for block_index in block_order[reader_index::reader_count]
+            for uuid in blocks[block_index]
+        ]
+
+    def _shuffled(self, items, reader_index):
+        rng = random.Random(f"{self._seed}:{self._epoch}:{reader_index}")
+        buffer = []
+        for item in items:
+            if len(buffer) < self._shuffle_buffer_size:
+                buffer.append(item)
+                continue
+            index = rng.randrange(len(buffer))
+            yield buffer[index]
+            buffer[index] = item
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def __iter__(self):
+        reader_index, reader_count = self._reader()
+        training_data = (
+            self._dataset.get_by_uuid(uuid)
+            for uuid in self.reader_uuids(reader_index, reader_count)
+        )
+        for item in self._shuffled(training_data, reader_index):
+            if item is not None:
+                yield item
+
+    def __len__(self):
+        """Estimate the number of replays this rank reads in an epoch."""
+        block_count = -(-len(self._ordered_uuids) // self._block_size)
+        rank_blocks = len(range(self._rank, block_count, self._world_size))
+        return min(rank_blocks * self._block_size, len(self._ordered_uuids))
+
+
+def _transform_padded_batch(batch_transform, training_data):
+    X = batch_transform(training_data.X)
+    if training_data.lengths is not None:
+        # The transform may have moved the padding away from zero.
+        padding = (
+            torch.arange(X.shape[1]).unsqueeze(0) >= training_data.lengths.unsqueeze(1)
+        )
+        X.masked_fill_(padding.unsqueeze(-1), 0.0)
+    return X
+
+
+DEFAULT_TRUNCATE_SEQUENCES_TO = 4000
+
+
 def batched_packed_loader(dataset, *args, **kwargs) -> torch.utils.data.DataLoader:
+    """Build a DataLoader of :py:class:`TrainingData` batches from dataset.
+
+    With `pad_sequences=False` the X of each batch is a list of the
+    truncated replay tensors instead of one padded tensor, for consumers
+    like :py:class:`rlrml.prefetch.BatchPrefetcher` that pad into buffers of
+    their own.
+    """
     kwargs.setdefault("pin_memory", False)
     kwargs.setdefault("batch_size", 64)
     kwargs.setdefault("shuffle", True)
 
-    truncate_to = kwargs.pop("truncate_sequences_to", 4000)
+    truncate_to = kwargs.pop("truncate_sequences_to", DEFAULT_TRUNCATE_SEQUENCES_TO)
+    bucket_by_length = kwargs.pop("bucket_by_length", False)
+    bucket_size_multiplier = kwargs.pop("bucket_size_multiplier", 50)
+    batch_transform = kwargs.pop("batch_transform", None)
+    pad_sequences = kwargs.pop("pad_sequences", True)
+
+    if batch_transform is not None and not pad_sequences:
+        raise ValueError("batch_transform can only be applied to padded batches")
+
+    if isinstance(dataset, IterableDataset):
+        # Streaming datasets shuffle themselves and can not be used with samplers.
+        kwargs.pop("shuffle")
+        if bucket_by_length:
+            raise ValueError("bucket_by_length can not be used with a streaming dataset")
+
+    if bucket_by_length:
+        lengths = [
+            min(length, truncate_to)
+            for length in dataset.get_replay_lengths(default_length=truncate_to)
+        ]
+        kwargs["batch_sampler"] = sampler.LengthBucketBatchSampler(
+            lengths, kwargs.pop("batch_size"),
+            bucket_size_multiplier=bucket_size_multiplier,
+            drop_last=kwargs.pop("drop_last", False),
+        )
+        kwargs.pop("shuffle")
 
     def collate_variable_length_sequence_tensor(values, collate_fn_map=None):
+        if not pad_sequences:
+            return [value.tensor[:truncate_to] for value in values]
         return torch.nn.utils.rnn.pad_sequence(
             (value.tensor[:truncate_to] for value in values), batch_first=True
         )
@@ -379,6 +744,10 @@ def batched_packed_loader(dataset, *args, **kwargs) -> torch.utils.data.DataLoad
         value = torch.utils.data._utils.collate.collate(
             batch, collate_fn_map=rlrml_collate_fn_map
         )
+        if isinstance(value, TrainingData) and value.lengths is not None:
+            value = value._replace(lengths=value.lengths.clamp(max=truncate_to))
+        if isinstance(value, TrainingData) and batch_transform is not None:
+            value = value._replace(X=_transform_padded_batch(batch_transform, value))
         return value
 
     kwargs.setdefault("collate_fn", custom_collate)
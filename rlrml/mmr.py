@@ -1,4 +1,5 @@
 """Utilities for filtering games based on their metadata."""
+import collections
 import enum
 import datetime
 import logging
@@ -166,6 +167,80 @@ def get_season_for_date(date, season_dates=SEASON_DATES, strict=False):
     return season_number
 
 
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def to_epoch_day(date: datetime.date) -> int:
+    """Get the number of days from the unix epoch to date."""
+    return date.toordinal() - EPOCH_ORDINAL
+
+
+def from_epoch_day(day) -> datetime.date:
+    return datetime.date.fromordinal(int(day) + EPOCH_ORDINAL)
+
+
+MMRHistory = collections.namedtuple("MMRHistory", "days ratings")
+MMRHistory.__doc__ = """Parallel arrays of the epoch day (int32) and rating (float32) of each point.
+
+Points are ordered by the time at which they were collected.
+"""
+
+
+def _as_naive_utc(date: datetime.datetime) -> datetime.datetime:
+    if date.tzinfo is None:
+        return date
+    return date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def mmr_history_arrays(tracker_mmr_history) -> MMRHistory:
+    """Convert the (iso date string, rating) pairs of tracker network data to an MMRHistory."""
+    # Histories can mix dates with and without offsets, which can not be compared.
+    parsed = sorted(
+        ((_as_naive_utc(datetime.datetime.fromisoformat(date_string)), rating)
+         for date_string, rating in tracker_mmr_history),
+        key=lambda v: v[0]
+    )
+    return MMRHistory(
+        np.array([to_epoch_day(date.date()) for date, _ in parsed], dtype=np.int32),
+        np.array([rating for _, rating in parsed], dtype=np.float32),
+    )
+
+
+def split_mmr_history_arrays(history: MMRHistory, season_dates=SEASON_DATES):
+    """Split an :py:class:`MMRHistory` into per season segments.
+
+    This is the array version of :py:func:`split_mmr_history_into_seasons`.
+    A point belongs to the first season that ends on or after its day. It is
+    labeled with that season's number when it is also on or after the
+    season's start and with the number minus .5 when it falls before it.
+    Points after the end of the last season are labeled with its number plus .5.
+    Returns (label, MMRHistory) pairs for the labels that have points.
+    """
+    numbers = np.array([number for number, _ in season_dates], dtype=np.float64)
+    starts = np.array([to_epoch_day(start) for _, (start, _) in season_dates])
+    ends = np.array([to_epoch_day(end) for _, (_, end) in season_dates])
+    season_index = np.searchsorted(ends, history.days, side='left')
+    in_a_season = season_index < len(ends)
+    clipped = np.minimum(season_index, len(ends) - 1)
+    labels = np.where(
+        in_a_season,
+        numbers[clipped] - np.where(history.days >= starts[clipped], 0.0, .5),
+        numbers[-1] + .5
+    )
+    boundaries = np.flatnonzero(np.diff(labels)) + 1
+    segments = []
+    for start, end in zip(
+            np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(labels)]])
+    ):
+        if end > start:
+            label = labels[start].item()
+            segments.append((
+                int(label) if label.is_integer() else label,
+                MMRHistory(history.days[start:end], history.ratings[start:end])
+            ))
+    return segments
+
+
 def get_game_date(game_data):
     """Get a python date corresponding to the date where the game was played."""
     try:
@@ -270,17 +345,20 @@ class _MMRHistorySplitter:
 
 
 def split_mmr_history_into_seasons(mmr_history, season_dates=SEASON_DATES):
-    """Split the given tracker network MMR history into per season history."""
+    """Split the given tracker network MMR history into per season history.
+
+    The segments hold (datetime, mmr) pairs, as the plots need them. Scoring
+    uses :py:func:`split_mmr_history_arrays` instead.
+    """
     return _MMRHistorySplitter.from_tracker_data(
         mmr_history, season_dates=season_dates
     ).get_history()
 
 
 def _calculate_basic_season_statistics(
-        season_data, keep_poly=True, approx_increasing_allowance=.15,
+        season_data: MMRHistory, keep_poly=True, approx_increasing_allowance=.15,
 ):
-    mmrs = [mmr for _, mmr in season_data]
-    dates = [d for d, _ in season_data]
+    mmrs = season_data.ratings.astype(np.float64).tolist()
 
     values = {}
     values['max'] = max(mmrs)
@@ -289,8 +367,7 @@ def _calculate_basic_season_statistics(
     values['end'] = mmrs[-1]
     values['mean'] = np.mean(mmrs)
 
-    first_date = dates[0]
-    day_deltas = [(date - first_date).days for date in dates]
+    day_deltas = (season_data.days - season_data.days[0]).tolist()
 
     values['point_count'] = len(mmrs)
 
@@ -336,7 +413,10 @@ def _calculate_basic_season_statistics(
 
 
 def calculate_all_season_statistics(mmr_history_by_season, keep_poly=True):
-    """Calculate statistics for each season and some global statistics from seasonal mmr history."""
+    """Calculate statistics for each season and some global statistics from seasonal mmr history.
+
+    mmr_history_by_season is the output of :py:func:`split_mmr_history_arrays`.
+    """
     season_statistics = [
         (int(season_number), _calculate_basic_season_statistics(
             season_data, keep_poly=keep_poly
@@ -380,8 +460,8 @@ class SeasonBasedPolyFitMMRCalculator:
         season_dates = kwargs.setdefault(
             'season_dates', tighten_season_dates(SEASON_DATES)
         )
-        mmr_history_by_season = split_mmr_history_into_seasons(
-            mmr_history, season_dates=season_dates
+        mmr_history_by_season = split_mmr_history_arrays(
+            mmr_history_arrays(mmr_history), season_dates=season_dates
         )
         return cls(mmr_history_by_season, **kwargs)
 
@@ -390,7 +470,7 @@ class SeasonBasedPolyFitMMRCalculator:
             dynamic_max_poly_max_gap=lambda _: 125, min_max_proximity_threshold=75,
             stats=None
     ):
-        """Init with the relevant mmr data and calculate statistics."""
+        """Init with the output of :py:func:`split_mmr_history_arrays` and calculate statistics."""
         self._season_dates = season_dates
         self._mmr_history_by_season = mmr_history_by_season
         self._mmr_history_dict = dict(self._mmr_history_by_season)
@@ -414,7 +494,8 @@ class SeasonBasedPolyFitMMRCalculator:
         # if game_season_stats['point_count'] < self._season_dp_threshold:
         #     return np.mean([game_season_stats['max'], game_season_stats['min']])
 
-        poly_game_day = (game_date - self._mmr_history_dict[season_number][0][0].date()).days
+        game_day = to_epoch_day(game_date)
+        poly_game_day = game_day - int(self._mmr_history_dict[season_number].days[0])
 
         if 'poly' not in game_season_stats:
             return
@@ -483,10 +564,10 @@ class SeasonBasedPolyFitMMRCalculator:
         if estimate < game_season_stats['min']:
             return game_season_stats['min']
 
-        if self._mmr_history_dict[season_number]:
-            last_date, last_mmr = self._mmr_history_dict[season_number][-1]
-            if game_date > last_date.date():
-                return last_mmr
+        season_history = self._mmr_history_dict[season_number]
+        if len(season_history.days):
+            if game_day > season_history.days[-1]:
+                return float(season_history.ratings[-1])
 
         return estimate
 
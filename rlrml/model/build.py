@@ -1,4 +1,5 @@
 import itertools
+import torch
 
 from torch import nn
 
@@ -8,18 +9,49 @@ from .. import util
 from . import cnn
 
 
+class FeatureNormalization(nn.Module):
+    """Standardize each input column with fixed statistics.
+
+    The mean and standard deviation are buffers rather than parameters, so
+    they are saved with the model but never trained. Columns that are
+    constant are only centered.
+    """
+
+    def __init__(self, mean, std, minimum_std=1e-6):
+        super().__init__()
+        std = torch.as_tensor(std, dtype=torch.float32)
+        self.register_buffer("mean", torch.as_tensor(mean, dtype=torch.float32))
+        self.register_buffer("std", torch.where(std < minimum_std, torch.ones_like(std), std))
+
+    @classmethod
+    def from_statistics(cls, statistics):
+        return cls(statistics.mean, statistics.std)
+
+    def forward(self, X):
+        return (X - self.mean) / self.std
+
+
 class ReplayModel(nn.Module):
     def __init__(
             self, header_info, playlist: Playlist, channel_counts=None,
             dropout=.05, lstm_width=256, lstm_depth=4, use_convolutional=False,
-            evaluation_start=800, evaluation_split_width=100, **kwargs
+            evaluation_start=800, evaluation_split_width=100, packed_sequences=False,
+            feature_statistics=None, **kwargs
     ):
         super().__init__()
+        if packed_sequences and use_convolutional:
+            raise ValueError("Packed sequences can not be used with the convolutional layers.")
         self._input_width = util.feature_count_for(playlist, header_info)
+        if feature_statistics is not None:
+            self._normalization = FeatureNormalization.from_statistics(feature_statistics)
+            self.add_module("normalization", self._normalization)
+        else:
+            self._normalization = None
         self._label_count = playlist.player_count
         self._lstm_width = lstm_width
         self._evaluation_split_width = evaluation_split_width
         self._evaluation_start = evaluation_start
+        self._packed_sequences = packed_sequences
 
         next_layer_size = self._input_width
         if use_convolutional:
@@ -40,13 +72,62 @@ class ReplayModel(nn.Module):
         self.add_module("lstm", self._lstm)
         self.add_module("linear", self._linear)
 
-    def get_lstm_out(self, X):
+    def normalize(self, X, lengths=None):
+        if self._normalization is None:
+            return X
+        X = self._normalization(X)
+        if lengths is not None:
+            # Keep the padding at zero, as it would be without normalization.
+            padding = (
+                torch.arange(X.shape[1], device=X.device).unsqueeze(0)
+                >= lengths.to(X.device).unsqueeze(1)
+            )
+            X = X.masked_fill(padding.unsqueeze(-1), 0.0)
+        return X
+
+    def get_lstm_out(self, X, lengths=None):
+        X = self.normalize(X, lengths)
         cnn_out = self._cnn(X)
-        lstm_out, _ = self._lstm(cnn_out)
+        if lengths is None or not self._packed_sequences:
+            lstm_out, _ = self._lstm(cnn_out)
+            return lstm_out
+
+        packed = nn.utils.rnn.pack_padded_sequence(
+            cnn_out, lengths.cpu(), batch_first=True, enforce_sorted=False
+        )
+        packed_out, _ = self._lstm(packed)
+        lstm_out, _ = nn.utils.rnn.pad_packed_sequence(
+            packed_out, batch_first=True, total_length=cnn_out.shape[1]
+        )
         return lstm_out
 
-    def forward(self, X):
-        lstm_out = self.get_lstm_out(X)
+    def _evaluation_positions(self, lengths, max_length):
+        """Get the output positions to evaluate for each sample, relative to its true length.
+
+        Samples that are no longer than evaluation_start are evaluated at their
+        final frame. Returns the positions along with a mask of which are valid.
+        """
+        if self._evaluation_split_width is None:
+            positions = torch.zeros(1, dtype=torch.int64, device=lengths.device)
+        else:
+            positions = torch.arange(
+                self._evaluation_start, max(max_length, self._evaluation_start + 1),
+                self._evaluation_split_width, device=lengths.device
+            )
+        positions = positions.unsqueeze(0).expand(len(lengths), -1).clone()
+        valid = positions < lengths.unsqueeze(1)
+        too_short = ~valid.any(dim=1)
+        if self._evaluation_split_width is None:
+            too_short[:] = True
+        positions[too_short, 0] = lengths[too_short] - 1
+        valid[too_short, 0] = True
+        return torch.where(valid, positions, 0), valid
+
+    def forward(self, X, lengths=None):
+        if lengths is not None and self._packed_sequences:
+            return self._forward_packed(X, lengths)
+
+        lstm_out = self.get_lstm_out(X, lengths)
 
         split_start = (
             lstm_out.shape[1] - 1
@@ -66,6 +147,15 @@ class ReplayModel(nn.Module):
 
         return linear_out
 
+    def _forward_packed(self, X, lengths):
+        lstm_out = self.get_lstm_out(X, lengths)
+        lengths = lengths.to(lstm_out.device)
+        positions, valid = self._evaluation_positions(lengths, lstm_out.shape[1])
+        batch_indices = torch.arange(len(lengths), device=lstm_out.device).unsqueeze(1)
+        linear_outs = self._linear(lstm_out[batch_indices, positions])
+        weights = valid.unsqueeze(-1).to(linear_outs.dtype)
+        return (linear_outs * weights).sum(dim=1) / weights.sum(dim=1)
+
     def prediction_history(self, X):
         lstm_out = self.get_lstm_out(X)
 
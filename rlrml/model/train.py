@@ -1,6 +1,7 @@
 import torch
 import logging
 import itertools
+import time
 
 from .. import load
 from ..loss import loss_takes_mask
@@ -21,7 +22,10 @@ def gpu_memory_remaining():
 
 
 def log_batch_finish(_trainer, epoch, losses, loss, y_pred, y, **kwargs):
-    logger.info(f"Epoch {epoch} finished with {loss:,}, gpu_free: {gpu_memory_remaining()}")
+    logger.info(
+        f"Epoch {epoch} finished with {loss:,}, gpu_free: {gpu_memory_remaining()}, "
+        f"data wait: {kwargs.get('data_wait_seconds', 0.0):.1f}s"
+    )
 
 
 class ReplayModelManager:
@@ -30,7 +34,10 @@ class ReplayModelManager:
     def from_dataset(cls, dataset, model=None, *args, **kwargs):
         model = model or build.ReplayModel(dataset.header_info, dataset.playlist)
         batch_size = kwargs.pop('batch_size')
-        data_loader = load.batched_packed_loader(dataset, batch_size=batch_size)
+        bucket_by_length = kwargs.pop('bucket_by_length', False)
+        data_loader = load.batched_packed_loader(
+            dataset, batch_size=batch_size, bucket_by_length=bucket_by_length
+        )
         return cls(model, data_loader, *args, **kwargs)
 
     def __init__(
@@ -45,16 +52,24 @@ class ReplayModelManager:
         self._optimizer = torch.optim.Adam(self._model.parameters(), lr=lr)
         self._accumulation_steps = accumulation_steps
         self._loss_takes_mask = loss_takes_mask(self._loss_function)
+        # Time the training loop has spent waiting on the data loader.
+        self.data_wait_seconds = 0.0
 
     def train(self, epochs=None, on_epoch_finish=log_batch_finish):
         batch_iterator = iter(self._data_loader)
         epoch_iterator = itertools.count() if epochs is None else range(epochs)
+        passes = 0
         for epoch in epoch_iterator:
+            wait_start = time.monotonic()
             try:
                 training_data = next(batch_iterator)
             except StopIteration:
+                passes += 1
+                if hasattr(self._data_loader.dataset, 'set_epoch'):
+                    self._data_loader.dataset.set_epoch(passes)
                 batch_iterator = iter(self._data_loader)
                 training_data = next(batch_iterator)
+            self.data_wait_seconds += time.monotonic() - wait_start
 
             y_pred, loss = self.get_loss(training_data)
             mean_loss = loss.sum() / training_data.mask.sum()
@@ -68,6 +83,7 @@ class ReplayModelManager:
                     y_pred=y_pred.detach(), y=training_data.y.detach(),
                     uuids=training_data.uuids, y_loss=loss.detach(),
                     meta=training_data.meta, mask=training_data.mask.detach(),
+                    data_wait_seconds=self.data_wait_seconds,
                 )
                 if should_continue is not None and not should_continue:
                     return
@@ -78,7 +94,8 @@ class ReplayModelManager:
             training_data.y.to(self._device),
             training_data.mask.to(self._device)
         )
-        y_pred = self._model(X)
+        lengths = getattr(training_data, 'lengths', None)
+        y_pred = self._model(X) if lengths is None else self._model(X, lengths=lengths)
         loss = (
             self._loss_function(y_pred, y, mask=mask)
             if self._loss_takes_mask
@@ -1,10 +1,24 @@
 """Caches for game and player metadata implemented with plyvel."""
 import abc
+import aiohttp
+import asyncio
+import collections
+import hashlib
+import itertools
 import json
 import lmdb
 import logging
+import msgpack
+import numpy as np
+import os
 import plyvel
+import struct
+import threading
+import time
+import zlib
+import zstandard
 
+from . import mmr
 from . import tracker_network
 from .metadata import PlatformPlayer
 
@@ -24,6 +38,212 @@ def _use_tracker_url_suffix_as_key(player):
         return key_string.encode('utf-8')
 
 
+class ValueCodec(abc.ABC):
+    """Converts player data to and from the bytes stored in a :py:class:`PlayerCache`."""
+
+    name = None
+
+    @abc.abstractmethod
+    def encode(self, value) -> bytes:
+        pass
+
+    @abc.abstractmethod
+    def decode(self, value_bytes: bytes):
+        pass
+
+    @abc.abstractmethod
+    def can_decode(self, value_bytes: bytes) -> bool:
+        """Indicate whether value_bytes was written by this codec."""
+        pass
+
+
+class JSONCodec(ValueCodec):
+    """The original format of player cache values, utf-8 encoded json."""
+
+    name = "json"
+
+    def encode(self, value):
+        return json.dumps(value).encode('utf-8')
+
+    def decode(self, value_bytes):
+        return json.loads(value_bytes)
+
+    def can_decode(self, value_bytes):
+        # Binary codecs mark their values with a leading null byte.
+        return bytes(value_bytes[:1]) != b"\x00"
+
+
+class MsgpackZstdCodec(ValueCodec):
+    """Zstandard compressed msgpack, marked by a prefix that no json document starts with.
+
+    Arrays are decoded as tuples rather than lists, which roughly halves the
+    cost of decoding the long mmr histories.
+    """
+
+    name = "msgpack-zstd"
+    prefix = b"\x00\x01"
+
+    def __init__(self, level=3):
+        self._level = level
+        # One shot compression with a shared compressor is thread safe.
+        self._compressor = zstandard.ZstdCompressor(level=level)
+
+    def encode(self, value):
+        return self.prefix + self._compressor.compress(msgpack.packb(value, use_bin_type=True))
+
+    def decode(self, value_bytes):
+        # Decompressors are cheap to create but must not be shared between threads.
+        return msgpack.unpackb(
+            zstandard.ZstdDecompressor().decompress(memoryview(value_bytes)[len(self.prefix):]),
+            raw=False, use_list=False, strict_map_key=False
+        )
+
+    def can_decode(self, value_bytes):
+        return bytes(value_bytes[:len(self.prefix)]) == self.prefix
+
+
+codecs = {codec.name: codec for codec in (JSONCodec(), MsgpackZstdCodec())}
+default_codec = codecs[MsgpackZstdCodec.name]
+
+
+def decode_value(value_bytes: bytes):
+    """Decode a player cache value written by any codec.
+
+    Raises a ValueError for values that no known codec wrote, rather than
+    treating the player as missing and letting their data be overwritten.
+    """
+    for codec in codecs.values():
+        if codec.can_decode(value_bytes):
+            return codec.decode(value_bytes)
+    raise ValueError(f"No codec can decode a value starting with {bytes(value_bytes[:2])!r}")
+
+
+def value_digest(value_bytes: bytes) -> bytes:
+    """A cheap fingerprint of a stored player value, used to tell whether its summary is current."""
+    return struct.pack("<II", len(value_bytes) & 0xffffffff, zlib.crc32(value_bytes))
+
+
+class PlayerSummary(collections.namedtuple(
+        "PlayerSummary",
+        "error has_manual_override manual_override wins mmr_histories data_digest"
+)):
+    """The parts of a player's data that scoring needs, in a compact fixed layout.
+
+    `mmr_histories` maps playlist names to :py:class:`mmr.MMRHistory`
+    arrays. Summaries are stored next to the player data so that scoring a
+    player decodes a few small arrays instead of the whole tracker blob and
+    never parses a date. `data_digest` is the :py:func:`value_digest` of the
+    value that was summarized, which :py:meth:`PlayerCache.build_summaries`
+    uses to find summaries that no longer match their data.
+    """
+
+    _format_version = 2
+
+    @classmethod
+    def from_player_data(cls, player_data, data_digest=None):
+        if player_data is None:
+            return None
+        return cls(
+            player_data.get(PlayerCache.error_key),
+            PlayerCache.manual_override_key in player_data,
+            player_data.get(PlayerCache.manual_override_key),
+            (player_data.get('stats') or {}).get('wins'),
+            {
+                playlist_name: mmr.mmr_history_arrays(history)
+                for playlist_name, history in (player_data.get('mmr_history') or {}).items()
+            },
+            data_digest,
+        )
+
+    def encode(self) -> bytes:
+        return msgpack.packb([
+            self._format_version, self.error, self.has_manual_override,
+            self.manual_override, self.wins,
+            {
+                playlist_name: (
+                    history.days.astype('<i4').tobytes()
+                    + history.ratings.astype('<f4').tobytes()
+                )
+                for playlist_name, history in self.mmr_histories.items()
+            },
+            self.data_digest,
+        ], use_bin_type=True)
+
+    @classmethod
+    def decode(cls, value_bytes):
+        fields = msgpack.unpackb(value_bytes, raw=False)
+        if fields[0] != cls._format_version:
+            return None
+        _, error, has_manual_override, manual_override, wins, histories, data_digest = fields
+        return cls(error, has_manual_override, manual_override, wins, {
+            playlist_name: mmr.MMRHistory(
+                np.frombuffer(arrays, dtype='<i4', count=len(arrays) // 8),
+                np.frombuffer(arrays, dtype='<f4', offset=len(arrays) // 2),
+            )
+            for playlist_name, arrays in histories.items()
+        }, data_digest)
+
+    def derived(self, key, compute):
+        """Get the value of compute() for key, computing it only once per summary.
+
+        Summaries held by the decoded player cache of a :py:class:`PlayerCache`
+        are shared by every lookup of their player, so anything expensive that
+        is derived from them, like season statistics, is computed once.
+        """
+        derived = self.__dict__.setdefault("_derived", {})
+        try:
+            return derived[key]
+        except KeyError:
+            value = derived[key] = compute()
+            return value
+
+
+class LRUCache:
+    """A bounded least recently used mapping that counts its hits and misses."""
+
+    missing = object()
+
+    def __init__(self, max_entries):
+        self._max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Get the value stored for key, or :py:attr:`missing` if there is none."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return self.missing
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self._max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
 class DatabaseBackend(abc.ABC):
     @abc.abstractmethod
     def get(self, key):
@@ -37,12 +257,46 @@ class DatabaseBackend(abc.ABC):
     def iterator(self):
         pass
 
+    def get_many(self, keys):
+        """Get the value of each of keys, None where missing, all at once if supported."""
+        return [self.get(key) for key in keys]
+
+    def put_many(self, pairs):
+        """Write every (key, value) pair, all at once if the backend supports it."""
+        for key, value in pairs:
+            self.put(key, value)
+
+    @abc.abstractmethod
+    def sibling(self, dbname):
+        """Get a backend for the database dbname in the same store as this one."""
+        pass
+
+    def put_many_with(self, pairs, sibling, sibling_pairs):
+        """Write pairs to this database and sibling_pairs to sibling, atomically if supported.
+
+        `sibling` must come from :py:meth:`sibling`.
+        """
+        self.put_many(pairs)
+        sibling.put_many(sibling_pairs)
+
+    def state_token(self):
+        """A value that changes whenever the contents of the database change.
+
+        None means that the backend can not tell.
+        """
+        return None
+
 
 class PlyvelDatabaseBackend(DatabaseBackend):
 
-    def __init__(self, filepath, dbname="player-id-"):
-        self._db = plyvel.DB(filepath, create_if_missing=True)
-        self._db = self._db.prefixed_db(dbname.encode('utf-8')) if dbname else self._db
+    def __init__(self, filepath, dbname="player-id-", root_db=None):
+        self._filepath = filepath
+        self._root_db = root_db or plyvel.DB(filepath, create_if_missing=True)
+        self._prefix = dbname.encode('utf-8') if dbname else b""
+        self._db = self._root_db.prefixed_db(self._prefix) if dbname else self._root_db
+
+    def sibling(self, dbname):
+        return type(self)(self._filepath, dbname=dbname, root_db=self._root_db)
 
     def get(self, key):
         return self._db.get(key)
@@ -53,15 +307,43 @@ class PlyvelDatabaseBackend(DatabaseBackend):
     def iterator(self, start_key=None):
         return self._db.iterator(start=start_key)
 
+    def put_many(self, pairs):
+        with self._db.write_batch() as batch:
+            for key, value in pairs:
+                batch.put(key, value)
+
+    def put_many_with(self, pairs, sibling, sibling_pairs):
+        # A batch on the root database spans the prefixes of both databases.
+        with self._root_db.write_batch(transaction=True) as batch:
+            for key, value in pairs:
+                batch.put(self._prefix + key, value)
+            for key, value in sibling_pairs:
+                batch.put(sibling._prefix + key, value)
+
+    def state_token(self):
+        # leveldb does not expose a sequence number, but every write grows the
+        # log file or rewrites table files.
+        digest = hashlib.sha1()
+        with os.scandir(self._filepath) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.name):
+                if entry.name != "LOCK" and entry.is_file():
+                    stat = entry.stat()
+                    digest.update(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        return digest.hexdigest()
+
 
 class LMDBDatabaseBackend(DatabaseBackend):
 
-    def __init__(self, filepath, dbname="player-id", **kwargs):
+    def __init__(self, filepath, dbname="player-id", env=None, **kwargs):
         kwargs.setdefault("max_dbs", 10)
         kwargs.setdefault("map_size", 2 * 1024 ** 3)
-        self._env = lmdb.open(filepath, **kwargs)
+        self._filepath = filepath
+        self._env = env or lmdb.open(filepath, **kwargs)
         self._db = self._env.open_db(dbname.encode('utf-8')) if dbname else self._env
 
+    def sibling(self, dbname):
+        return type(self)(self._filepath, dbname=dbname, env=self._env)
+
     def get(self, key):
         with self._env.begin(db=self._db) as txn:
             return txn.get(key)
@@ -70,6 +352,22 @@ class LMDBDatabaseBackend(DatabaseBackend):
         with self._env.begin(db=self._db, write=True) as txn:
             txn.put(key, value)
 
+    def get_many(self, keys):
+        with self._env.begin(db=self._db) as txn:
+            return [txn.get(key) for key in keys]
+
+    def put_many(self, pairs):
+        with self._env.begin(db=self._db, write=True) as txn:
+            for key, value in pairs:
+                txn.put(key, value)
+
+    def put_many_with(self, pairs, sibling, sibling_pairs):
+        with self._env.begin(write=True) as txn:
+            for key, value in pairs:
+                txn.put(key, value, db=self._db)
+            for key, value in sibling_pairs:
+                txn.put(key, value, db=sibling._db)
+
     def iterator(self, start_key=None):
         with self._env.begin(db=self._db) as txn:
             cursor = txn.cursor()
@@ -78,37 +376,238 @@ class LMDBDatabaseBackend(DatabaseBackend):
             for v in cursor.iternext():
                 yield v
 
+    def state_token(self):
+        return self._env.info()['last_txnid']
+
 
 class PlayerCache:
     """Encapsulates the player cache."""
 
     error_key = "__error__"
     manual_override_key = "__manual_override__"
+    summary_dbname = "player-summary"
 
     @classmethod
     def plyvel(cls, filepath, **kwargs):
-        return cls(PlyvelDatabaseBackend(filepath))
+        backend = PlyvelDatabaseBackend(filepath)
+        return cls(backend, summary_backend=backend.sibling(f"{cls.summary_dbname}-"), **kwargs)
 
     @classmethod
     def lmdb(cls, filepath, **kwargs):
-        return cls(LMDBDatabaseBackend(filepath), **kwargs)
-
-    def __init__(self, db_backend, key_fn=_use_tracker_url_suffix_as_key):
-        """Initialize the metadata cache from a replay directory."""
+        backend = LMDBDatabaseBackend(filepath)
+        return cls(backend, summary_backend=backend.sibling(cls.summary_dbname), **kwargs)
+
+    def __init__(
+            self, db_backend, key_fn=_use_tracker_url_suffix_as_key,
+            codec: ValueCodec = default_codec, summary_backend: DatabaseBackend = None,
+            summary_lru_size=20000, data_lru_size=1000, lru_check_interval=5.0,
+            clock=time.monotonic,
+    ):
+        """Initialize the metadata cache from a replay directory.
+
+        New values are written with `codec`, but values written with any
+        codec can be read. A :py:class:`PlayerSummary` of every value is kept
+        in `summary_backend` when it is provided.
+
+        The most recently read summaries and decoded player data are kept in
+        memory, up to `summary_lru_size` and `data_lru_size` players. Players
+        without data are not kept, so they are looked up again every time.
+        Writes made through this cache invalidate them, and both are cleared
+        when :py:meth:`state_token` changes, which is checked at most once
+        every `lru_check_interval` seconds, so writes made by other processes
+        are seen within that interval. Decoded data is shared between lookups
+        and must not be modified.
+        """
         self._db = db_backend
         self._key_fn = key_fn
+        self._codec = codec
+        self._summary_db = summary_backend
+        self._summary_lru = LRUCache(summary_lru_size)
+        self._data_lru = LRUCache(data_lru_size)
+        self._lru_check_interval = lru_check_interval
+        self._clock = clock
+        self._lru_checked_at = None
+        self._lru_state_token = None
+
+    def lru_stats(self):
+        """The hit and miss counts and sizes of the in memory summary and data caches."""
+        return {"summaries": self._summary_lru.stats(), "data": self._data_lru.stats()}
+
+    def clear_lru(self):
+        """Forget every summary and decoded value held in memory."""
+        self._summary_lru.clear()
+        self._data_lru.clear()
+
+    def _check_lru(self):
+        now = self._clock()
+        if (
+                self._lru_checked_at is not None and
+                now - self._lru_checked_at < self._lru_check_interval
+        ):
+            return
+        self._lru_checked_at = now
+        token = self.state_token()
+        if token is None or token != self._lru_state_token:
+            self.clear_lru()
+        self._lru_state_token = token
 
     def insert_data_for_player(self, player, data):
-        key = self._key_for_player(player)
-        if key is not None:
-            return self._db.put(key, json.dumps(data).encode('utf-8'))
+        self.put_many([(player, data)])
+
+    def put_many(self, player_data_pairs):
+        """Insert the data of each (player, data) pair and its summary in one write.
+
+        Every value and summary is built before anything is written, so a
+        pair that can not be summarized leaves the cache untouched.
+        """
+        pairs = [
+            (key, data) for key, data in (
+                (self._key_for_player(player), data) for player, data in player_data_pairs
+            )
+            if key is not None
+        ]
+        self._put_keyed(pairs)
+
+    def _put_keyed(self, pairs):
+        if not pairs:
+            return
+        values = [(key, self._codec.encode(data)) for key, data in pairs]
+        if self._summary_db is None:
+            self._db.put_many(values)
+        else:
+            summaries = [
+                (key, PlayerSummary.from_player_data(data, value_digest(value)).encode())
+                for (key, data), (_, value) in zip(pairs, values)
+            ]
+            self._db.put_many_with(values, self._summary_db, summaries)
+        keys = [key for key, _ in pairs]
+        self._summary_lru.invalidate(keys)
+        self._data_lru.invalidate(keys)
+
+    def get_many(self, players) -> list:
+        """Get the data of each of players, or None for those without any, in one read."""
+        self._check_lru()
+        keys = [self._key_for_player(player) for player in players]
+        results = [
+            None if key is None else self._data_lru.get(key) for key in keys
+        ]
+        missing = [index for index, result in enumerate(results) if result is LRUCache.missing]
+        if missing:
+            values = self._db.get_many([keys[index] for index in missing])
+            for index, value in zip(missing, values):
+                results[index] = self._decode_optional_value(value)
+                if results[index] is not None:
+                    self._data_lru.put(keys[index], results[index])
+        return results
+
+    def _decode_optional_value(self, value_bytes):
+        return None if value_bytes is None else self._decode_value(value_bytes)
 
     def _get_data_from_key(self, key) -> dict:
-        result = self._db.get(key)
-        if result is None:
+        self._check_lru()
+        data = self._data_lru.get(key)
+        if data is LRUCache.missing:
+            data = self._decode_optional_value(self._db.get(key))
+            if data is not None:
+                self._data_lru.put(key, data)
+        return data
+
+    def get_player_summary(self, player) -> PlayerSummary:
+        """Get the :py:class:`PlayerSummary` of player, or None if there is no data for them.
+
+        Players whose summary has not been built yet are summarized from their data.
+        """
+        return self.get_player_summaries([player])[0]
+
+    def get_player_summaries(self, players) -> list:
+        """Get the :py:class:`PlayerSummary` of each of players in as few reads as possible."""
+        self._check_lru()
+        keys = [self._key_for_player(player) for player in players]
+        summaries = [
+            None if key is None else self._summary_lru.get(key) for key in keys
+        ]
+        uncached = [
+            index for index, summary in enumerate(summaries) if summary is LRUCache.missing
+        ]
+        for index in uncached:
+            summaries[index] = None
+        # Data and summaries are written together, so a stored summary is trusted as is.
+        if self._summary_db is not None and uncached:
+            values = self._summary_db.get_many([keys[index] for index in uncached])
+            for index, value in zip(uncached, values):
+                if value is not None:
+                    summaries[index] = PlayerSummary.decode(value)
+        missing = [index for index in uncached if summaries[index] is None]
+        if missing:
+            values = self._db.get_many([keys[index] for index in missing])
+            for index, value in zip(missing, values):
+                summaries[index] = self._summarize_value(value)
+        for index in uncached:
+            if summaries[index] is not None:
+                self._summary_lru.put(keys[index], summaries[index])
+        return summaries
+
+    def _summarize_value(self, value):
+        if value is None:
             return None
-        value = json.loads(result.decode('utf-8'))
-        return value
+        return PlayerSummary.from_player_data(self._decode_value(value), value_digest(value))
+
+    def build_summaries(self, batch_size=5000):
+        """Write the summary of every player whose stored summary does not match their data.
+
+        Lookups trust stored summaries, so this is also how summaries left
+        stale by writes that bypassed :py:meth:`put_many` are repaired.
+        Returns the number of summaries that were written.
+        """
+        if self._summary_db is None:
+            raise ValueError("This player cache has no summary database")
+        built = 0
+        checked = 0
+        iterator = ((bytes(key), bytes(value)) for key, value in self._db.iterator())
+        while batch := list(itertools.islice(iterator, batch_size)):
+            stored = self._summary_db.get_many([key for key, _ in batch])
+            pairs = []
+            for (key, value), summary_value in zip(batch, stored):
+                digest = value_digest(value)
+                summary = None if summary_value is None else PlayerSummary.decode(summary_value)
+                if summary is not None and summary.data_digest == digest:
+                    continue
+                try:
+                    summary = PlayerSummary.from_player_data(self._decode_value(value), digest)
+                except Exception as e:
+                    logger.warn(f"Could not summarize {key}: {e}")
+                    continue
+                pairs.append((key, summary.encode()))
+            self._summary_db.put_many(pairs)
+            built += len(pairs)
+            checked += len(batch)
+            logger.info(f"Checked {checked} player summaries, built {built}")
+        self._summary_lru.clear()
+        return built
+
+    def reencode(self, batch_size=5000):
+        """Rewrite every value that was not written with the current codec.
+
+        Returns the number of values that were rewritten.
+        """
+        reencoded = 0
+        pairs = []
+        for key, value in self._db.iterator():
+            if self._codec.can_decode(value):
+                continue
+            pairs.append((bytes(key), self._decode_value(value)))
+            if len(pairs) >= batch_size:
+                # Summaries record the digest of the value, so they are rewritten with it.
+                self._put_keyed(pairs)
+                reencoded += len(pairs)
+                pairs = []
+                logger.info(f"Re-encoded {reencoded} player cache values")
+        self._put_keyed(pairs)
+        return reencoded + len(pairs)
+
+    def state_token(self):
+        """A value that changes whenever any player data is written, or None if unknown."""
+        return self._db.state_token()
 
     def iterator(self, *args, **kwargs):
         for key, value in self._db.iterator(*args, **kwargs):
@@ -128,12 +627,12 @@ class PlayerCache:
         return self._get_data_from_key(key)
 
     def insert_manual_override(self, player: PlatformPlayer, mmr):
-        current_data = self.get_player_data(player) or {}
+        current_data = dict(self.get_player_data(player) or {})
         current_data[self.manual_override_key] = mmr
         self.insert_data_for_player(player, current_data)
 
     def remove_manual_override(self, player: PlatformPlayer):
-        current_data = self.get_player_data(player) or {}
+        current_data = dict(self.get_player_data(player) or {})
         if self.manual_override_key in current_data:
             del current_data[self.manual_override_key]
             self.insert_data_for_player(player, current_data)
@@ -159,8 +658,8 @@ class PlayerCache:
     def _decode_key(self, key_bytes: bytes):
         return key_bytes.decode('utf-8')
 
-    def _decode_value(self, value_bytes: bytes) -> int:
-        return json.loads(value_bytes)
+    def _decode_value(self, value_bytes: bytes) -> dict:
+        return decode_value(value_bytes)
 
 
 class CachedGetPlayerData:
@@ -206,3 +705,115 @@ class CachedGetPlayerData:
             self._player_cache.insert_data_for_player(player_meta, player_data)
 
         return self._player_cache.get_player_data(player_meta)
+
+    def _is_usable(self, summary):
+        return summary is not None and (
+            summary.error is None or summary.error['type'] not in self._retry_errors
+        )
+
+    def get_player_summary(self, player_meta, force_refresh=False):
+        """Get the :py:class:`PlayerSummary` of a player, fetching their data if necessary."""
+        if not force_refresh:
+            summary = self._player_cache.get_player_summary(player_meta)
+            if self._is_usable(summary):
+                return summary
+        return PlayerSummary.from_player_data(
+            self.get_player_data(player_meta, force_refresh=force_refresh)
+        )
+
+    def get_player_summaries(self, player_metas):
+        """Get the summaries of player_metas with one cache read, fetching only those missing."""
+        return [
+            summary if self._is_usable(summary) else self.get_player_summary(player_meta)
+            for player_meta, summary in zip(
+                player_metas, self._player_cache.get_player_summaries(player_metas)
+            )
+        ]
+
+
+class AsyncCachedGetPlayerData:
+    """An asynchronous :py:class:`CachedGetPlayerData` that writes to the cache in batches.
+
+    `get_player_data` is a coroutine function like
+    :py:meth:`tracker_network.AsyncTrackerNetwork.get_player_data`. Fetched
+    data is written with :py:meth:`PlayerCache.put_many` once `batch_size`
+    players are pending, and by :py:meth:`flush`, which must be called when
+    fetching is done.
+    """
+
+    def __init__(
+            self, player_cache, get_player_data, cache_misses=True, retry_errors=("500",),
+            batch_size=100
+    ):
+        """Initatialize the cached get."""
+        self._get_player_data = get_player_data
+        self._player_cache = player_cache
+        self._retry_errors = retry_errors
+        self._cache_misses = cache_misses
+        self._batch_size = batch_size
+        self._pending = {}
+
+    def _is_usable(self, player_data):
+        return bool(player_data) and (
+            self._player_cache.error_key not in player_data or
+            player_data[self._player_cache.error_key]['type'] not in self._retry_errors
+        )
+
+    def _cached_player_data(self, player_meta):
+        key = self._player_cache._key_for_player(player_meta)
+        if key in self._pending:
+            return self._pending[key][1]
+        return self._player_cache.get_player_data(player_meta)
+
+    def _write(self, player_meta, player_data):
+        self._pending[self._player_cache._key_for_player(player_meta)] = (
+            player_meta, player_data
+        )
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write every pending player to the cache."""
+        pending = list(self._pending.values())
+        self._pending = {}
+        self._player_cache.put_many(pending)
+
+    async def get_player_data(self, player_meta, force_refresh=False):
+        """Get player data from the cache or by awaiting get_player_data.
+
+        Returns None if the data could not be obtained and was not cached.
+        """
+        if not force_refresh:
+            player_data = self._cached_player_data(player_meta)
+            if self._is_usable(player_data):
+                return player_data
+
+        try:
+            player_data = await self._get_player_data(player_meta)
+        except tracker_network.Non200Exception as e:
+            logger.warn("Could not obtain data for {} due to {}".format(
+                player_meta, e.status_code
+            ))
+            if self._cache_misses and e.status_code in (404, 500):
+                player_data = {self._player_cache.error_key: {"type": str(e.status_code)}}
+                self._write(player_meta, player_data)
+                return player_data
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warn(f"Could not obtain data for {player_meta} due to {e!r}")
+            return None
+
+        player_data["player_metadata"] = (
+            player_meta.to_dict()
+            if isinstance(player_meta, PlatformPlayer)
+            else player_meta
+        )
+        self._write(player_meta, player_data)
+        return player_data
+
+    async def get_many_player_data(self, player_metas, force_refresh=False):
+        """Get the data of every one of player_metas concurrently."""
+        return await asyncio.gather(*[
+            self.get_player_data(player_meta, force_refresh=force_refresh)
+            for player_meta in player_metas
+        ])
@@ -0,0 +1,162 @@
+"""Fetch the players of cached replays ahead of time, most useful players first."""
+import asyncio
+import collections
+import heapq
+import logging
+
+from .cache_store import MetaStore
+from .player_cache import PlayerCache
+
+
+logger = logging.getLogger(__name__)
+
+
+PrefetchPlan = collections.namedtuple(
+    "PrefetchPlan", "players unlocks replays labeled unlabelable"
+)
+PrefetchPlan.__doc__ = """Players to fetch in order, with the replays each one completes.
+
+`players` are :py:class:`metadata.PlatformPlayer` and `unlocks[i]` is the
+number of replays that become fully labeled once `players[i]` and every
+player before it have been fetched. `replays` counts the scanned replays,
+`labeled` those whose players are all cached already and `unlabelable`
+those with a player that has a cached error that is not retried.
+"""
+
+
+def order_by_replays_unlocked(replay_players):
+    """Order players so that each fetch completes as many replays as possible.
+
+    `replay_players` holds the collection of players still missing from
+    each replay. Players are chosen greedily by the sum, over their
+    replays, of one over the number of players that replay is missing, so
+    a player who is the last one missing from a replay counts that replay
+    fully. Fetching a player raises the priority of the other players in
+    its replays, so those are pushed onto the heap again and outdated
+    entries are skipped when they come up.
+
+    Returns a list of (player, replays completed by fetching them) pairs.
+    """
+    replays_of = collections.defaultdict(list)
+    remaining = []
+    for replay_index, players in enumerate(replay_players):
+        players = set(players)
+        remaining.append(len(players))
+        for player in players:
+            replays_of[player].append(replay_index)
+    members = [set(players) for players in replay_players]
+
+    def priority(player):
+        return sum(1.0 / remaining[replay_index] for replay_index in replays_of[player])
+
+    heap = [(-priority(player), player) for player in replays_of]
+    heapq.heapify(heap)
+    fetched = set()
+    order = []
+    while heap:
+        negative_priority, player = heapq.heappop(heap)
+        if player in fetched or -negative_priority != priority(player):
+            continue
+        fetched.add(player)
+        completed = 0
+        for replay_index in replays_of[player]:
+            remaining[replay_index] -= 1
+            if remaining[replay_index] == 0:
+                completed += 1
+                continue
+            for other in members[replay_index]:
+                if other not in fetched:
+                    heapq.heappush(heap, (-priority(other), other))
+        order.append((player, completed))
+    return order
+
+
+def plan_prefetch(
+        meta_store: MetaStore, player_cache: PlayerCache, retry_errors=("500",),
+        batch_size=5000
+) -> PrefetchPlan:
+    """Find the players of the replays in meta_store that still need to be fetched.
+
+    Players are skipped when they are cached, or have a cached error whose
+    type is not in retry_errors. Replays with such an error can never be
+    fully labeled, so their other players are only fetched if another
+    replay needs them.
+    """
+    players = {}
+    replay_suffixes = []
+    for _, meta in meta_store.items():
+        suffixes = []
+        for player in meta.player_order:
+            players.setdefault(player.tracker_suffix, player)
+            suffixes.append(player.tracker_suffix)
+        replay_suffixes.append(suffixes)
+    logger.info(f"Found {len(players)} players in {len(replay_suffixes)} replays")
+
+    missing = set()
+    unusable = set()
+    suffixes = list(players)
+    for start in range(0, len(suffixes), batch_size):
+        batch = suffixes[start:start + batch_size]
+        summaries = player_cache.get_player_summaries([players[suffix] for suffix in batch])
+        for suffix, summary in zip(batch, summaries):
+            if summary is None or (
+                    summary.error is not None and summary.error['type'] in retry_errors
+            ):
+                missing.add(suffix)
+            elif summary.error is not None:
+                unusable.add(suffix)
+
+    labeled = 0
+    unlabelable = 0
+    replay_missing = []
+    for suffixes in replay_suffixes:
+        if unusable.intersection(suffixes):
+            unlabelable += 1
+            continue
+        replay_missing_suffixes = missing.intersection(suffixes)
+        if replay_missing_suffixes:
+            replay_missing.append(replay_missing_suffixes)
+        else:
+            labeled += 1
+
+    order = order_by_replays_unlocked(replay_missing)
+    unlocks = []
+    total = 0
+    for _, completed in order:
+        total += completed
+        unlocks.append(total)
+    return PrefetchPlan(
+        players=[players[suffix] for suffix, _ in order], unlocks=unlocks,
+        replays=len(replay_suffixes), labeled=labeled, unlabelable=unlabelable,
+    )
+
+
+async def prefetch_players(players, get_player_data, workers=16, attempts=2, on_fetched=None):
+    """Await get_player_data for each of players, in order, with `workers` at a time.
+
+    `get_player_data` is a coroutine function like
+    :py:meth:`player_cache.AsyncCachedGetPlayerData.get_player_data`, which
+    returns None when a player could not be fetched. Such players are tried
+    again up to `attempts` times in total. `on_fetched(index, data)` is called
+    as each player at `index` of players is done.
+
+    Returns the number of players that could not be fetched.
+    """
+    queue = collections.deque(enumerate(players))
+    failed = 0
+
+    async def work():
+        nonlocal failed
+        while queue:
+            index, player = queue.popleft()
+            for _ in range(attempts):
+                data = await get_player_data(player)
+                if data is not None:
+                    break
+            else:
+                failed += 1
+            if on_fetched is not None:
+                on_fetched(index, data)
+
+    await asyncio.gather(*[work() for _ in range(workers)])
+    return failed
@@ -0,0 +1,140 @@
+"""Assemble training batches ahead of the training loop."""
+import logging
+import queue
+import threading
+import time
+import torch
+
+from . import load
+
+
+logger = logging.getLogger(__name__)
+
+
+class _EndOfEpoch:
+    pass
+
+
+class _Failure:
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class BatchPrefetcher:
+    """Pad the batches of an unpadded data loader in a background thread.
+
+    `data_loader` must come from :py:func:`load.batched_packed_loader` with
+    `pad_sequences=False`. A thread keeps up to `depth` batches ready, each
+    padded into one of a ring of `depth + 1` preallocated buffers of shape
+    (batch_size, max_length, features). The buffers are reused instead of
+    reallocated. A buffer is handed back to the ring when the next batch is
+    requested, so a batch must not be used after the following call to
+    `next`.
+
+    `stall_seconds` accumulates how long the consumer waited for batches.
+    """
+
+    def __init__(
+            self, data_loader, depth=2, max_length=load.DEFAULT_TRUNCATE_SEQUENCES_TO,
+            batch_transform=None, pin_memory=False
+    ):
+        self._data_loader = data_loader
+        self._depth = depth
+        self._max_length = max_length
+        self._batch_transform = batch_transform
+        self._pin_memory = pin_memory
+        self._buffers = None
+        self.stall_seconds = 0.0
+        self.batches = 0
+
+    @property
+    def dataset(self):
+        return self._data_loader.dataset
+
+    def __len__(self):
+        return len(self._data_loader)
+
+    def _allocate_buffers(self, batch_size, features, dtype):
+        logger.info(
+            f"Allocating {self._depth + 1} batch buffers of "
+            f"{(batch_size, self._max_length, features)}"
+        )
+        self._buffers = queue.Queue()
+        for _ in range(self._depth + 1):
+            buffer = torch.zeros((batch_size, self._max_length, features), dtype=dtype)
+            self._buffers.put(buffer.pin_memory() if self._pin_memory else buffer)
+
+    def _fill(self, buffer, training_data):
+        sequences = training_data.X
+        max_length = max(sequence.shape[0] for sequence in sequences)
+        X = buffer[:len(sequences), :max_length]
+        for row, sequence in zip(X, sequences):
+            row[:sequence.shape[0]].copy_(sequence)
+            row[sequence.shape[0]:].zero_()
+        training_data = training_data._replace(X=X)
+        if self._batch_transform is not None:
+            training_data = training_data._replace(
+                X=load._transform_padded_batch(self._batch_transform, training_data)
+            )
+        return training_data
+
+    def _produce(self, batches, ready, stop):
+        try:
+            for training_data in batches:
+                if self._buffers is None:
+                    first = training_data.X[0]
+                    self._allocate_buffers(
+                        self._data_loader.batch_size
+                        or getattr(self._data_loader.batch_sampler, 'batch_size', None)
+                        or len(training_data.X),
+                        first.shape[1], first.dtype
+                    )
+                buffer = self._buffers.get()
+                if buffer.shape[0] < len(training_data.X):
+                    # A batch sampler produced a larger batch than the loader's batch size.
+                    buffer = torch.zeros(
+                        (len(training_data.X),) + tuple(buffer.shape[1:]), dtype=buffer.dtype
+                    )
+                ready.put((buffer, self._fill(buffer, training_data)))
+                if stop.is_set():
+                    return
+            ready.put((None, _EndOfEpoch()))
+        except Exception as e:
+            ready.put((None, _Failure(e)))
+
+    def __iter__(self):
+        ready = queue.Queue(maxsize=self._depth)
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._produce, args=(iter(self._data_loader), ready, stop), daemon=True
+        )
+        thread.start()
+        in_use = None
+        try:
+            while True:
+                if in_use is not None:
+                    self._buffers.put(in_use)
+                    in_use = None
+                start = time.monotonic()
+                buffer, item = ready.get()
+                self.stall_seconds += time.monotonic() - start
+                if isinstance(item, _EndOfEpoch):
+                    return
+                if isinstance(item, _Failure):
+                    raise item.exception
+                in_use = buffer
+                self.batches += 1
+                yield item
+        finally:
+            stop.set()
+            if in_use is not None:
+                self._buffers.put(in_use)
+            # Unblock the producer if it is waiting for room.
+            while thread.is_alive():
+                try:
+                    buffer, _ = ready.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if buffer is not None:
+                    self._buffers.put(buffer)
@@ -0,0 +1,218 @@
+"""Route requests to the healthiest of a set of proxies."""
+import collections
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+OK = "ok"
+RATE_LIMITED = "429"
+FORBIDDEN = "403"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+
+_gateway_errors = (502, 503, 504)
+
+
+def outcome_for_status(status_code):
+    """The outcome to record for a response with status_code.
+
+    Responses that the proxy delivered faithfully, like a 404 for a player
+    that does not exist or a 500 that the tracker network returns for some
+    players and that is cached as their error, say nothing bad about the
+    proxy. Only gateway errors count against it.
+    """
+    if status_code == 429:
+        return RATE_LIMITED
+    if status_code == 403:
+        return FORBIDDEN
+    if status_code in _gateway_errors:
+        return ERROR
+    return OK
+
+
+class _ProxyState:
+
+    def __init__(self, uri, window):
+        self.uri = uri
+        self.latency = None
+        self.outcomes = collections.deque(maxlen=window)
+        self.requests = 0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.circuit_open = False
+        self.trial_in_flight = False
+        self.unavailable_until = 0.0
+
+    def rate(self, outcome):
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for o in self.outcomes if o == outcome) / len(self.outcomes)
+
+
+class ProxyPool:
+    """Track the health of each proxy and pick the best available one for each request.
+
+    Each proxy has an exponentially weighted moving average of its latency
+    and a window of its recent outcomes. Requests go to the available proxy
+    with the lowest expected latency, inflated by its failure rate and the
+    requests it already has in flight.
+
+    A 429 makes a proxy unavailable until its Retry-After deadline passes.
+    After `failure_threshold` consecutive failures its circuit opens: it
+    cools down for `base_cooldown` seconds, doubling each time it trips
+    again up to `max_cooldown`, and then gets a single trial request that
+    either closes the circuit or opens it again.
+    """
+
+    def __init__(
+            self, proxy_uris, latency_alpha=.2, initial_latency=1.0, window=50,
+            failure_threshold=3, base_cooldown=30.0, max_cooldown=600.0,
+            default_retry_after=60.0, clock=time.monotonic,
+    ):
+        self._proxies = [_ProxyState(uri, window) for uri in proxy_uris]
+        self._latency_alpha = latency_alpha
+        self._initial_latency = initial_latency
+        self._failure_threshold = failure_threshold
+        self._base_cooldown = base_cooldown
+        self._max_cooldown = max_cooldown
+        self._default_retry_after = default_retry_after
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._proxies)
+
+    def uri(self, index):
+        return self._proxies[index].uri
+
+    def _is_available(self, proxy, now):
+        return proxy.unavailable_until <= now and not (
+            proxy.circuit_open and proxy.trial_in_flight
+        )
+
+    def _expected_cost(self, proxy):
+        latency = self._initial_latency if proxy.latency is None else proxy.latency
+        success_rate = 1.0 if not proxy.outcomes else proxy.rate(OK)
+        return latency * (1 + proxy.in_flight) / max(success_rate, .05)
+
+    def try_acquire(self):
+        """Get the index of the proxy to use for a request, or None if none are available.
+
+        Every acquired index must be passed to :py:meth:`record` once its
+        request is done.
+        """
+        with self._lock:
+            now = self._clock()
+            available = [
+                index for index, proxy in enumerate(self._proxies)
+                if self._is_available(proxy, now)
+            ]
+            if not available:
+                return None
+            index = min(available, key=lambda index: self._expected_cost(self._proxies[index]))
+            proxy = self._proxies[index]
+            if proxy.circuit_open:
+                proxy.trial_in_flight = True
+            proxy.in_flight += 1
+            proxy.requests += 1
+            return index
+
+    def seconds_until_available(self):
+        """How long until some proxy can be acquired, 0 if one can be now."""
+        with self._lock:
+            now = self._clock()
+            waits = [
+                proxy.unavailable_until - now for proxy in self._proxies
+                if not (proxy.circuit_open and proxy.trial_in_flight)
+            ]
+        if not waits:
+            # Every proxy is waiting on the outcome of a trial request.
+            return 1.0
+        return max(0.0, min(waits))
+
+    def acquire(self, sleep=time.sleep):
+        """Get the index of the proxy to use for a request, waiting for one if necessary."""
+        while True:
+            index = self.try_acquire()
+            if index is not None:
+                return index
+            wait = self.seconds_until_available()
+            logger.info(f"Every proxy is cooling down, waiting {wait:.1f}s")
+            sleep(max(wait, .01))
+
+    def record(self, index, outcome, latency=None, retry_after=None):
+        """Record the outcome of a request made through the proxy at index.
+
+        An outcome of None releases the proxy without saying anything about
+        its health, for requests that were abandoned.
+        """
+        with self._lock:
+            now = self._clock()
+            proxy = self._proxies[index]
+            proxy.in_flight -= 1
+            proxy.trial_in_flight = False
+            if outcome is None:
+                return
+            proxy.outcomes.append(outcome)
+            if latency is not None:
+                proxy.latency = latency if proxy.latency is None else (
+                    self._latency_alpha * latency + (1 - self._latency_alpha) * proxy.latency
+                )
+            if outcome == OK:
+                proxy.consecutive_failures = 0
+                proxy.trips = 0
+                proxy.circuit_open = False
+                return
+
+            proxy.consecutive_failures += 1
+            if outcome == RATE_LIMITED:
+                proxy.unavailable_until = max(
+                    proxy.unavailable_until,
+                    now + (self._default_retry_after if retry_after is None else retry_after)
+                )
+            if proxy.circuit_open or proxy.consecutive_failures >= self._failure_threshold:
+                proxy.trips += 1
+                proxy.circuit_open = True
+                cooldown = min(self._base_cooldown * 2 ** (proxy.trips - 1), self._max_cooldown)
+                proxy.unavailable_until = max(proxy.unavailable_until, now + cooldown)
+                logger.warn(
+                    f"Proxy {proxy.uri} failed {proxy.consecutive_failures} times in a row, "
+                    f"cooling down for {cooldown:.0f}s"
+                )
+
+    def stats(self):
+        """A dictionary of the health of each proxy, in the order of proxy_uris."""
+        with self._lock:
+            now = self._clock()
+            return [
+                {
+                    "uri": proxy.uri,
+                    "requests": proxy.requests,
+                    "in_flight": proxy.in_flight,
+                    "latency": proxy.latency,
+                    "ok_rate": proxy.rate(OK),
+                    "rate_limited_rate": proxy.rate(RATE_LIMITED),
+                    "forbidden_rate": proxy.rate(FORBIDDEN),
+                    "timeout_rate": proxy.rate(TIMEOUT),
+                    "circuit_open": proxy.circuit_open,
+                    "available_in": max(0.0, proxy.unavailable_until - now),
+                }
+                for proxy in self._proxies
+            ]
+
+    def log_stats(self):
+        for stats in self.stats():
+            latency = "?" if stats["latency"] is None else f"{stats['latency']:.2f}s"
+            logger.info(
+                f"Proxy {stats['uri']}: {stats['requests']} requests, latency {latency}, "
+                f"ok {stats['ok_rate']:.0%}, 429 {stats['rate_limited_rate']:.0%}, "
+                f"403 {stats['forbidden_rate']:.0%}, timeout {stats['timeout_rate']:.0%}, "
+                f"{'open' if stats['circuit_open'] else 'closed'}, "
+                f"available in {stats['available_in']:.0f}s"
+            )
@@ -1,5 +1,6 @@
 import json
 import lmdb
+import os
 
 
 DEFAULT_VALUE = '{}'.encode('utf-8')
@@ -7,32 +8,111 @@ DEFAULT_VALUE = '{}'.encode('utf-8')
 
 class ReplayAttributesDB:
 
+    load_error_attribute = "load_error"
+
     def __init__(self, filepath, db_name="replay_attributes", **kwargs):
         self._filepath = filepath
+        self._db_name = db_name
         kwargs.setdefault("max_dbs", 16)
         kwargs.setdefault("map_size", 2 * 1024 ** 3)
-        self._env = lmdb.open(filepath, **kwargs)
-        self._db = self._env.open_db(db_name.encode('utf-8'))
+        self._lmdb_kwargs = kwargs
+        self._env_pid = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_env_pid'] = None
+        state.pop('_env_instance', None)
+        state.pop('_db', None)
+        return state
+
+    @property
+    def _env(self):
+        # Reopen after a fork so that DataLoader workers get their own handle.
+        if self._env_pid != os.getpid():
+            self._env_instance = lmdb.open(self._filepath, **self._lmdb_kwargs)
+            self._db = self._env_instance.open_db(self._db_name.encode('utf-8'))
+            self._env_pid = os.getpid()
+        return self._env_instance
 
     def put_replay_attributes(self, uuid, attributes):
         encoded_uuid = self._encode_key(uuid)
-        with self._env.begin(db=self._db, write=True) as txn:
+        env = self._env
+        with env.begin(db=self._db, write=True) as txn:
             current_values = self._decode_value(txn.get(encoded_uuid) or DEFAULT_VALUE)
             current_values.update(attributes)
             txn.put(encoded_uuid, self._encode_value(current_values))
 
+    def put_many_replay_attributes(self, uuid_attributes):
+        """Merge each (uuid, attributes) pair into the stored attributes in one transaction."""
+        env = self._env
+        with env.begin(db=self._db, write=True) as txn:
+            for uuid, attributes in uuid_attributes:
+                encoded_uuid = self._encode_key(uuid)
+                current_values = self._decode_value(txn.get(encoded_uuid) or DEFAULT_VALUE)
+                current_values.update(attributes)
+                txn.put(encoded_uuid, self._encode_value(current_values))
+
     def put_replay_attribute(self, uuid, attribute, value):
         self.put_replay_attributes(uuid, [(attribute, value)])
 
+    def delete_replay_attribute(self, uuid, attribute):
+        self.delete_many_replay_attribute([uuid], attribute)
+
+    def delete_many_replay_attribute(self, uuids, attribute):
+        """Remove attribute from the attributes of each of uuids in one transaction."""
+        env = self._env
+        with env.begin(db=self._db, write=True) as txn:
+            for uuid in uuids:
+                encoded_uuid = self._encode_key(uuid)
+                current_values = self._decode_value(txn.get(encoded_uuid) or DEFAULT_VALUE)
+                if attribute in current_values:
+                    del current_values[attribute]
+                    txn.put(encoded_uuid, self._encode_value(current_values))
+
+    def record_load_error(self, uuid, exception):
+        """Record that the tensor of uuid could not be loaded because of exception."""
+        self.record_load_errors([(uuid, exception)])
+
+    def record_load_errors(self, uuid_exceptions):
+        """Record the exception of each (uuid, exception) pair in one transaction."""
+        self.put_many_replay_attributes(
+            (uuid, {self.load_error_attribute: {
+                "type": type(exception).__name__,
+                "message": str(exception)[:1000],
+            }})
+            for uuid, exception in uuid_exceptions
+        )
+
+    def clear_load_error(self, uuid):
+        self.delete_replay_attribute(uuid, self.load_error_attribute)
+
+    def clear_load_errors(self, uuids):
+        """Clear the load errors of uuids in one transaction."""
+        self.delete_many_replay_attribute(uuids, self.load_error_attribute)
+
+    def uuids_with_attribute(self, attribute):
+        """Get the set of uuids for which attribute is set to a truthy value, in one scan."""
+        return {uuid for uuid, attributes in self if attributes.get(attribute)}
+
     def get_replay_attribute(self, uuid, attribute):
         return self.get_replay_attributes(uuid).get(attribute)
 
     def get_replay_attributes(self, uuid):
-        with self._env.begin(db=self._db) as txn:
+        env = self._env
+        with env.begin(db=self._db) as txn:
             return self._decode_value(
                 txn.get(self._encode_key(uuid)) or DEFAULT_VALUE
             )
 
+    def get_many_replay_attributes(self, uuids):
+        """Get a dictionary from each of uuids to its attributes, read in one transaction."""
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            return {
+                uuid: self._decode_value(txn.get(self._encode_key(uuid)) or DEFAULT_VALUE)
+                for uuid in uuids
+            }
+
     def _encode_key(self, uuid):
         return uuid.encode('utf-8')
 
@@ -50,7 +130,8 @@ class ReplayAttributesDB:
             yield self._decode_key(k), self._decode_value(v)
 
     def raw_iterator(self, start_key=None):
-        with self._env.begin(db=self._db) as txn:
+        env = self._env
+        with env.begin(db=self._db) as txn:
             cursor = txn.cursor()
             if start_key is not None:
                 cursor.set_key(start_key)
@@ -0,0 +1,122 @@
+"""A persisted uuid to path index of the replay files in a directory tree."""
+import hashlib
+import json
+import logging
+import os
+import time
+
+from .cache_store import atomic_write
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayDirectoryIndex:
+    """Index the replays in a directory tree, rescanning only directories whose mtime changed.
+
+    For every directory in the tree the index records its mtime, its
+    subdirectories and the replay files it contains. Adding, removing or
+    renaming an entry changes the mtime of the containing directory, so on
+    refresh an unchanged tree costs one stat per directory instead of a full
+    :py:func:`os.walk`.
+    """
+
+    # Directories modified this recently are rescanned on the next refresh,
+    # since a file created within the same mtime tick as the scan would
+    # otherwise go unnoticed.
+    racy_seconds = 2.0
+
+    @classmethod
+    def for_directory(cls, root, index_directory, replay_extension="replay"):
+        """Get the index of root that is stored in index_directory."""
+        key = hashlib.sha1(
+            f"{os.path.abspath(root)}:{replay_extension}".encode('utf-8')
+        ).hexdigest()[:16]
+        return cls(root, os.path.join(index_directory, f"{key}.json"), replay_extension)
+
+    def __init__(self, root, index_path, replay_extension="replay"):
+        self._root = os.path.abspath(root)
+        self._index_path = index_path
+        self._replay_extension = replay_extension
+        self._directories = None
+
+    def _load(self):
+        try:
+            with open(self._index_path, 'r') as f:
+                data = json.loads(f.read())
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warn(f"Discarding unreadable replay index {self._index_path}: {e}")
+            return {}
+        if data.get("root") != self._root or data.get("extension") != self._replay_extension:
+            return {}
+        return data["directories"]
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self._index_path) or ".", exist_ok=True)
+        with atomic_write(self._index_path, 'w') as f:
+            f.write(json.dumps({
+                "root": self._root,
+                "extension": self._replay_extension,
+                "directories": self._directories,
+            }))
+
+    def _scan_directory(self, relative_path, mtime_ns):
+        subdirectories = []
+        replays = {}
+        suffix = f".{self._replay_extension}"
+        with os.scandir(os.path.join(self._root, relative_path)) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    # Like os.walk, symlinked directories are not descended into.
+                    if not entry.is_symlink():
+                        subdirectories.append(entry.name)
+                elif entry.name.endswith(suffix) and len(entry.name) > len(suffix):
+                    replays[entry.name[:-len(suffix)]] = entry.name
+        if time.time_ns() - mtime_ns < self.racy_seconds * 1e9:
+            mtime_ns = None
+        return {"mtime_ns": mtime_ns, "subdirectories": subdirectories, "replays": replays}
+
+    def refresh(self):
+        """Bring the index up to date with the directory tree and persist it if it changed."""
+        previous = self._load() if self._directories is None else self._directories
+        directories = {}
+        rescanned = 0
+        pending = ["."]
+        while pending:
+            relative_path = pending.pop()
+            try:
+                mtime_ns = os.stat(os.path.join(self._root, relative_path)).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            record = previous.get(relative_path)
+            if record is None or record["mtime_ns"] != mtime_ns:
+                try:
+                    record = self._scan_directory(relative_path, mtime_ns)
+                except FileNotFoundError:
+                    continue
+                rescanned += 1
+            directories[relative_path] = record
+            pending.extend(
+                os.path.normpath(os.path.join(relative_path, name))
+                for name in record["subdirectories"]
+            )
+
+        self._directories = directories
+        if rescanned or len(directories) != len(previous):
+            logger.info(f"Rescanned {rescanned} of {len(directories)} replay directories")
+            self._save()
+        return self
+
+    def items(self):
+        """Iterate over (uuid, path) pairs for every replay in the tree."""
+        if self._directories is None:
+            self.refresh()
+        for relative_path, record in self._directories.items():
+            directory = os.path.normpath(os.path.join(self._root, relative_path))
+            for uuid, filename in record["replays"].items():
+                yield uuid, os.path.join(directory, filename)
+
+    def uuid_to_path(self):
+        return dict(self.items())
@@ -0,0 +1,132 @@
+import itertools
+import json
+import lmdb
+import logging
+import os
+
+from .cache_store import MetaStore, JSONDirectoryMetaStore
+from .metadata import ReplayMeta
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayMetaDB(MetaStore):
+    """An lmdb backed store of :py:class:`ReplayMeta` keyed by replay uuid."""
+
+    def __init__(self, filepath, db_name="replay_meta", **kwargs):
+        self._filepath = filepath
+        self._db_name = db_name
+        kwargs.setdefault("max_dbs", 16)
+        kwargs.setdefault("map_size", 8 * 1024 ** 3)
+        self._lmdb_kwargs = kwargs
+        self._env_pid = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_env_pid'] = None
+        state.pop('_env_instance', None)
+        state.pop('_db', None)
+        return state
+
+    @property
+    def _env(self):
+        # Reopen after a fork so that DataLoader workers get their own handle.
+        if self._env_pid != os.getpid():
+            os.makedirs(self._filepath, exist_ok=True)
+            self._env_instance = lmdb.open(self._filepath, **self._lmdb_kwargs)
+            self._db = self._env_instance.open_db(self._db_name.encode('utf-8'))
+            self._env_pid = os.getpid()
+        return self._env_instance
+
+    def get(self, uuid):
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            value = txn.get(self._encode_key(uuid))
+        return None if value is None else self._decode_value(value)
+
+    def get_many(self, uuids):
+        env = self._env
+        result = {}
+        with env.begin(db=self._db) as txn:
+            for uuid in uuids:
+                value = txn.get(self._encode_key(uuid))
+                if value is not None:
+                    result[uuid] = self._decode_value(value)
+        return result
+
+    def put(self, uuid, meta):
+        self.put_many([(uuid, meta)])
+
+    def put_many(self, pairs):
+        env = self._env
+        with env.begin(db=self._db, write=True) as txn:
+            for uuid, meta in pairs:
+                txn.put(self._encode_key(uuid), self._encode_value(meta))
+
+    def contains(self, uuid):
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            return txn.get(self._encode_key(uuid)) is not None
+
+    def delete(self, uuid):
+        env = self._env
+        with env.begin(db=self._db, write=True) as txn:
+            txn.delete(self._encode_key(uuid))
+
+    def is_empty(self):
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            return txn.stat(self._db)['entries'] == 0
+
+    def uuids(self):
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            for key in txn.cursor().iternext(values=False):
+                yield self._decode_key(bytes(key))
+
+    def items(self):
+        for k, v in self.raw_iterator():
+            yield self._decode_key(k), self._decode_value(v)
+
+    def raw_iterator(self, start_key=None):
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            cursor = txn.cursor()
+            if start_key is not None:
+                cursor.set_key(start_key)
+            for v in cursor.iternext():
+                yield v
+
+    def _encode_key(self, uuid):
+        return uuid.encode('utf-8')
+
+    def _decode_key(self, key_bytes: bytes):
+        return key_bytes.decode('utf-8')
+
+    def _encode_value(self, meta: ReplayMeta):
+        return json.dumps(meta.to_dict()).encode('utf-8')
+
+    def _decode_value(self, value_bytes: bytes):
+        return ReplayMeta.from_dict(json.loads(bytes(value_bytes).decode('utf-8')))
+
+
+def migrate_meta_directory(directory, meta_db: ReplayMetaDB, batch_size=5000):
+    """Copy every `.replay_meta` file in directory into meta_db."""
+    source = JSONDirectoryMetaStore(directory)
+    uuids = source.uuids()
+    migrated = 0
+    while batch := list(itertools.islice(uuids, batch_size)):
+        pairs = []
+        for uuid in batch:
+            try:
+                meta = source.get(uuid)
+            except Exception as e:
+                logger.warn(f"Skipping unreadable meta for {uuid}: {e}")
+                continue
+            if meta is not None:
+                pairs.append((uuid, meta))
+        meta_db.put_many(pairs)
+        migrated += len(pairs)
+        logger.info(f"Migrated {migrated} replay metas")
+    return migrated
@@ -0,0 +1,241 @@
+"""An archive of raw tracker network responses from which player data can be derived again."""
+import collections
+import datetime
+import json
+import lmdb
+import logging
+import msgpack
+import os
+import struct
+import time
+import zstandard
+
+from . import tracker_network
+from .cache_store import map_shards
+from .player_cache import PlayerCache
+
+
+logger = logging.getLogger(__name__)
+
+
+ArchivedResponse = collections.namedtuple(
+    "ArchivedResponse", "tracker_suffix fetched_at status profile mmr"
+)
+
+
+class ResponseArchive:
+    """An lmdb backed archive of the raw profile and mmr responses of each player fetch.
+
+    Entries are keyed by tracker suffix and fetch time, so every fetch of a
+    player is kept, and values are zstandard compressed. A successful fetch
+    has status 200 and both bodies, a failed one its status and no mmr body.
+
+    Records are written once `batch_size` of them are pending, and by
+    :py:meth:`flush`.
+    """
+
+    _format_version = b"\x01"
+    _separator = b"\x00"
+
+    def __init__(self, filepath, db_name="tracker_responses", batch_size=1, level=3, **kwargs):
+        self._filepath = filepath
+        self._db_name = db_name
+        self._batch_size = batch_size
+        self._level = level
+        kwargs.setdefault("max_dbs", 4)
+        kwargs.setdefault("map_size", 256 * 1024 ** 3)
+        self._lmdb_kwargs = kwargs
+        self._env_pid = None
+        self._pending = []
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_env_pid'] = None
+        state['_pending'] = []
+        state.pop('_env_instance', None)
+        state.pop('_db', None)
+        return state
+
+    @property
+    def _env(self):
+        # Reopen after a fork so that worker processes get their own handle.
+        if self._env_pid != os.getpid():
+            os.makedirs(self._filepath, exist_ok=True)
+            self._env_instance = lmdb.open(self._filepath, **self._lmdb_kwargs)
+            self._db = self._env_instance.open_db(self._db_name.encode('utf-8'))
+            self._env_pid = os.getpid()
+        return self._env_instance
+
+    def record(self, tracker_suffix, status, profile, mmr=None, fetched_at=None):
+        """Archive the bodies of one fetch of the player at tracker_suffix."""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        self._pending.append((
+            self._encode_key(tracker_suffix, fetched_at),
+            self._encode_value(status, profile, mmr),
+        ))
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write every pending record."""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        env = self._env
+        with env.begin(db=self._db, write=True) as txn:
+            for key, value in pending:
+                txn.put(key, value)
+
+    def history(self, tracker_suffix):
+        """Every archived fetch of the player at tracker_suffix, oldest first."""
+        prefix = tracker_suffix.encode('utf-8') + self._separator
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            cursor = txn.cursor()
+            if not cursor.set_range(prefix):
+                return []
+            responses = []
+            for key, value in cursor:
+                if not key.startswith(prefix):
+                    break
+                responses.append(self._decode(key, value))
+            return responses
+
+    def latest(self, tracker_suffix):
+        """The most recent archived fetch of the player at tracker_suffix, or None."""
+        prefix = tracker_suffix.encode('utf-8') + self._separator
+        # Every key of the player sorts before this one, and every key of any
+        # other player that sorts before it also sorts before the player's keys.
+        after_prefix = tracker_suffix.encode('utf-8') + b"\x01"
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            cursor = txn.cursor()
+            found = cursor.prev() if cursor.set_range(after_prefix) else cursor.last()
+            if not found or not cursor.key().startswith(prefix):
+                return None
+            return self._decode(cursor.key(), cursor.value())
+
+    def tracker_suffixes(self):
+        """Every tracker suffix with an archived fetch, in key order."""
+        previous = None
+        env = self._env
+        with env.begin(db=self._db) as txn:
+            for key in txn.cursor().iternext(values=False):
+                suffix = bytes(key[:-9])
+                if suffix != previous:
+                    previous = suffix
+                    yield suffix.decode('utf-8')
+
+    def _encode_key(self, tracker_suffix, fetched_at):
+        # Big endian milliseconds sort the fetches of a player by time.
+        return (
+            tracker_suffix.encode('utf-8') + self._separator +
+            struct.pack(">Q", int(fetched_at * 1000))
+        )
+
+    def _encode_value(self, status, profile, mmr):
+        return self._format_version + zstandard.ZstdCompressor(level=self._level).compress(
+            msgpack.packb([status, profile, mmr], use_bin_type=True)
+        )
+
+    def _decode(self, key, value):
+        key = bytes(key)
+        status, profile, mmr = msgpack.unpackb(
+            zstandard.ZstdDecompressor().decompress(
+                memoryview(value)[len(self._format_version):]
+            ), raw=False
+        )
+        return ArchivedResponse(
+            key[:-9].decode('utf-8'), struct.unpack(">Q", key[-8:])[0] / 1000,
+            status, profile, mmr,
+        )
+
+
+def player_data_from_response(response: ArchivedResponse) -> dict:
+    """Derive the player cache record of a player from an archived fetch."""
+    if response.status != 200:
+        return {PlayerCache.error_key: {"type": str(response.status)}}
+    return tracker_network.combine_profile_and_mmr_json({
+        "profile": json.loads(response.profile),
+        "mmr": json.loads(response.mmr),
+    })
+
+
+def _rebuild_shard(archive, tracker_suffixes):
+    rebuilt = []
+    for tracker_suffix in tracker_suffixes:
+        try:
+            rebuilt.append((
+                tracker_suffix, player_data_from_response(archive.latest(tracker_suffix))
+            ))
+        except Exception as e:
+            logger.warn(f"Could not rebuild {tracker_suffix}: {type(e).__name__}: {e}")
+    return rebuilt
+
+
+# Fields of a player cache record that do not come from the tracker network.
+_preserved_keys = (PlayerCache.manual_override_key, "player_metadata")
+
+
+def _last_updated(player_data):
+    try:
+        last_updated = datetime.datetime.fromisoformat(player_data["last_updated"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if last_updated.tzinfo is None:
+        last_updated = last_updated.replace(tzinfo=datetime.timezone.utc)
+    return last_updated
+
+
+def _is_newer_than(existing, data):
+    # Records fetched without archiving can be newer than anything in the archive.
+    existing_updated = _last_updated(existing) if existing else None
+    if existing_updated is None:
+        return False
+    updated = _last_updated(data)
+    return updated is None or updated < existing_updated
+
+
+def rebuild_player_cache(
+        archive: ResponseArchive, player_cache: PlayerCache, processes=None, shard_size=2000
+):
+    """Regenerate the player cache record of every archived player from their latest fetch.
+
+    Archives are decoded and parsed in a pool of processes. Manual overrides
+    and player metadata already in the cache are kept, and players whose
+    cached record was updated on the tracker network more recently than
+    their latest archived fetch are left alone. Returns the number of
+    players that were rebuilt.
+    """
+    tracker_suffixes = list(archive.tracker_suffixes())
+    shards = [
+        tracker_suffixes[start:start + shard_size]
+        for start in range(0, len(tracker_suffixes), shard_size)
+    ]
+    rebuilt = 0
+    skipped = 0
+    for shard in map_shards(
+            _rebuild_shard, shards, archive, processes=processes, description="archive shards"
+    ):
+        players = [
+            {"__tracker_suffix__": tracker_suffix.encode('utf-8')}
+            for tracker_suffix, _ in shard
+        ]
+        pairs = []
+        for player, (_, data), existing in zip(
+                players, shard, player_cache.get_many(players)
+        ):
+            if _is_newer_than(existing, data):
+                skipped += 1
+                continue
+            for key in _preserved_keys:
+                if existing and key in existing:
+                    data[key] = existing[key]
+            pairs.append((player, data))
+        player_cache.put_many(pairs)
+        rebuilt += len(pairs)
+    logger.info(
+        f"Rebuilt {rebuilt} of {len(tracker_suffixes)} players, "
+        f"{skipped} with newer cached records"
+    )
+    return rebuilt
@@ -0,0 +1,68 @@
+"""Batch samplers for :py:class:`rlrml.load.ReplayDataset`."""
+import torch
+
+from torch.utils.data import Sampler
+
+
+class LengthBucketBatchSampler(Sampler):
+    """Yield batches of indices whose replays have similar lengths.
+
+    Every epoch the indices are shuffled and split into pools of
+    `batch_size * bucket_size_multiplier` indices. Each pool is sorted by
+    length and cut into batches, and the order of all of the resulting
+    batches is shuffled. Batches therefore need very little padding while
+    their composition still changes from epoch to epoch.
+
+    :param lengths: The frame count of the replay at each dataset index.
+    """
+
+    def __init__(
+            self, lengths, batch_size, bucket_size_multiplier=50, drop_last=False,
+            generator=None
+    ):
+        self._lengths = torch.as_tensor(lengths, dtype=torch.int64)
+        self._batch_size = batch_size
+        self._pool_size = batch_size * bucket_size_multiplier
+        self._drop_last = drop_last
+        self._generator = generator
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    def _make_generator(self):
+        if self._generator is not None:
+            return self._generator
+        # Like RandomSampler, draw a fresh seed from the global generator so
+        # that every epoch is different but torch.manual_seed is respected.
+        generator = torch.Generator()
+        generator.manual_seed(int(torch.empty((), dtype=torch.int64).random_().item()))
+        return generator
+
+    def _pool_batches(self, pool):
+        order = torch.argsort(self._lengths[pool], stable=True)
+        for batch in torch.split(pool[order], self._batch_size):
+            if len(batch) == self._batch_size or not self._drop_last:
+                yield batch.tolist()
+
+    def __iter__(self):
+        generator = self._make_generator()
+        permutation = torch.randperm(len(self._lengths), generator=generator)
+        batches = [
+            batch
+            for pool in torch.split(permutation, self._pool_size)
+            for batch in self._pool_batches(pool)
+        ]
+        for batch_index in torch.randperm(len(batches), generator=generator).tolist():
+            yield batches[batch_index]
+
+    def __len__(self):
+        count = len(self._lengths)
+        full_pools, remainder = divmod(count, self._pool_size)
+        if self._drop_last:
+            return full_pools * (self._pool_size // self._batch_size) + (
+                remainder // self._batch_size
+            )
+        return full_pools * -(-self._pool_size // self._batch_size) + (
+            -(-remainder // self._batch_size)
+        )
@@ -1,13 +1,14 @@
 import collections
+import copy
 import datetime
-import itertools
+import hashlib
+import json
 import logging
 import numpy as np
 
 from . import player_cache as pc
 from . import metadata
 from . import mmr
-from . import util
 from .playlist import Playlist
 
 
@@ -23,15 +24,29 @@ def scaled_sigmoid(x, base=3.7, denominator=20.0):
 
 class MMREstimateScorer:
 
+    # Bump this whenever a change to the scoring code changes its estimates.
+    version = 2
+
     def __init__(
             self, get_player_data, season_dates=mmr.TIGHTENED_SEASON_DATES,
             score_game_count=scaled_sigmoid, meta_score=np.prod,
             minimum_games_for_mmr=lambda mmr: 0,
             mmr_disparity_requires_victory_threshold=200,
-            truncate_lowest_count=0,
+            truncate_lowest_count=0, get_player_summary=None, get_player_summaries=None,
     ):
+        """Initialize the scorer.
+
+        Players are scored from the :py:class:`player_cache.PlayerSummary`
+        returned by `get_player_summary` when it is provided, and otherwise
+        from a summary of what `get_player_data` returns. The players of a
+        replay are looked up together with `get_player_summaries` when it is
+        provided.
+        """
         self._get_player_data = get_player_data
+        self._get_player_summary = get_player_summary
+        self._get_player_summaries = get_player_summaries
         self._season_dates = season_dates
+        self._season_dates_key = tuple(season_dates)
         self._score_game_count = score_game_count
         self._meta_score = meta_score
         self._minimum_games_for_mmr = minimum_games_for_mmr
@@ -40,6 +55,50 @@ class MMREstimateScorer:
         )
         self._truncate_lowest_count = truncate_lowest_count
 
+    @staticmethod
+    def _describe_callable(fn):
+        description = f"{getattr(fn, '__module__', None)}.{getattr(fn, '__qualname__', fn)}"
+        code = getattr(fn, '__code__', None)
+        if code is not None:
+            description += ":" + hashlib.sha1(
+                code.co_code + repr(code.co_consts).encode('utf-8')
+            ).hexdigest()
+        return description
+
+    def parameter_fingerprint(self):
+        """A hash of every parameter that can change the estimates of this scorer."""
+        return hashlib.sha1(json.dumps({
+            "version": self.version,
+            "season_dates": repr(self._season_dates),
+            "score_game_count": self._describe_callable(self._score_game_count),
+            "meta_score": self._describe_callable(self._meta_score),
+            "minimum_games_for_mmr": self._describe_callable(self._minimum_games_for_mmr),
+            "mmr_disparity_requires_victory_threshold": (
+                self._mmr_disparity_requries_victory_threshold
+            ),
+            "truncate_lowest_count": self._truncate_lowest_count,
+        }, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def with_get_player_data(
+            self, get_player_data, get_player_summary=None, get_player_summaries=None
+    ):
+        """Get a copy of this scorer that obtains player data from get_player_data."""
+        scorer = copy.copy(self)
+        scorer._get_player_data = get_player_data
+        scorer._get_player_summary = get_player_summary
+        scorer._get_player_summaries = get_player_summaries
+        return scorer
+
+    def _player_summary(self, player):
+        if self._get_player_summary is not None:
+            return self._get_player_summary(player)
+        return pc.PlayerSummary.from_player_data(self._get_player_data(player))
+
+    def _player_summaries(self, players):
+        if self._get_player_summaries is not None:
+            return self._get_player_summaries(players)
+        return [self._player_summary(player) for player in players]
+
     def score_replay_meta(
             self, meta: metadata.ReplayMeta, abort_score=0.0,
             playlist=Playlist('Ranked Doubles 2v2')
@@ -53,9 +112,11 @@ class MMREstimateScorer:
             1: 0,
         }
 
-        for player in meta.player_order:
-            estimate, score = self.score_player_mmr_estimate(
-                player, game_date, playlist=playlist
+        for player, summary in zip(
+                meta.player_order, self._player_summaries(meta.player_order)
+        ):
+            estimate, score = self._score_player_summary(
+                player, summary, game_date, playlist=playlist
             )
             estimates.append((player, estimate))
             scores.append(score)
@@ -87,31 +148,31 @@ class MMREstimateScorer:
             self, player: metadata.PlatformPlayer, date: datetime.date,
             playlist=Playlist('Ranked Doubles 2v2')
     ):
-        player_data = self._get_player_data(player)
+        return self._score_player_summary(
+            player, self._player_summary(player), date, playlist=playlist
+        )
 
-        if player_data is None or '__error__' in player_data:
+    def _score_player_summary(
+            self, player, summary: pc.PlayerSummary, date: datetime.date,
+            playlist=Playlist('Ranked Doubles 2v2')
+    ):
+        if summary is None or summary.error is not None:
             return None, 0.0
 
-        if pc.PlayerCache.manual_override_key in player_data:
-            override_value = player_data[pc.PlayerCache.manual_override_key]
-            if not override_value:
+        if summary.has_manual_override:
+            if not summary.manual_override:
                 return None, 0.0
-            return float(override_value), 1.0
+            return float(summary.manual_override), 1.0
 
-        try:
-            playlist_mmr_history = player_data['mmr_history'][playlist]
-        except Exception:
-            playlist_mmr_history = []
+        playlist_mmr_history = summary.mmr_histories.get(playlist)
 
-        if not playlist_mmr_history:
+        if playlist_mmr_history is None or len(playlist_mmr_history.days) == 0:
             return (0.0, 0.0)
 
-        history_by_season = mmr.split_mmr_history_into_seasons(
-            playlist_mmr_history,
-            season_dates=self._season_dates
+        history_by_season, stats = summary.derived(
+            ("seasons", playlist, self._season_dates_key),
+            lambda: self._split_into_seasons(playlist_mmr_history)
         )
-
-        stats = mmr.calculate_all_season_statistics(history_by_season)
         history_estimate, score = self._calculate_season_history_mmr_estimate(
             date, history_by_season, stats
         )
@@ -119,27 +180,31 @@ class MMREstimateScorer:
         if history_estimate and history_estimate > 0:
             return history_estimate, score
 
-        all_pairs = itertools.chain(*[data for _, data in history_by_season])
         # This is the mmr at the closest date that we have to the game date.
-        _, closest_value = util.closest_date_value(
-            all_pairs, date
-        )
-
-        all_mmrs = [mmr for _, mmr in playlist_mmr_history]
+        closest_value = float(playlist_mmr_history.ratings[np.argmin(
+            np.abs(playlist_mmr_history.days - mmr.to_epoch_day(date))
+        )])
 
         if history_estimate is None or score < .15:
-            if len(playlist_mmr_history) > 0:
-                all_history_median = np.median(all_mmrs)
-                estimate = max(all_history_median, closest_value or 0)
-                # Make sure that the player has at least a reasonable number of
-                # games before using this estimate.
-                if player_data['stats']['wins'] > self._minimum_games_for_mmr(estimate):
-                    return estimate, .15
-                else:
-                    logger.warning(f"Skipping {player} because they don't have enough wins")
+            all_history_median = float(np.median(playlist_mmr_history.ratings))
+            estimate = max(all_history_median, closest_value or 0)
+            # Make sure that the player has at least a reasonable number of
+            # games before using this estimate.
+            if summary.wins is not None and (
+                    summary.wins > self._minimum_games_for_mmr(estimate)
+            ):
+                return estimate, .15
+            else:
+                logger.warning(f"Skipping {player} because they don't have enough wins")
 
         return (None, 0.0)
 
+    def _split_into_seasons(self, mmr_history):
+        history_by_season = mmr.split_mmr_history_arrays(
+            mmr_history, season_dates=self._season_dates
+        )
+        return history_by_season, mmr.calculate_all_season_statistics(history_by_season)
+
     def meta_download_filter(self, replay_meta, remove_below=0.0):
         score, _, _ = self.score_replay_meta(replay_meta)
         return score > remove_below
@@ -152,6 +217,7 @@ class MMREstimateScorer:
         )
         season_at_date = mmr.get_season_for_date(date, season_dates=self._season_dates)
         season_to_data_points = dict(history_by_season)
-        data_points_count = len(season_to_data_points.get(season_at_date, []))
+        season_history = season_to_data_points.get(season_at_date)
+        data_points_count = 0 if season_history is None else len(season_history.days)
         score = self._score_game_count(data_points_count)
         return calculator.get_mmr(date), score
@@ -1,15 +1,19 @@
 """Utilities for getting data from TrackerNetwork's public API."""
 import aiocurl
+import aiohttp
+import asyncio
 import backoff
 import cloudscraper
 import json
 import logging
 import requests
+import time
 
 from io import BytesIO
 from email.parser import BytesParser
 
 from . import metadata
+from . import proxy_pool as pp
 
 
 logger = logging.getLogger(__name__)
@@ -117,74 +121,318 @@ def combine_profile_and_mmr_json(data):
     }
 
 
-class CloudScraperTrackerNetwork:
-    """Use the cloudscraper library to perform requests to the tracker network."""
+def retry_after_seconds(headers):
+    """The number of seconds in the Retry-After header of a response, or None."""
+    string_value = headers.get('retry-after') or headers.get('Retry-After')
+    try:
+        return float(string_value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _archive_missing_player(response_archive, suffix, exception: Non200Exception):
+    # Only a 404 says something lasting about the player rather than the request.
+    if response_archive is not None and exception.status_code == 404:
+        response_archive.record(suffix, exception.status_code, b"")
 
-    def __init__(self, base_uri="https://api.tracker.gg", proxy_uris=(None,)):
+
+def build_scraper(proxy_uri=None):
+    """Make a cloudscraper session for requests to the tracker network through proxy_uri."""
+    scraper = cloudscraper.create_scraper(delay=1, browser="chrome")
+    if proxy_uri is not None:
+        scraper.proxies = {
+            "http": proxy_uri,
+            "https": proxy_uri,
+        }
+    scraper.headers.update({
+        'referer': "https://rocketleague.tracker.network",
+        'origin': "https://rocketleague.tracker.network",
+    })
+    return scraper
+
+
+class CloudScraperTrackerNetwork:
+    """Use the cloudscraper library to perform requests to the tracker network.
+
+    Requests are routed through the healthiest proxy of a
+    :py:class:`proxy_pool.ProxyPool`, and a request that fails with a 429,
+    403 or timeout is retried on another proxy when one is available. The
+    raw responses of each player fetch are recorded in `response_archive`
+    when it is provided.
+    """
+
+    def __init__(
+            self, base_uri="https://api.tracker.gg", proxy_uris=(None,), proxy_pool=None,
+            stats_log_interval=500, response_archive=None,
+    ):
         """Initialize this class."""
         if len(proxy_uris) < 1:
             proxy_uris = (None,)
         self._scrapers = [self._build_scraper(uri) for uri in proxy_uris]
         self._proxy_uris = proxy_uris
+        self._proxy_pool = pp.ProxyPool(proxy_uris) if proxy_pool is None else proxy_pool
+        # The index of the scraper that was used most recently.
         self._scraper_index = 0
         self._base_uri = base_uri
+        self._stats_log_interval = stats_log_interval
+        self._request_count = 0
+        self._response_archive = response_archive
 
     def _build_scraper(self, proxy_uri=None):
-        scraper = cloudscraper.create_scraper(delay=1, browser="chrome")
-        if proxy_uri is not None:
-            scraper.proxies = {
-                "http": proxy_uri,
-                "https": proxy_uri,
-            }
-        scraper.headers.update({
-            'referer': "https://rocketleague.tracker.network",
-            'origin': "https://rocketleague.tracker.network",
-        })
-        return scraper
-
-    def _next_scraper(self):
-        scraper = self._scrapers[self._scraper_index]
-        self._scraper_index = (self._scraper_index + 1) % len(self._scrapers)
-        return scraper
-
-    @property
-    def _scraper(self):
-        return self._next_scraper()
+        return build_scraper(proxy_uri)
 
     def refresh_scraper(self, offset=0):
-        """Make a new scraper."""
+        """Make a new scraper for the proxy used most recently, or the one offset from it."""
         index = (self._scraper_index + offset) % len(self._scrapers)
         self._scrapers[index] = self._build_scraper(self._proxy_uris[index])
 
+    def proxy_stats(self):
+        """The health of each proxy, see :py:meth:`proxy_pool.ProxyPool.stats`."""
+        return self._proxy_pool.stats()
+
     def __get(self, uri):
-        logger.debug(f"Cloud scraper request {uri}")
-        resp = self._next_scraper().get(uri, timeout=6)
+        index = self._proxy_pool.acquire()
+        self._scraper_index = index
+        self._request_count += 1
+        if self._request_count % self._stats_log_interval == 0:
+            self._proxy_pool.log_stats()
+        logger.debug(f"Cloud scraper request {uri} through {self._proxy_uris[index]}")
+        start = time.monotonic()
+        try:
+            resp = self._scrapers[index].get(uri, timeout=6)
+        except requests.exceptions.Timeout:
+            self._proxy_pool.record(index, pp.TIMEOUT, latency=time.monotonic() - start)
+            self.refresh_scraper()
+            raise
+        except requests.exceptions.RequestException:
+            self._proxy_pool.record(index, pp.ERROR)
+            raise
+        outcome = pp.outcome_for_status(resp.status_code)
+        self._proxy_pool.record(
+            index, outcome, latency=time.monotonic() - start,
+            retry_after=retry_after_seconds(resp.headers),
+        )
+        if outcome == pp.FORBIDDEN:
+            # A fresh scraper solves the cloudflare challenge again.
+            self.refresh_scraper()
         if resp.status_code != 200:
             raise Non200Exception(resp.status_code, resp.headers)
-        return resp.json()
+        return resp.content
 
     def _get(self, uri):
-        try:
-            return self.__get(uri)
-        except (requests.exceptions.Timeout, requests.exceptions.ReadTimeout):
-            logger.warn("Trying refreshing scraper after a timeout")
-            self.refresh_scraper(offset=-1)
-            return self.__get(uri)
+        return json.loads(self._get_body(uri))
+
+    def _get_body(self, uri):
+        # Rather than backing off, move on to another proxy while one is
+        # available. Timeouts are retried at least once, as they always were.
+        attempts = len(self._proxy_pool) + 1
+        for attempt in range(attempts):
+            try:
+                return self.__get(uri)
+            except Non200Exception as e:
+                if e.status_code not in (429, 403) or attempt + 1 == attempts or (
+                        self._proxy_pool.seconds_until_available() > 0
+                ):
+                    raise
+                logger.info(f"Retrying {uri} on another proxy after a {e.status_code}")
+            except requests.exceptions.Timeout:
+                if attempt + 1 == attempts:
+                    raise
+                logger.warn(f"Retrying {uri} on another proxy after a timeout")
 
     def get_player_data(self, player):
         """Combine info from the main player page and the mmr history player page."""
+        suffix = get_profile_suffix_for_player(player)
         uri = get_profile_uri_for_player(player)
-        profile_result = self._get(uri)
+        try:
+            profile_body = self._get_body(uri)
+        except Non200Exception as e:
+            _archive_missing_player(self._response_archive, suffix, e)
+            raise
+        profile_result = json.loads(profile_body)
         tracker_api_id = profile_result["data"]["metadata"]["playerId"]
 
         mmr_history_uri = get_mmr_history_uri_by_id(tracker_api_id)
-        mmr_result = self._get(mmr_history_uri)
+        mmr_body = self._get_body(mmr_history_uri)
+        if self._response_archive is not None:
+            self._response_archive.record(suffix, 200, profile_body, mmr_body)
+
+        return combine_profile_and_mmr_json({
+            "profile": profile_result,
+            "mmr": json.loads(mmr_body),
+        })
+
+
+class AsyncTrackerNetwork:
+    """Fetch player data from the tracker network with asyncio, many players at a time.
+
+    Each proxy in `proxy_uris` (None meaning a direct connection) gets its
+    own session, and at most `concurrency_per_proxy` requests are in flight
+    through it at once. Each request goes through the healthiest proxy of a
+    :py:class:`proxy_pool.ProxyPool`. Concurrent requests for the same
+    player share one fetch. Socks proxies require the aiohttp-socks package,
+    which is installed with the socks extra.
 
+    tracker.gg is behind a cloudflare challenge that plain aiohttp can not
+    solve, so before its first request through each proxy a cloudscraper
+    session requests `clearance_path` through that proxy, and the user agent
+    and cookies it ends up with are sent with every request through it. A
+    403 makes the next request through the proxy solve the challenge again.
+
+    The raw responses of each player fetch are recorded in
+    `response_archive` when it is provided. Use instances as an async
+    context manager so that their sessions are opened and closed in the
+    running event loop.
+    """
+
+    default_headers = {
+        'referer': "https://rocketleague.tracker.network",
+        'origin': "https://rocketleague.tracker.network",
+    }
+
+    def __init__(
+            self, base_uri=default_tracker_uri, proxy_uris=(None,), concurrency_per_proxy=4,
+            timeout=6, headers=None, proxy_pool=None, response_archive=None,
+            clearance_path="/",
+    ):
+        """Initialize this class."""
+        if len(proxy_uris) < 1:
+            proxy_uris = (None,)
+        self._base_uri = base_uri
+        self._proxy_uris = tuple(proxy_uris)
+        self._proxy_pool = pp.ProxyPool(proxy_uris) if proxy_pool is None else proxy_pool
+        self._concurrency_per_proxy = concurrency_per_proxy
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._headers = headers or self.default_headers
+        self._sessions = None
+        self._semaphores = None
+        self._in_flight = {}
+        self._response_archive = response_archive
+        self._clearance_path = clearance_path
+        self._clearances = [None for _ in self._proxy_uris]
+        self._clearance_locks = None
+
+    def _build_session(self, proxy_uri):
+        connector = None
+        if proxy_uri is not None and proxy_uri.startswith("socks"):
+            import aiohttp_socks
+            connector = aiohttp_socks.ProxyConnector.from_url(proxy_uri)
+        return aiohttp.ClientSession(
+            connector=connector, headers=self._headers, timeout=self._timeout
+        )
+
+    async def __aenter__(self):
+        self._sessions = [self._build_session(uri) for uri in self._proxy_uris]
+        self._semaphores = [
+            asyncio.Semaphore(self._concurrency_per_proxy) for _ in self._proxy_uris
+        ]
+        self._clearance_locks = [asyncio.Lock() for _ in self._proxy_uris]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.gather(*[session.close() for session in self._sessions])
+        self._sessions = None
+
+    def proxy_stats(self):
+        """The health of each proxy, see :py:meth:`proxy_pool.ProxyPool.stats`."""
+        return self._proxy_pool.stats()
+
+    def log_proxy_stats(self):
+        self._proxy_pool.log_stats()
+
+    def _solve_challenge(self, proxy_uri):
+        scraper = build_scraper(proxy_uri)
+        try:
+            scraper.get(f"{self._base_uri}{self._clearance_path}", timeout=30)
+        except Exception as e:
+            logger.warn(f"Could not solve the cloudflare challenge through {proxy_uri}: {e}")
+        clearance = {'user-agent': scraper.headers['User-Agent']}
+        if scraper.cookies:
+            clearance['cookie'] = "; ".join(
+                f"{cookie.name}={cookie.value}" for cookie in scraper.cookies
+            )
+        return clearance
+
+    async def _clearance(self, proxy_index):
+        """The headers that carry the cloudflare clearance of the proxy at proxy_index."""
+        async with self._clearance_locks[proxy_index]:
+            if self._clearances[proxy_index] is None:
+                self._clearances[proxy_index] = await asyncio.get_running_loop().run_in_executor(
+                    None, self._solve_challenge, self._proxy_uris[proxy_index]
+                )
+            return self._clearances[proxy_index]
+
+    async def _acquire_proxy(self):
+        while True:
+            index = self._proxy_pool.try_acquire()
+            if index is not None:
+                return index
+            await asyncio.sleep(max(self._proxy_pool.seconds_until_available(), .01))
+
+    async def _get(self, uri):
+        proxy_index = await self._acquire_proxy()
+        proxy_uri = self._proxy_uris[proxy_index]
+        # Socks proxies are handled by the connector of their session.
+        http_proxy = None if proxy_uri is None or proxy_uri.startswith("socks") else proxy_uri
+        logger.debug(f"Async request {uri} through {proxy_uri}")
+        outcome, retry_after, start = pp.ERROR, None, None
+        try:
+            clearance = await self._clearance(proxy_index)
+            async with self._semaphores[proxy_index]:
+                start = time.monotonic()
+                async with self._sessions[proxy_index].get(
+                        uri, proxy=http_proxy, headers=clearance
+                ) as resp:
+                    outcome = pp.outcome_for_status(resp.status)
+                    retry_after = retry_after_seconds(resp.headers)
+                    if outcome == pp.FORBIDDEN and self._clearances[proxy_index] is clearance:
+                        self._clearances[proxy_index] = None
+                    if resp.status != 200:
+                        raise Non200Exception(resp.status, dict(resp.headers))
+                    return await resp.read()
+        except asyncio.TimeoutError:
+            outcome = pp.TIMEOUT
+            raise
+        except asyncio.CancelledError:
+            outcome = None
+            raise
+        finally:
+            self._proxy_pool.record(
+                proxy_index, outcome, retry_after=retry_after,
+                latency=None if start is None else time.monotonic() - start,
+            )
+
+    async def _fetch_player_data(self, suffix):
+        try:
+            profile_body = await self._get(
+                get_profile_uri_for_player({"__tracker_suffix__": suffix}, base_uri=self._base_uri)
+            )
+        except Non200Exception as e:
+            _archive_missing_player(self._response_archive, suffix, e)
+            raise
+        profile_result = json.loads(profile_body)
+        tracker_api_id = profile_result["data"]["metadata"]["playerId"]
+        mmr_body = await self._get(
+            get_mmr_history_uri_by_id(tracker_api_id, base_uri=self._base_uri)
+        )
+        if self._response_archive is not None:
+            self._response_archive.record(suffix, 200, profile_body, mmr_body)
         return combine_profile_and_mmr_json({
             "profile": profile_result,
-            "mmr": mmr_result,
+            "mmr": json.loads(mmr_body),
         })
 
+    async def get_player_data(self, player):
+        """Combine info from the main player page and the mmr history player page."""
+        suffix = get_profile_suffix_for_player(player)
+        task = self._in_flight.get(suffix)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_player_data(suffix))
+            self._in_flight[suffix] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(suffix, None))
+        # Shielded so that one cancelled caller does not cancel the fetch for the others.
+        return await asyncio.shield(task)
+
 
 def _log_backoff(details):
     exception = details["exception"]
@@ -192,11 +440,10 @@ def _log_backoff(details):
 
 
 def _use_retry_after(exception: Non200Exception):
-    string_value = exception.response_headers.get('retry-after') or \
-        exception.response_headers.get('Retry-After')
-    if string_value is None:
+    seconds = retry_after_seconds(exception.response_headers)
+    if seconds is None:
         return 60
-    return int(string_value)
+    return seconds
 
 
 def get_player_data_with_429_retry(get_player_data=CloudScraperTrackerNetwork().get_player_data):
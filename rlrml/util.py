@@ -2,12 +2,15 @@ import argparse
 import boxcars_py
 import datetime
 import logging
+import numpy as np
 import os
+import torch
 
 from collections import deque
 
 from . import player_cache as pc
 from . import metadata
+from . import replay_index
 
 
 logger = logging.getLogger(__name__)
@@ -20,7 +23,12 @@ def _constant_retry(constant):
     return get_value
 
 
-def get_replay_uuids_in_directory(filepath, replay_extension="replay"):
+def get_replay_uuids_in_directory(filepath, replay_extension="replay", index_directory=None):
+    if index_directory is not None:
+        yield from replay_index.ReplayDirectoryIndex.for_directory(
+            filepath, index_directory, replay_extension=replay_extension
+        ).refresh().items()
+        return
     for root, _, files in os.walk(filepath):
         for filename in files:
             replay_id, extension = os.path.splitext(filename)
@@ -102,6 +110,16 @@ class ManualLinearScaler:
         self._data_range = self._data_max - self._data_min
         self._target_range = self._target_max - self._target_min
 
+    @property
+    def multiplier(self):
+        """The m in scale(x) = m * x + b."""
+        return self._target_range / self._data_range
+
+    @property
+    def offset(self):
+        """The b in scale(x) = m * x + b."""
+        return self._target_min - self._data_min * self.multiplier
+
     def scale_no_translate(self, value):
         return value * self._target_range / self._data_range
 
@@ -139,6 +157,14 @@ class RatioScaler:
     def __init__(self, ratio=2.0):
         self._ratio = ratio
 
+    @property
+    def multiplier(self):
+        return self._ratio
+
+    @property
+    def offset(self):
+        return 0.0
+
     def scale(self, value):
         proportion_to_max = (value - self._data_min) / (self._data_range)
         return proportion_to_max * self._target_range + self._target_min
@@ -159,6 +185,14 @@ default_position_scaler = RatioScaler(ratio=1.0 / 600.0)
 
 
 class ReplayPositionRescaler:
+    """Apply a linear scaler to every position column of replay tensors.
+
+    The scaler is expanded into a multiplier and an offset per column across
+    the full width of a frame, so that scaling is a single broadcast multiply
+    and add over the whole tensor. Both (frames, features) tensors and
+    batches of shape (batch, frames, features) are supported, as torch
+    tensors or numpy arrays.
+    """
 
     def __init__(self, column_headers, playlist, scaler=default_position_scaler):
         self._header_indices = [
@@ -177,9 +211,47 @@ class ReplayPositionRescaler:
         self._header_indices += all_player_indices
         self._scaler = scaler
 
+        width = global_header_count + playlist.player_count * player_header_count
+        self._multipliers = np.ones(width, dtype=np.float32)
+        self._offsets = np.zeros(width, dtype=np.float32)
+        self._multipliers[self._header_indices] = scaler.multiplier
+        self._offsets[self._header_indices] = scaler.offset
+        self._has_offset = bool(self._offsets.any())
+        self._torch_vectors = {}
+
+    @property
+    def multipliers(self):
+        return self._multipliers
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    def _vectors_like(self, tensor):
+        if isinstance(tensor, np.ndarray):
+            return (
+                self._multipliers.astype(tensor.dtype, copy=False),
+                self._offsets.astype(tensor.dtype, copy=False)
+            )
+        key = (tensor.dtype, tensor.device)
+        if key not in self._torch_vectors:
+            self._torch_vectors[key] = (
+                torch.as_tensor(self._multipliers).to(dtype=tensor.dtype, device=tensor.device),
+                torch.as_tensor(self._offsets).to(dtype=tensor.dtype, device=tensor.device),
+            )
+        return self._torch_vectors[key]
+
     def scale_position_columns(self, tensor):
-        for i in self._header_indices:
-            self._scaler.scale_column_in_place(tensor, i)
+        """Scale the position columns of tensor in place and return it."""
+        multipliers, offsets = self._vectors_like(tensor)
+        if isinstance(tensor, np.ndarray):
+            np.multiply(tensor, multipliers, out=tensor)
+            if self._has_offset:
+                np.add(tensor, offsets, out=tensor)
+        else:
+            tensor.mul_(multipliers)
+            if self._has_offset:
+                tensor.add_(offsets)
         return tensor
 
 
@@ -183,6 +183,7 @@ class FrontendManager:
                 "blacklisted": True,
             }
         )
+        self._builder.blacklisted_replays.add(uuid)
 
     def _calculate_loss(self):
         self._model.eval()
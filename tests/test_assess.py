@@ -0,0 +1,56 @@
+import datetime
+import pytest
+import torch
+
+pytest.importorskip("boxcars_py")
+
+from rlrml import cache_store  # noqa: E402
+from rlrml.assess import TensorCacheWarmer  # noqa: E402
+from rlrml.load import CachedReplaySet  # noqa: E402
+from rlrml.metadata import ReplayMeta, SteamPlayer  # noqa: E402
+
+
+def _meta():
+    return ReplayMeta(
+        datetime.datetime(2023, 1, 1),
+        [SteamPlayer("a", online_id="1")], [SteamPlayer("b", online_id="2")],
+    )
+
+
+class _ReplaySet:
+
+    def __init__(self, uuids):
+        self.uuids = uuids
+
+    def get_replay_uuids(self):
+        return self.uuids
+
+    def get_replay_tensor(self, uuid):
+        if uuid.startswith("bad"):
+            raise ValueError(uuid)
+        return torch.full((2, 3), float(len(uuid))), _meta()
+
+
+def test_warmer_parses_uncached_replays_and_reports_each_result(tmp_path):
+    uuids = ["cached", "new", "other", "bad"]
+    replay_set = CachedReplaySet(
+        _ReplaySet(uuids), str(tmp_path), ensure_bcf_arg_match=False,
+        tensor_store=cache_store.PickleTensorStore(str(tmp_path / "tensors")),
+    )
+    replay_set._save_to_cache("cached", torch.zeros(2, 3), _meta())
+    succeeded, failed = [], []
+
+    stats = TensorCacheWarmer(
+        replay_set, processes=2, max_in_flight=1,
+        on_success=succeeded.extend,
+        on_failure=lambda pairs: failed.extend((uuid, str(e)) for uuid, e in pairs),
+    ).warm()
+
+    assert (stats.parsed, stats.failed, stats.skipped) == (2, 1, 1)
+    assert sorted(succeeded) == ["new", "other"]
+    assert failed == [("bad", "bad")]
+    assert replay_set.get_replay_tensor("new")[0].tolist() == [[3.0] * 3] * 2
+
+    # A restarted run only retries what is still uncached.
+    stats = TensorCacheWarmer(replay_set, processes=2).warm()
+    assert (stats.parsed, stats.failed, stats.skipped) == (0, 1, 3)
@@ -0,0 +1,58 @@
+import pytest
+import torch
+
+pytest.importorskip("boxcars_py")
+
+from rlrml.model import build  # noqa: E402
+from rlrml.playlist import Playlist  # noqa: E402
+
+
+header_info = {"global_headers": ["a", "b"], "player_headers": ["c"]}
+
+
+def _model(**kwargs):
+    torch.manual_seed(0)
+    model = build.ReplayModel(
+        header_info, Playlist.DOUBLES, lstm_width=8, lstm_depth=2, dropout=0.0,
+        packed_sequences=True, **kwargs
+    )
+    return model.eval()
+
+
+def test_packed_forward_ignores_padding():
+    model = _model(evaluation_start=5, evaluation_split_width=3)
+    short, long = torch.randn(9, 6), torch.randn(20, 6)
+    X = torch.nn.utils.rnn.pad_sequence([short, long], batch_first=True)
+
+    batched = model(X, lengths=torch.tensor([9, 20]))
+    alone = model(short.unsqueeze(0), lengths=torch.tensor([9]))
+
+    assert torch.allclose(batched[0], alone[0], atol=1e-6)
+
+
+def test_samples_shorter_than_evaluation_start_use_their_last_frame():
+    model = _model(evaluation_start=50, evaluation_split_width=10)
+    X = torch.randn(1, 12, 6)
+
+    output = model(X, lengths=torch.tensor([12]))
+    expected = model._linear(model.get_lstm_out(X)[:, 11])
+
+    assert torch.allclose(output, expected, atol=1e-6)
+
+
+def test_feature_normalization_is_frozen_and_saved():
+    from rlrml.feature_stats import FeatureStatistics
+
+    X = torch.randn(2, 15, 6) * 50 + 300
+    statistics = FeatureStatistics().update(X.reshape(-1, 6).numpy())
+    model = _model(feature_statistics=statistics)
+    plain = _model()
+
+    normalized = (X - torch.as_tensor(statistics.mean, dtype=torch.float32)) / torch.as_tensor(
+        statistics.std, dtype=torch.float32
+    )
+    lengths = torch.tensor([15, 15])
+
+    assert torch.allclose(model(X, lengths=lengths), plain(normalized, lengths=lengths), atol=1e-5)
+    assert "normalization.mean" in model.state_dict()
+    assert all(not name.startswith("normalization") for name, _ in model.named_parameters())
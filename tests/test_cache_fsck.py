@@ -0,0 +1,73 @@
+import datetime
+import os
+import torch
+
+from rlrml import cache_fsck
+from rlrml import cache_store
+from rlrml import replay_meta_db
+from rlrml.metadata import ReplayMeta, SteamPlayer
+
+
+def _meta():
+    return ReplayMeta(
+        datetime.datetime(2023, 1, 1, 12, 0),
+        [SteamPlayer("a", online_id="1")], [SteamPlayer("b", online_id="2")],
+    )
+
+
+def _damaged_cache(tmp_path):
+    tensor_store = cache_store.PickleTensorStore(str(tmp_path / "tensors"))
+    meta_store = replay_meta_db.ReplayMetaDB(str(tmp_path / "metas"))
+    for uuid in ("good", "truncated", "orphan"):
+        tensor_store.put(uuid, torch.ones(5, 3))
+    for uuid in ("good", "truncated", "uncached"):
+        meta_store.put(uuid, _meta())
+    with open(tensor_store.path("truncated"), 'r+b') as f:
+        f.truncate(10)
+    return tensor_store, meta_store
+
+
+def test_fsck_reports_without_repairing(tmp_path):
+    tensor_store, meta_store = _damaged_cache(tmp_path)
+
+    report = cache_fsck.fsck_cache(tensor_store, meta_store, processes=2)
+
+    assert report == cache_fsck.FsckReport(
+        checked=3, unreadable=1, orphaned=1, rebuilt=0, deleted=0, metas_without_tensors=1
+    )
+    assert set(tensor_store.uuids()) == {"good", "truncated", "orphan"}
+
+
+def test_fsck_repairs_and_compacts(tmp_path):
+    tensor_store, meta_store = _damaged_cache(tmp_path)
+    stale_temporary = tensor_store.path("good") + ".123.tmp"
+    with open(stale_temporary, 'wb') as f:
+        f.write(b"partial")
+    os.utime(stale_temporary, (0, 0))
+
+    report = cache_fsck.fsck_cache(
+        tensor_store, meta_store, repair=True, compact=True, processes=2
+    )
+
+    assert (report.deleted, report.rebuilt) == (2, 0)
+    assert set(tensor_store.uuids()) == {"good"}
+    assert set(meta_store.uuids()) == {"good", "truncated", "uncached"}
+    assert tensor_store.get_lengths(["good", "truncated", "orphan"]) == {"good": 5}
+    assert not os.path.exists(stale_temporary)
+
+
+def test_fsck_rebuilds_missing_metas(tmp_path):
+    tensor_store, meta_store = _damaged_cache(tmp_path)
+
+    def rebuild_meta(uuid):
+        meta = _meta()
+        meta_store.put(uuid, meta)
+        return meta
+
+    report = cache_fsck.fsck_cache(
+        tensor_store, meta_store, repair=True, rebuild_meta=rebuild_meta, processes=2
+    )
+
+    assert (report.deleted, report.rebuilt) == (1, 1)
+    assert meta_store.contains("orphan")
+    assert set(tensor_store.uuids()) == {"good", "orphan"}
@@ -0,0 +1,121 @@
+import os
+import pytest
+import torch
+
+from rlrml import cache_store
+
+
+def test_packed_tensor_store_round_trip(tmp_path):
+    store = cache_store.PackedTensorStore(str(tmp_path), shard_size=1024)
+    tensors = {
+        f"uuid-{i}": torch.arange(i * 30, dtype=torch.float32).reshape(i * 3, 10)
+        for i in range(1, 6)
+    }
+    for uuid, tensor in tensors.items():
+        store.put(uuid, tensor)
+
+    reopened = cache_store.PackedTensorStore(str(tmp_path), shard_size=1024)
+    for uuid, tensor in tensors.items():
+        assert reopened.contains(uuid)
+        assert torch.equal(reopened.get(uuid), tensor)
+
+    assert set(reopened.uuids()) == set(tensors)
+    assert len(reopened._shard_numbers()) > 1
+
+
+def test_packed_tensor_store_reads_are_independent(tmp_path):
+    store = cache_store.PackedTensorStore(str(tmp_path))
+    store.put("a", torch.ones(4, 3))
+
+    store.get("a").add_(5)
+
+    assert torch.equal(store.get("a"), torch.ones(4, 3))
+
+
+def test_packed_tensor_store_delete(tmp_path):
+    store = cache_store.PackedTensorStore(str(tmp_path))
+    store.put("a", torch.ones(4, 3))
+    store.delete("a")
+
+    assert not store.contains("a")
+    assert store.get("a") is None
+
+
+def test_packed_storage_order_follows_shards(tmp_path):
+    store = cache_store.PackedTensorStore(str(tmp_path / "packed"))
+    for uuid in ["c", "a", "b"]:
+        store.put(uuid, torch.zeros((2, 3)))
+
+    assert store.storage_order(["a", "missing", "b", "c"]) == ["c", "a", "b", "missing"]
+
+
+def test_downsampled_tensor_store(tmp_path):
+    source = cache_store.PackedTensorStore(str(tmp_path / "packed"))
+    source.put("a", torch.arange(14, dtype=torch.float32).reshape(7, 2))
+
+    strided = cache_store.DownsampledTensorStore(source, 3)
+    assert strided.get("a").tolist() == [[0.0, 1.0], [6.0, 7.0], [12.0, 13.0]]
+    assert strided.get_lengths(["a"]) == {"a": 3}
+
+    pooled = cache_store.DownsampledTensorStore(source, 3, mode="mean")
+    assert pooled.get("a").tolist() == [[2.0, 3.0], [8.0, 9.0], [12.0, 13.0]]
+    assert pooled.get("missing") is None
+
+    with pytest.raises(TypeError):
+        strided.put("b", torch.zeros((3, 2)))
+    with pytest.raises(TypeError):
+        strided.delete("a")
+    assert source.contains("a") and not source.contains("b")
+
+
+def test_packed_tensor_store_compaction_drops_deleted_tensors(tmp_path):
+    directory = str(tmp_path / "packed")
+    store = cache_store.PackedTensorStore(directory, shard_size=1024)
+    tensors = {f"uuid-{i}": torch.full((i + 2, 8), float(i)) for i in range(6)}
+    for uuid, tensor in tensors.items():
+        store.put(uuid, tensor)
+    for uuid in ("uuid-1", "uuid-4"):
+        store.delete(uuid)
+        del tensors[uuid]
+    size_before = sum(
+        os.path.getsize(store._shard_path(number)) for number in store._shard_numbers()
+    )
+
+    store.compact()
+
+    size_after = sum(
+        os.path.getsize(store._shard_path(number)) for number in store._shard_numbers()
+    )
+    assert size_after < size_before
+    assert set(store.uuids()) == set(tensors)
+    for uuid, tensor in tensors.items():
+        assert torch.equal(store.get(uuid), tensor)
+    assert os.listdir(tmp_path) == ["packed"]
+
+
+def test_pickle_tensor_store_fans_out_by_uuid_prefix(tmp_path):
+    store = cache_store.PickleTensorStore(str(tmp_path))
+    store.put("abcdef", torch.ones(2, 3))
+    store.put("abzzzz", torch.ones(4, 3))
+    store.put("cd0000", torch.ones(1, 3))
+
+    assert os.path.exists(tmp_path / "ab" / "abcdef.pt")
+    assert set(store.uuids()) == {"abcdef", "abzzzz", "cd0000"}
+    assert torch.equal(cache_store.PickleTensorStore(str(tmp_path)).get("abzzzz"), torch.ones(4, 3))
+
+
+def test_flat_directories_are_migrated_in_place(tmp_path):
+    torch.save(torch.ones(2, 3), str(tmp_path / "abcdef.pt"))
+    (tmp_path / "abcdef.replay_meta").write_text("{}")
+
+    store = cache_store.PickleTensorStore(str(tmp_path))
+    assert store.path("abcdef") == str(tmp_path / "abcdef.pt")
+    assert torch.equal(store.get("abcdef"), torch.ones(2, 3))
+
+    assert store.migrate_layout() == 1
+    assert store.migrate_layout() == 0
+    assert os.path.exists(tmp_path / "abcdef.replay_meta")
+    reopened = cache_store.PickleTensorStore(str(tmp_path))
+    assert reopened.path("abcdef") == str(tmp_path / "ab" / "abcdef.pt")
+    assert list(reopened.uuids()) == ["abcdef"]
+    assert torch.equal(reopened.get("abcdef"), torch.ones(2, 3))
@@ -0,0 +1,76 @@
+import json
+import os
+
+from rlrml import cache_variants
+
+
+def test_variant_key_is_canonical():
+    assert cache_variants.variant_key({"fps": 10, "a": [1]}) == (
+        cache_variants.variant_key({"a": [1], "fps": 10})
+    )
+    assert cache_variants.variant_key({"fps": 10}) != cache_variants.variant_key({"fps": 30})
+
+
+def test_variants_live_side_by_side(tmp_path):
+    variants = cache_variants.TensorCacheVariants(str(tmp_path))
+    ten = variants.directory_for({"fps": 10})
+    thirty = variants.directory_for({"fps": 30})
+    with open(os.path.join(ten, "a.pt"), 'wb') as f:
+        f.write(b"x" * 100)
+
+    described = {variant.key: variant for variant in variants.variants()}
+    assert described[cache_variants.variant_key({"fps": 10})].size >= 100
+    assert described[cache_variants.variant_key({"fps": 30})].boxcar_frames_arguments == {
+        "fps": 30
+    }
+
+    variants.remove(cache_variants.variant_key({"fps": 10}))
+    assert not os.path.exists(ten)
+    assert os.path.exists(thirty)
+
+
+def test_legacy_cache_is_moved_into_its_variant(tmp_path):
+    with open(tmp_path / ".boxcars_frames_arguments", 'w') as f:
+        f.write(json.dumps({"fps": 10}))
+    (tmp_path / "a.pt").write_bytes(b"tensor")
+    (tmp_path / "a.replay_meta").write_text("{}")
+
+    variants = cache_variants.TensorCacheVariants(str(tmp_path))
+    key = variants.migrate_legacy_cache()
+
+    directory = variants.variant_directory(key)
+    assert key == cache_variants.variant_key({"fps": 10})
+    assert os.path.exists(os.path.join(directory, "a.pt"))
+    assert os.path.exists(tmp_path / "a.replay_meta")
+    assert not os.path.exists(tmp_path / "a.pt")
+    assert variants.migrate_legacy_cache() is None
+
+
+def test_frame_rate_sources_are_integer_multiples(tmp_path):
+    variants = cache_variants.TensorCacheVariants(str(tmp_path))
+    for arguments in [
+            {"fps": 30, "adders": ["a"]}, {"fps": 20, "adders": ["a"]},
+            {"fps": 25, "adders": ["a"]}, {"fps": 30, "adders": ["b"]},
+    ]:
+        variants.directory_for(arguments)
+
+    sources = variants.frame_rate_sources({"fps": 10, "adders": ["a"]})
+
+    assert [(factor, variant.boxcar_frames_arguments["fps"]) for factor, variant in sources] == [
+        (2, 20), (3, 30)
+    ]
+
+
+def test_legacy_migration_leaves_fanned_out_metas_in_place(tmp_path):
+    with open(tmp_path / ".boxcars_frames_arguments", 'w') as f:
+        f.write(json.dumps({"fps": 10}))
+    (tmp_path / "ab").mkdir()
+    (tmp_path / "ab" / "abcd.pt").write_bytes(b"tensor")
+    (tmp_path / "ab" / "abcd.replay_meta").write_text("{}")
+
+    variants = cache_variants.TensorCacheVariants(str(tmp_path))
+    directory = variants.variant_directory(variants.migrate_legacy_cache())
+
+    assert os.path.exists(os.path.join(directory, "ab", "abcd.pt"))
+    assert os.path.exists(tmp_path / "ab" / "abcd.replay_meta")
+    assert not os.path.exists(tmp_path / "ab" / "abcd.pt")
@@ -0,0 +1,43 @@
+import numpy as np
+import torch
+
+from rlrml import cache_store
+from rlrml import feature_stats
+
+
+def test_parallel_statistics_match_numpy(tmp_path):
+    store = cache_store.PackedTensorStore(str(tmp_path))
+    generator = torch.Generator().manual_seed(0)
+    tensors = [
+        torch.randn(length, 4, generator=generator) * 100 + 1000
+        for length in (5, 17, 1, 40, 9, 23)
+    ]
+    for index, tensor in enumerate(tensors):
+        store.put(f"uuid-{index}", tensor)
+    frames = torch.cat(tensors).double().numpy()
+
+    statistics = feature_stats.compute_feature_statistics(store, processes=3)
+
+    assert statistics.count == len(frames)
+    assert np.allclose(statistics.mean, frames.mean(axis=0))
+    assert np.allclose(statistics.std, frames.std(axis=0))
+    assert np.allclose(statistics.minimum, frames.min(axis=0))
+    assert np.allclose(statistics.maximum, frames.max(axis=0))
+
+    path = str(tmp_path / feature_stats.FEATURE_STATISTICS_FILENAME)
+    statistics.save(path)
+    assert np.allclose(feature_stats.FeatureStatistics.load(path).std, statistics.std)
+
+
+def test_linearly_transformed_statistics():
+    frames = np.array([[1.0, 2.0], [3.0, -4.0], [5.0, 0.0]])
+    statistics = feature_stats.FeatureStatistics().update(frames)
+    multipliers, offsets = np.array([2.0, -0.5]), np.array([1.0, 0.0])
+
+    transformed = statistics.linearly_transformed(multipliers, offsets)
+    expected = feature_stats.FeatureStatistics().update(frames * multipliers + offsets)
+
+    assert np.allclose(transformed.mean, expected.mean)
+    assert np.allclose(transformed.std, expected.std)
+    assert np.allclose(transformed.minimum, expected.minimum)
+    assert np.allclose(transformed.maximum, expected.maximum)
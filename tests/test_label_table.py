@@ -0,0 +1,84 @@
+import datetime
+
+from rlrml import label_table
+from rlrml import player_cache as pc
+from rlrml.metadata import ReplayMeta, SteamPlayer
+
+
+def _meta(prefix, first_id=1):
+    players = [
+        SteamPlayer(f"{prefix}{name}", online_id=str(first_id + index))
+        for index, name in enumerate("abcd")
+    ]
+    return ReplayMeta(datetime.datetime(2023, 1, 1, 12, 0), players[:2], players[2:])
+
+
+def _lookup_label(player, _date):
+    return None if player.name.endswith("d") else float(len(player.name))
+
+
+class _Scorer:
+
+    def parameter_fingerprint(self):
+        return "fingerprint"
+
+
+def _no_summaries(players):
+    return [None] * len(players)
+
+
+def test_build_and_read_label_table(tmp_path):
+    table = label_table.LabelTable(str(tmp_path / "labels"), "v1", _no_summaries)
+    metas = [("one", _meta("x")), ("two", _meta("yy"))]
+
+    def label_functions():
+        return _lookup_label, _no_summaries
+
+    stats = label_table.build_label_table(
+        table, metas, label_functions, 4, processes=2, chunk_size=1
+    )
+
+    assert (stats.built, stats.failed, stats.skipped) == (2, 0, 0)
+    assert table.get("one", list(_meta("x").player_order)) == [2.0, 2.0, 2.0, None]
+    assert table.get("two", list(_meta("yy").player_order)) == [3.0, 3.0, 3.0, None]
+
+    stats = label_table.build_label_table(table, metas, label_functions, 4)
+    assert (stats.built, stats.skipped) == (0, 2)
+
+
+def test_stale_table_is_ignored(tmp_path):
+    players = list(_meta("x").player_order)
+    table = label_table.LabelTable(str(tmp_path / "labels"), "v1", _no_summaries)
+    table.reset()
+    table.put_many([("one", [1.0, 2.0, None, 4.0], table.fingerprint(players))])
+    assert table.get("one", players) == [1.0, 2.0, None, 4.0]
+
+    stale = label_table.LabelTable(str(tmp_path / "labels"), "v2", _no_summaries)
+    assert stale.get("one", players) is None
+
+    label_table.build_label_table(stale, [], lambda: (_lookup_label, _no_summaries), 4)
+    assert list(stale.uuids()) == []
+
+
+def test_version_does_not_depend_on_the_player_cache():
+    version = label_table.label_table_version(_Scorer(), "Ranked Doubles 2v2")
+
+    assert version == label_table.label_table_version(_Scorer(), "Ranked Doubles 2v2")
+    assert version != label_table.label_table_version(_Scorer(), "Ranked Standard 3v3")
+
+
+def test_rows_follow_writes_to_their_players_only(tmp_path):
+    cache = pc.PlayerCache.lmdb(str(tmp_path / "players"))
+    table = label_table.LabelTable(str(tmp_path / "labels"), "v1", cache.get_player_summaries)
+    table.reset()
+    metas = {"one": _meta("x"), "two": _meta("y", first_id=5)}
+    table.put_many([
+        (uuid, [1.0, 2.0, None, 4.0], table.fingerprint(meta.player_order))
+        for uuid, meta in metas.items()
+    ])
+
+    cache.insert_data_for_player(list(metas["one"].player_order)[3], {"mmr_history": {}})
+    cache.insert_manual_override(SteamPlayer("unrelated", online_id="9"), 1000)
+
+    assert table.get("one", metas["one"].player_order) is None
+    assert table.get("two", metas["two"].player_order) == [1.0, 2.0, None, 4.0]
@@ -0,0 +1,208 @@
+import pytest
+import torch
+
+pytest.importorskip("boxcars_py")
+
+from rlrml.load import ResidentTensorCache  # noqa: E402
+
+
+def _tensors():
+    return {f"u{i}": (torch.full((10 + i, 3), float(i)), f"meta{i}") for i in range(5)}
+
+
+def test_preload_fills_shared_arena_up_to_budget():
+    tensors = _tensors()
+    cache = ResidentTensorCache(preload_bytes=4 * 3 * (10 + 11 + 12))
+    cache.preload(
+        list(tensors), lambda uuid: tensors[uuid],
+        {uuid: tensor.shape[0] for uuid, (tensor, _) in tensors.items()}
+    )
+
+    assert all(f"u{i}" in cache for i in range(3))
+    assert "u3" not in cache
+    tensor, meta = cache.get("u1")
+    assert tensor.is_shared()
+    assert torch.equal(tensor, tensors["u1"][0])
+    assert meta == "meta1"
+
+
+def test_lru_evicts_least_recently_used():
+    tensors = _tensors()
+    cache = ResidentTensorCache(lru_bytes=4 * 3 * 27)
+    cache.put("u3", *tensors["u3"])
+    cache.put("u4", *tensors["u4"])
+    assert "u3" in cache and "u4" in cache
+
+    cache.get("u3")
+    cache.put("u0", *tensors["u0"])
+
+    assert "u3" in cache and "u0" in cache
+    assert "u4" not in cache
+
+
+class _FailingReplaySet:
+
+    def __init__(self, uuids):
+        self.uuids = uuids
+        self.loads = []
+
+    def get_replay_uuids(self):
+        return self.uuids
+
+    def get_replay_tensor(self, uuid):
+        self.loads.append(uuid)
+        if uuid.startswith("io"):
+            raise OSError(uuid)
+        raise ValueError(uuid)
+
+
+def test_dataset_excludes_and_records_failed_replays():
+    from rlrml.load import ReplayDataset
+    from rlrml.playlist import Playlist
+
+    replay_set = _FailingReplaySet(["known_bad", "new_bad"])
+    recorded = []
+    dataset = ReplayDataset(
+        replay_set, None, Playlist("Ranked Doubles 2v2"), None,
+        exclude_uuids={"known_bad"},
+        on_load_error=lambda uuid, e: recorded.append((uuid, type(e)))
+    )
+    dataset.random_game = lambda: None
+
+    assert len(dataset) == 1
+    dataset[0]
+    dataset[0]
+
+    assert recorded == [("new_bad", ValueError)]
+    assert replay_set.loads == ["new_bad"]
+
+
+def test_dataset_skips_transient_failures_without_recording_them():
+    from rlrml.load import ReplayDataset
+    from rlrml.playlist import Playlist
+
+    replay_set = _FailingReplaySet(["io_error"])
+    recorded = []
+    dataset = ReplayDataset(
+        replay_set, None, Playlist("Ranked Doubles 2v2"), None,
+        on_load_error=lambda uuid, e: recorded.append(uuid)
+    )
+
+    assert dataset.get_by_uuid("io_error") is None
+    assert dataset.get_by_uuid("io_error") is None
+    assert recorded == []
+    assert replay_set.loads == ["io_error"]
+
+
+def test_labels_missing_from_the_label_table_are_looked_up(tmp_path):
+    import datetime
+    from rlrml.label_table import LabelTable
+    from rlrml.load import ReplayDataset
+    from rlrml.metadata import ReplayMeta, SteamPlayer
+    from rlrml.playlist import Playlist
+    from rlrml.util import HorribleHackScaler
+
+    players = [SteamPlayer(name, online_id=str(i)) for i, name in enumerate("abcd")]
+    meta = ReplayMeta(datetime.datetime(2023, 1, 1), players[:2], players[2:])
+    table = LabelTable(str(tmp_path), "v1", lambda players: [None] * len(players))
+    table.reset()
+    table.put_many([("one", [1000.0, None, 1200.0, None], table.fingerprint(players))])
+    looked_up = []
+
+    def lookup_label(player, _date):
+        looked_up.append(player.name)
+        return None if player.name == "d" else 1100.0
+
+    dataset = ReplayDataset(
+        _FailingReplaySet([]), lookup_label, Playlist("Ranked Doubles 2v2"), None,
+        label_table=table,
+    )
+    labels, mask = dataset._get_replay_labels("one", meta)
+
+    assert looked_up == ["b", "d"]
+    assert mask.tolist() == [1.0, 1.0, 1.0, 0.0]
+    assert labels.tolist()[:3] == [
+        HorribleHackScaler.scale(label) for label in (1000.0, 1100.0, 1200.0)
+    ]
+
+
+class _UuidDataset:
+
+    def __init__(self, uuids):
+        self._uuids = uuids
+
+    def storage_order(self):
+        return list(self._uuids)
+
+    def get_by_uuid(self, uuid):
+        return uuid
+
+
+def test_stream_readers_partition_each_epoch():
+    from rlrml.load import ReplayStreamDataset
+
+    uuids = [f"u{i:03d}" for i in range(103)]
+    stream = ReplayStreamDataset(
+        _UuidDataset(uuids), shuffle_buffer_size=8, block_size=4, rank=0, world_size=1
+    )
+
+    orders = []
+    for epoch in range(2):
+        stream.set_epoch(epoch)
+        read = [stream.reader_uuids(reader, 3) for reader in range(3)]
+        assert sorted(sum(read, [])) == uuids
+        orders.append(read)
+    assert orders[0] != orders[1]
+
+    stream.set_epoch(0)
+    assert sorted(stream) == uuids
+
+
+def test_stream_data_loader_workers_do_not_duplicate():
+    import torch
+    from rlrml.load import ReplayStreamDataset
+
+    uuids = [f"u{i:03d}" for i in range(50)]
+    seen = []
+    for rank in range(2):
+        stream = ReplayStreamDataset(
+            _UuidDataset(uuids), shuffle_buffer_size=4, block_size=3, rank=rank, world_size=2
+        )
+        loader = torch.utils.data.DataLoader(
+            stream, batch_size=None, num_workers=2, multiprocessing_context="fork"
+        )
+        seen.extend(loader)
+    assert sorted(seen) == uuids
+
+
+def test_cached_replay_set_serves_from_fallback_store(tmp_path):
+    from rlrml import cache_store
+    from rlrml.load import CachedReplaySet
+
+    class _Metas(cache_store.JSONDirectoryMetaStore):
+        def get(self, uuid):
+            return "meta"
+
+        def contains(self, uuid):
+            return True
+
+    source = cache_store.PickleTensorStore(str(tmp_path / "30fps"))
+    source.put("a", torch.arange(6, dtype=torch.float32).reshape(6, 1))
+    target = cache_store.PickleTensorStore(str(tmp_path / "10fps"))
+
+    def make_replay_set(persist):
+        return CachedReplaySet(
+            _FailingReplaySet(["a"]), str(tmp_path / "10fps"), tensor_store=target,
+            meta_store=_Metas(str(tmp_path)), ensure_bcf_arg_match=False,
+            fallback_tensor_store=cache_store.DownsampledTensorStore(source, 3),
+            persist_fallback=persist,
+        )
+
+    replay_set = make_replay_set(False)
+    assert replay_set.get_replay_lengths(["a"]) == {"a": 2}
+    tensor, _ = replay_set.get_replay_tensor("a")
+    assert tensor.flatten().tolist() == [0.0, 3.0]
+    assert not target.contains("a")
+
+    make_replay_set(True).get_replay_tensor("a")
+    assert target.get("a").flatten().tolist() == [0.0, 3.0]
@@ -0,0 +1,51 @@
+import datetime
+import random
+
+from rlrml import mmr
+
+
+def _tracker_history(seed, count):
+    generator = random.Random(seed)
+    start = datetime.datetime(2020, 6, 1, tzinfo=datetime.timezone.utc)
+    return [
+        (
+            (start + datetime.timedelta(hours=generator.randint(0, 24 * 1200))).isoformat(),
+            generator.randint(100, 2000)
+        )
+        for _ in range(count)
+    ]
+
+
+def test_array_split_matches_pair_split():
+    for seed in range(50):
+        history = _tracker_history(seed, seed * 2)
+        for season_dates in (mmr.SEASON_DATES, mmr.TIGHTENED_SEASON_DATES):
+            pairs = mmr.split_mmr_history_into_seasons(history, season_dates=season_dates)
+            arrays = mmr.split_mmr_history_arrays(
+                mmr.mmr_history_arrays(history), season_dates=season_dates
+            )
+
+            assert [label for label, _ in arrays] == [label for label, _ in pairs]
+            for (_, segment), (_, pair_segment) in zip(arrays, pairs):
+                assert segment.ratings.tolist() == [rating for _, rating in pair_segment]
+                assert [mmr.from_epoch_day(day) for day in segment.days] == [
+                    date.date() for date, _ in pair_segment
+                ]
+
+
+def test_split_labels_between_and_after_seasons():
+    season_dates = [
+        (1, (datetime.date(2021, 1, 10), datetime.date(2021, 1, 20))),
+        (2, (datetime.date(2021, 2, 1), datetime.date(2021, 2, 10))),
+    ]
+    history = mmr.mmr_history_arrays([
+        ("2021-01-05T00:00:00", 1), ("2021-01-15T00:00:00", 2),
+        ("2021-01-25T00:00:00", 3), ("2021-02-05T00:00:00", 4),
+        ("2021-03-01T00:00:00", 5),
+    ])
+
+    segments = mmr.split_mmr_history_arrays(history, season_dates=season_dates)
+
+    assert [(label, segment.ratings.tolist()) for label, segment in segments] == [
+        (.5, [1.0]), (1, [2.0]), (1.5, [3.0]), (2, [4.0]), (2.5, [5.0])
+    ]
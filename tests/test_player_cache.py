@@ -0,0 +1,208 @@
+import multiprocessing
+import pytest
+
+from rlrml import player_cache as pc
+
+
+def _player_data(rating):
+    return {
+        "platform": {"platformSlug": "steam", "platformUserId": "1"},
+        "stats": {"Wins": 10.0},
+        "mmr_history": {"Ranked Doubles 2v2": [["2023-01-01T00:00:00+00:00", rating]]},
+    }
+
+
+@pytest.mark.parametrize("codec", list(pc.codecs.values()), ids=list(pc.codecs))
+def test_codecs_round_trip(codec):
+    encoded = codec.encode(_player_data(1000))
+
+    assert all(
+        other.can_decode(encoded) == (other is codec) for other in pc.codecs.values()
+    )
+    decoded = pc.decode_value(encoded)
+    assert decoded["stats"] == {"Wins": 10.0}
+    assert [list(item) for item in decoded["mmr_history"]["Ranked Doubles 2v2"]] == [
+        ["2023-01-01T00:00:00+00:00", 1000]
+    ]
+
+
+def test_values_of_unknown_codecs_are_not_treated_as_missing():
+    with pytest.raises(ValueError):
+        pc.decode_value(b"\x00\x7fnot a known codec")
+
+
+def test_json_rows_are_read_and_reencoded(tmp_path):
+    json_cache = pc.PlayerCache.lmdb(str(tmp_path), codec=pc.codecs["json"])
+    for suffix, rating in (("steam/1", 1000), ("epic/a", 1200)):
+        json_cache.insert_data_for_player(
+            {"__tracker_suffix__": suffix.encode()}, _player_data(rating)
+        )
+    json_cache._db._env.close()
+
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path))
+    assert player_cache.get_player_data({"__tracker_suffix__": b"epic/a"})["stats"] == {
+        "Wins": 10.0
+    }
+
+    assert player_cache.reencode(batch_size=1) == 2
+    assert player_cache.reencode() == 0
+    for _, value in player_cache._db.iterator():
+        assert pc.default_codec.can_decode(value)
+    assert dict(player_cache)["steam/1"]["mmr_history"]["Ranked Doubles 2v2"][0][1] == 1000
+
+
+def test_player_summaries_are_kept_with_the_data(tmp_path):
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path))
+    player = {"__tracker_suffix__": b"steam/1"}
+    data = _player_data(1000)
+    data["stats"]["wins"] = 12
+    player_cache.insert_data_for_player(player, data)
+
+    summary = player_cache.get_player_summary(player)
+
+    assert (summary.error, summary.has_manual_override, summary.wins) == (None, False, 12)
+    history = summary.mmr_histories["Ranked Doubles 2v2"]
+    assert history.days.tolist() == [19358]
+    assert history.ratings.tolist() == [1000.0]
+
+    player_cache.insert_manual_override(player, 1500)
+    summary = player_cache.get_player_summary(player)
+    assert (summary.has_manual_override, summary.manual_override) == (True, 1500)
+
+    player_cache.insert_error_for_player(player, {"type": "404"})
+    assert player_cache.get_player_summary(player).error == {"type": "404"}
+    assert player_cache.get_player_summary({"__tracker_suffix__": b"steam/2"}) is None
+
+
+def test_get_many_and_put_many_keep_the_order_of_players(tmp_path):
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path))
+    players = [{"__tracker_suffix__": f"steam/{i}".encode()} for i in range(3)]
+    player_cache.put_many([(players[0], _player_data(1000)), (players[2], _player_data(1200))])
+
+    data = player_cache.get_many(players)
+    summaries = player_cache.get_player_summaries(players)
+
+    assert [d and d["mmr_history"]["Ranked Doubles 2v2"][0][1] for d in data] == [
+        1000, None, 1200
+    ]
+    assert [s and s.mmr_histories["Ranked Doubles 2v2"].ratings.tolist() for s in summaries] == [
+        [1000.0], None, [1200.0]
+    ]
+
+
+def test_decoded_players_are_kept_in_memory_until_written(tmp_path):
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path), summary_lru_size=2)
+    players = [{"__tracker_suffix__": f"steam/{i}".encode()} for i in range(3)]
+    player_cache.put_many([(player, _player_data(1000)) for player in players])
+
+    summary = player_cache.get_player_summary(players[0])
+    assert player_cache.get_player_summaries(players[:1]) == [summary]
+    assert player_cache.get_player_summary(players[0]) is summary
+    assert player_cache.lru_stats()["summaries"] == {"hits": 2, "misses": 1, "entries": 1}
+    assert summary.derived("key", lambda: object()) is summary.derived("key", lambda: None)
+
+    player_cache.get_player_summaries(players[1:])
+    assert player_cache.lru_stats()["summaries"]["entries"] == 2
+    assert player_cache.get_player_summary(players[0]) is not summary
+
+    data = player_cache.get_player_data(players[1])
+    assert player_cache.get_many(players[1:2]) == [data]
+    assert player_cache.lru_stats()["data"]["hits"] == 1
+
+    player_cache.insert_manual_override(players[1], 1500)
+    assert pc.PlayerCache.manual_override_key not in data
+    assert player_cache.get_player_summary(players[1]).manual_override == 1500
+    assert player_cache.get_player_data(players[1])[pc.PlayerCache.manual_override_key] == 1500
+
+    player_cache.remove_manual_override(players[1])
+    assert player_cache.get_player_summary(players[1]).has_manual_override is False
+    assert pc.PlayerCache.manual_override_key not in player_cache.get_player_data(players[1])
+
+
+def _write_in_other_process(filepath, ratings):
+    player_cache = pc.PlayerCache.lmdb(filepath)
+    player_cache.put_many([
+        ({"__tracker_suffix__": f"steam/{i}".encode()}, _player_data(rating))
+        for i, rating in ratings
+    ])
+
+
+def test_writes_of_other_processes_are_seen(tmp_path):
+    now = [0.0]
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path), clock=lambda: now[0])
+    players = [{"__tracker_suffix__": f"steam/{i}".encode()} for i in range(2)]
+    player_cache.insert_data_for_player(players[1], _player_data(1000))
+    assert player_cache.get_player_summaries(players)[0] is None
+    assert player_cache.get_player_data(players[0]) is None
+
+    process = multiprocessing.get_context("spawn").Process(
+        target=_write_in_other_process, args=(str(tmp_path), [(0, 900), (1, 1100)])
+    )
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+    def rating(summary):
+        return summary.mmr_histories["Ranked Doubles 2v2"].ratings.tolist()
+
+    # Misses are never kept in memory.
+    assert rating(player_cache.get_player_summary(players[0])) == [900.0]
+    assert player_cache.get_player_data(players[0]) is not None
+    assert rating(player_cache.get_player_summary(players[1])) == [1000.0]
+
+    now[0] += 5.0
+    assert rating(player_cache.get_player_summary(players[1])) == [1100.0]
+
+
+@pytest.mark.parametrize("open_cache", [pc.PlayerCache.lmdb, pc.PlayerCache.plyvel])
+def test_build_summaries_repairs_summaries_that_do_not_match_their_data(tmp_path, open_cache):
+    player_cache = open_cache(str(tmp_path), summary_lru_size=0)
+    players = [{"__tracker_suffix__": f"steam/{i}".encode()} for i in range(2)]
+    player_cache.put_many([(player, _player_data(1000)) for player in players])
+
+    def rating(player):
+        return player_cache.get_player_summary(player).mmr_histories[
+            "Ranked Doubles 2v2"
+        ].ratings.tolist()
+
+    # Lookups trust the summary written with the data, so only a rebuild sees this write.
+    player_cache._db.put(b"steam/1", pc.default_codec.encode(_player_data(1200)))
+    assert rating(players[1]) == [1000.0]
+
+    assert player_cache.build_summaries(batch_size=1) == 1
+    assert rating(players[1]) == [1200.0]
+    assert player_cache.build_summaries() == 0
+
+
+def test_nothing_is_written_when_a_summary_can_not_be_built(tmp_path):
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path))
+    players = [{"__tracker_suffix__": f"steam/{i}".encode()} for i in range(2)]
+    unparseable = _player_data(1000)
+    unparseable["mmr_history"]["Ranked Doubles 2v2"][0][0] = "not a date"
+
+    with pytest.raises(ValueError):
+        player_cache.put_many([(players[0], _player_data(1000)), (players[1], unparseable)])
+
+    assert player_cache.get_many(players) == [None, None]
+    assert player_cache._summary_db.get(b"steam/0") is None
+
+
+def test_mixed_date_offsets_can_be_summarized(tmp_path):
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path))
+    player = {"__tracker_suffix__": b"steam/1"}
+    data = _player_data(1000)
+    data["mmr_history"]["Ranked Doubles 2v2"].insert(0, ["2022-12-31T00:00:00", 900])
+    player_cache.insert_data_for_player(player, data)
+
+    assert player_cache.get_player_summary(player).mmr_histories[
+        "Ranked Doubles 2v2"
+    ].ratings.tolist() == [900.0, 1000.0]
+
+
+def test_build_summaries_requires_a_summary_database(tmp_path):
+    player_cache = pc.PlayerCache(pc.LMDBDatabaseBackend(str(tmp_path)))
+    player_cache.insert_data_for_player({"__tracker_suffix__": b"steam/1"}, _player_data(1000))
+
+    assert player_cache.get_player_summary({"__tracker_suffix__": b"steam/1"}).wins is None
+    with pytest.raises(ValueError):
+        player_cache.build_summaries()
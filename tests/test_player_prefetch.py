@@ -0,0 +1,71 @@
+import asyncio
+import datetime
+
+from rlrml import player_cache as pc
+from rlrml import player_prefetch
+from rlrml import replay_meta_db
+from rlrml.metadata import ReplayMeta, SteamPlayer
+
+
+def test_players_completing_replays_come_first():
+    order = player_prefetch.order_by_replays_unlocked([
+        {"a", "b", "c", "d"}, {"e"}, {"f", "g"}, {"f", "h"}, {"g", "b"},
+    ])
+
+    assert order[0] == ("e", 1)
+    assert sum(completed for _, completed in order) == 5
+    assert [player for player, _ in order[1:3]] == ["f", "g"]
+    assert sorted(player for player, _ in order) == list("abcdefgh")
+
+
+def _meta(*online_ids):
+    players = [SteamPlayer(str(online_id), online_id=str(online_id)) for online_id in online_ids]
+    return ReplayMeta(
+        datetime.datetime(2023, 1, 1), players[:len(players) // 2], players[len(players) // 2:]
+    )
+
+
+def test_plan_skips_cached_players_and_unlabelable_replays(tmp_path):
+    meta_store = replay_meta_db.ReplayMetaDB(str(tmp_path / "metas"))
+    meta_store.put_many([
+        ("labeled", _meta(1, 2)),
+        ("one-missing", _meta(1, 3)),
+        ("two-missing", _meta(4, 5)),
+        ("unlabelable", _meta(6, 7)),
+        ("retried", _meta(8, 5)),
+    ])
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path / "players"))
+    player_cache.put_many([
+        (SteamPlayer("1", online_id="1"), {"mmr_history": {}}),
+        (SteamPlayer("2", online_id="2"), {"mmr_history": {}}),
+        (SteamPlayer("6", online_id="6"), {pc.PlayerCache.error_key: {"type": "404"}}),
+        (SteamPlayer("8", online_id="8"), {pc.PlayerCache.error_key: {"type": "500"}}),
+    ])
+
+    plan = player_prefetch.plan_prefetch(meta_store, player_cache)
+
+    assert (plan.replays, plan.labeled, plan.unlabelable) == (5, 1, 1)
+    assert [player.tracker_suffix for player in plan.players[:2]] == ["steam/3", "steam/5"]
+    assert sorted(player.tracker_suffix for player in plan.players) == [
+        "steam/3", "steam/4", "steam/5", "steam/8"
+    ]
+    assert plan.unlocks[-1] == 3
+
+
+def test_prefetch_retries_players_that_could_not_be_fetched():
+    calls = []
+
+    async def get_player_data(player):
+        calls.append(player)
+        await asyncio.sleep(0)
+        return None if player == "flaky" and calls.count(player) == 1 or player == "gone" else {}
+
+    fetched = []
+    failed = asyncio.run(player_prefetch.prefetch_players(
+        ["a", "flaky", "gone", "b"], get_player_data, workers=2,
+        on_fetched=lambda index, data: fetched.append((index, data)),
+    ))
+
+    assert failed == 1
+    assert calls.count("flaky") == 2 and calls.count("gone") == 2
+    assert sorted(fetched) == [(0, {}), (1, {}), (2, None), (3, {})]
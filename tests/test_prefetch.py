@@ -0,0 +1,56 @@
+import pytest
+import torch
+
+pytest.importorskip("boxcars_py")
+
+from rlrml import load  # noqa: E402
+from rlrml import prefetch  # noqa: E402
+
+
+class _Dataset(torch.utils.data.Dataset):
+
+    def __init__(self, lengths):
+        self._lengths = lengths
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __getitem__(self, index):
+        tensor = torch.full((self._lengths[index], 3), float(index + 1))
+        return load.TrainingData(
+            load.VariableLengthSequenceTensor(tensor), torch.zeros(4), torch.ones(4),
+            str(index), "meta", self._lengths[index]
+        )
+
+
+def _loader(dataset, **kwargs):
+    return load.batched_packed_loader(
+        dataset, batch_size=3, shuffle=False, truncate_sequences_to=6, **kwargs
+    )
+
+
+def test_prefetched_batches_match_padded_batches_and_reuse_buffers():
+    dataset = _Dataset([4, 9, 2, 5, 1, 7, 3])
+    prefetcher = prefetch.BatchPrefetcher(
+        _loader(dataset, pad_sequences=False), depth=2, max_length=6
+    )
+
+    pointers = set()
+    for expected, batch in zip(_loader(dataset), prefetcher):
+        assert torch.equal(batch.X, expected.X)
+        assert torch.equal(batch.lengths, expected.lengths)
+        pointers.add(batch.X.data_ptr())
+
+    assert prefetcher.batches == 3
+    assert len(pointers) <= 3
+
+
+def test_stopping_early_releases_the_producer():
+    prefetcher = prefetch.BatchPrefetcher(
+        _loader(_Dataset([2] * 30), pad_sequences=False), depth=1, max_length=6
+    )
+    for _ in range(2):
+        iterator = iter(prefetcher)
+        next(iterator)
+        iterator.close()
+    assert sum(1 for _ in prefetcher) == 10
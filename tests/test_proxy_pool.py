@@ -0,0 +1,76 @@
+from rlrml import proxy_pool as pp
+
+
+class _Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _pool(clock, **kwargs):
+    return pp.ProxyPool(["a", "b"], clock=clock, failure_threshold=2, base_cooldown=10, **kwargs)
+
+
+def test_requests_go_to_the_fastest_healthy_proxy():
+    pool = _pool(_Clock())
+    pool.record(pool.try_acquire(), pp.OK, latency=.1)
+    pool.record(pool.try_acquire(), pp.OK, latency=2.0)
+
+    assert [pool.uri(pool.try_acquire()) for _ in range(3)] == ["a", "a", "b"]
+    assert [stats["in_flight"] for stats in pool.stats()] == [2, 1]
+
+
+def test_retry_after_and_the_circuit_breaker_make_proxies_unavailable():
+    clock = _Clock()
+    pool = _pool(clock)
+    a = pool.try_acquire()
+    pool.record(a, pp.RATE_LIMITED, retry_after=30)
+    assert pool.uri(a) == "a"
+
+    b = pool.try_acquire()
+    assert pool.uri(b) == "b"
+    pool.record(b, pp.TIMEOUT)
+    pool.record(pool.try_acquire(), pp.FORBIDDEN)
+    assert pool.try_acquire() is None
+    assert pool.seconds_until_available() == 10
+    assert pool.stats()[1]["circuit_open"]
+
+    # After cooling down, a single trial request is let through.
+    clock.now = 10
+    trial = pool.try_acquire()
+    assert pool.uri(trial) == "b"
+    assert pool.try_acquire() is None
+    pool.record(trial, pp.TIMEOUT)
+    assert pool.seconds_until_available() == 20
+
+    clock.now = 30
+    for index in [pool.try_acquire(), pool.try_acquire()]:
+        pool.record(index, pp.OK, latency=.5)
+    assert [stats["circuit_open"] for stats in pool.stats()] == [False, False]
+    assert pool.stats()[1]["timeout_rate"] == .5
+
+
+def test_acquire_waits_for_the_first_proxy_to_cool_down():
+    clock = _Clock()
+    pool = _pool(clock)
+    pool.record(pool.try_acquire(), pp.RATE_LIMITED, retry_after=5)
+    pool.record(pool.try_acquire(), pp.RATE_LIMITED, retry_after=3)
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        clock.now += seconds
+
+    assert pool.uri(pool.acquire(sleep=sleep)) == "b"
+    assert waits == [3]
+
+
+def test_only_gateway_errors_count_against_a_proxy():
+    assert [pp.outcome_for_status(status) for status in (200, 404, 500, 502, 503, 504)] == [
+        pp.OK, pp.OK, pp.OK, pp.ERROR, pp.ERROR, pp.ERROR
+    ]
+    assert pp.outcome_for_status(429) == pp.RATE_LIMITED
+    assert pp.outcome_for_status(403) == pp.FORBIDDEN
@@ -0,0 +1,58 @@
+import multiprocessing
+
+from rlrml.replay_attributes_db import ReplayAttributesDB
+
+
+def _record_in_child(attributes_db):
+    attributes_db.record_load_error("child", ValueError("bad frame"))
+
+
+def test_load_errors_are_recorded_and_cleared(tmp_path):
+    attributes_db = ReplayAttributesDB(str(tmp_path))
+    attributes_db.put_replay_attribute("blacklisted", "blacklisted", True)
+    attributes_db.record_load_error("broken", KeyError("actors"))
+
+    assert attributes_db.uuids_with_attribute("load_error") == {"broken"}
+    assert attributes_db.get_replay_attribute("broken", "load_error")["type"] == "KeyError"
+
+    attributes_db.clear_load_error("broken")
+
+    assert attributes_db.uuids_with_attribute("load_error") == set()
+    assert attributes_db.get_replay_attributes("blacklisted") == {"blacklisted": True}
+
+
+def test_load_errors_can_be_recorded_from_forked_processes(tmp_path):
+    attributes_db = ReplayAttributesDB(str(tmp_path))
+    attributes_db.uuids_with_attribute("load_error")
+
+    process = multiprocessing.get_context("fork").Process(
+        target=_record_in_child, args=(attributes_db,)
+    )
+    process.start()
+    process.join()
+
+    assert process.exitcode == 0
+    assert attributes_db.uuids_with_attribute("load_error") == {"child"}
+
+
+def test_many_attributes_are_merged_and_read_together(tmp_path):
+    attributes_db = ReplayAttributesDB(str(tmp_path))
+    attributes_db.put_replay_attribute("a", "blacklisted", True)
+
+    attributes_db.put_many_replay_attributes([("a", {"note": 1}), ("b", {"note": 2})])
+
+    assert attributes_db.get_many_replay_attributes(["a", "b", "c"]) == {
+        "a": {"blacklisted": True, "note": 1}, "b": {"note": 2}, "c": {},
+    }
+
+
+def test_load_errors_are_recorded_and_cleared_in_batches(tmp_path):
+    attributes_db = ReplayAttributesDB(str(tmp_path))
+    attributes_db.put_replay_attribute("a", "blacklisted", True)
+
+    attributes_db.record_load_errors([("a", KeyError("actors")), ("b", ValueError("frame"))])
+    assert attributes_db.uuids_with_attribute("load_error") == {"a", "b"}
+
+    attributes_db.clear_load_errors(["a", "b", "never_failed"])
+    assert attributes_db.uuids_with_attribute("load_error") == set()
+    assert dict(attributes_db) == {"a": {"blacklisted": True}, "b": {}}
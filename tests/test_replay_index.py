@@ -0,0 +1,52 @@
+import os
+
+from rlrml import replay_index
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w'):
+        pass
+
+
+def test_index_matches_tree_and_picks_up_changes(tmp_path):
+    root = tmp_path / "replays"
+    _touch(str(root / "a.replay"))
+    _touch(str(root / "nested" / "deeper" / "b.replay"))
+    _touch(str(root / "nested" / "notes.txt"))
+    index_directory = str(tmp_path / "index")
+
+    index = replay_index.ReplayDirectoryIndex.for_directory(str(root), index_directory)
+    assert index.refresh().uuid_to_path() == {
+        "a": str(root / "a.replay"),
+        "b": str(root / "nested" / "deeper" / "b.replay"),
+    }
+
+    _touch(str(root / "nested" / "c.replay"))
+    os.remove(str(root / "a.replay"))
+
+    reloaded = replay_index.ReplayDirectoryIndex.for_directory(str(root), index_directory)
+    assert set(reloaded.refresh().uuid_to_path()) == {"b", "c"}
+
+
+def test_unchanged_directories_are_not_rescanned(tmp_path, monkeypatch):
+    root = tmp_path / "replays"
+    _touch(str(root / "one" / "a.replay"))
+    _touch(str(root / "two" / "b.replay"))
+    monkeypatch.setattr(replay_index.ReplayDirectoryIndex, "racy_seconds", 0)
+    index_directory = str(tmp_path / "index")
+    replay_index.ReplayDirectoryIndex.for_directory(str(root), index_directory).refresh()
+
+    scanned = []
+    original_scan = replay_index.ReplayDirectoryIndex._scan_directory
+
+    def recording_scan(self, relative_path, mtime_ns):
+        scanned.append(relative_path)
+        return original_scan(self, relative_path, mtime_ns)
+
+    monkeypatch.setattr(replay_index.ReplayDirectoryIndex, "_scan_directory", recording_scan)
+    _touch(str(root / "two" / "c.replay"))
+
+    index = replay_index.ReplayDirectoryIndex.for_directory(str(root), index_directory)
+    assert set(index.refresh().uuid_to_path()) == {"a", "b", "c"}
+    assert scanned == ["two"]
@@ -0,0 +1,43 @@
+import datetime
+
+from rlrml import cache_store
+from rlrml import replay_meta_db
+from rlrml.metadata import ReplayMeta, SteamPlayer, EpicPlayer
+
+
+def _meta(day):
+    return ReplayMeta(
+        datetime.datetime(2023, 1, day, 12, 0),
+        [SteamPlayer("a", online_id="1"), EpicPlayer("b")],
+        [SteamPlayer("c", online_id="2"), EpicPlayer("d")],
+        headers={"Team0Score": 1, "Team1Score": 2},
+    )
+
+
+def test_get_many_reads_only_present_uuids(tmp_path):
+    meta_db = replay_meta_db.ReplayMetaDB(str(tmp_path / "db"))
+    meta_db.put_many([("one", _meta(1)), ("two", _meta(2))])
+
+    result = meta_db.get_many(["one", "two", "three"])
+
+    assert set(result) == {"one", "two"}
+    assert result["two"].to_dict() == _meta(2).to_dict()
+
+
+def test_migrate_meta_directory(tmp_path):
+    directory_store = cache_store.JSONDirectoryMetaStore(str(tmp_path / "cache"))
+    for day in range(1, 4):
+        directory_store.put(f"uuid-{day}", _meta(day))
+    meta_db = replay_meta_db.ReplayMetaDB(str(tmp_path / "db"))
+    assert meta_db.is_empty()
+
+    migrated = replay_meta_db.migrate_meta_directory(
+        str(tmp_path / "cache"), meta_db, batch_size=2
+    )
+
+    assert migrated == 3
+    assert {
+        uuid: meta.to_dict() for uuid, meta in meta_db.items()
+    } == {
+        uuid: meta.to_dict() for uuid, meta in directory_store.items()
+    }
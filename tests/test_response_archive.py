@@ -0,0 +1,83 @@
+import json
+
+from rlrml import player_cache as pc
+from rlrml import response_archive as ra
+
+
+def _profile_body(player_id, last_updated="2023-01-01"):
+    return json.dumps({"data": {
+        "platformInfo": {"platformSlug": "steam", "platformUserId": player_id},
+        "metadata": {"playerId": int(player_id), "lastUpdated": {"value": last_updated}},
+        "segments": [
+            {"metadata": {"name": "Lifetime"}, "stats": {"wins": {"value": 10.0}}},
+        ],
+    }}).encode()
+
+
+def _mmr_body(rating):
+    return json.dumps({"data": {
+        "11": [{"collectDate": "2023-01-01T00:00:00+00:00", "rating": rating}]
+    }}).encode()
+
+
+def test_archive_keeps_every_fetch_in_time_order(tmp_path):
+    archive = ra.ResponseArchive(str(tmp_path), batch_size=2)
+    archive.record("steam/1", 200, _profile_body("1"), _mmr_body(1000), fetched_at=20)
+    archive.record("steam/1", 200, _profile_body("1"), _mmr_body(1100), fetched_at=10)
+    archive.record("steam/10", 404, b"", fetched_at=5)
+    assert list(archive.tracker_suffixes()) == ["steam/1"]
+    archive.flush()
+
+    assert list(archive.tracker_suffixes()) == ["steam/1", "steam/10"]
+    assert [response.fetched_at for response in archive.history("steam/1")] == [10, 20]
+    latest = archive.latest("steam/1")
+    assert (latest.status, latest.mmr) == (200, _mmr_body(1000))
+    assert archive.latest("steam/10").status == 404
+    assert archive.latest("steam/2") is None
+    assert archive.latest("steam/0") is None
+    assert archive.latest("steam") is None
+
+
+def test_player_cache_is_rebuilt_from_the_latest_fetches(tmp_path):
+    archive = ra.ResponseArchive(str(tmp_path / "archive"), batch_size=10)
+    archive.record("steam/1", 200, _profile_body("1"), _mmr_body(1000), fetched_at=1)
+    archive.record("steam/1", 200, _profile_body("1"), _mmr_body(1200), fetched_at=2)
+    archive.record("steam/2", 404, b"", fetched_at=1)
+    archive.flush()
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path / "players"))
+    player = {"__tracker_suffix__": b"steam/1"}
+    player_cache.insert_data_for_player(player, {
+        pc.PlayerCache.manual_override_key: 1500, "player_metadata": {"name": "one"},
+    })
+
+    assert ra.rebuild_player_cache(archive, player_cache, processes=2, shard_size=1) == 2
+
+    data = player_cache.get_player_data(player)
+    assert list(data["mmr_history"]["Ranked Doubles 2v2"]) == [("2023-01-01T00:00:00+00:00", 1200)]
+    assert data[pc.PlayerCache.manual_override_key] == 1500
+    assert data["player_metadata"] == {"name": "one"}
+    assert player_cache.get_player_summary({"__tracker_suffix__": b"steam/2"}).error == {
+        "type": "404"
+    }
+
+
+def test_rebuild_keeps_cached_records_newer_than_the_archive(tmp_path):
+    archive = ra.ResponseArchive(str(tmp_path / "archive"), batch_size=10)
+    for suffix in ("steam/1", "steam/2"):
+        archive.record(
+            suffix, 200, _profile_body(suffix[-1], "2023-01-01T00:00:00+00:00"),
+            _mmr_body(1000), fetched_at=1
+        )
+    archive.flush()
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path / "players"))
+    newer = {"last_updated": "2023-02-01T00:00:00+00:00", "mmr_history": {}}
+    older = {"last_updated": "2022-12-01T00:00:00", "mmr_history": {}}
+    player_cache.insert_data_for_player({"__tracker_suffix__": b"steam/1"}, newer)
+    player_cache.insert_data_for_player({"__tracker_suffix__": b"steam/2"}, older)
+
+    assert ra.rebuild_player_cache(archive, player_cache, processes=1) == 1
+
+    assert player_cache.get_player_data({"__tracker_suffix__": b"steam/1"}) == newer
+    assert "Ranked Doubles 2v2" in player_cache.get_player_data(
+        {"__tracker_suffix__": b"steam/2"}
+    )["mmr_history"]
@@ -0,0 +1,40 @@
+import torch
+
+from rlrml import sampler
+
+
+def test_batches_cover_every_index_once():
+    lengths = torch.randint(100, 4000, (1000,)).tolist()
+    batch_sampler = sampler.LengthBucketBatchSampler(lengths, 16, bucket_size_multiplier=8)
+
+    batches = list(batch_sampler)
+
+    assert len(batches) == len(batch_sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(1000))
+
+
+def test_batches_reduce_padding():
+    torch.manual_seed(0)
+    lengths = torch.randint(100, 4000, (2000,))
+    batch_sampler = sampler.LengthBucketBatchSampler(lengths.tolist(), 16)
+
+    def padding(batches):
+        return sum(
+            int(lengths[batch].max()) * len(batch) - int(lengths[batch].sum())
+            for batch in batches
+        )
+
+    random_batches = torch.split(torch.randperm(len(lengths)), 16)
+    assert padding(list(batch_sampler)) * 10 < padding(random_batches)
+
+
+def test_epochs_differ_and_drop_last():
+    batch_sampler = sampler.LengthBucketBatchSampler(
+        list(range(100)), 8, bucket_size_multiplier=2, drop_last=True
+    )
+
+    first, second = list(batch_sampler), list(batch_sampler)
+
+    assert first != second
+    assert all(len(batch) == 8 for batch in first)
+    assert len(first) == len(batch_sampler)
@@ -0,0 +1,167 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from rlrml import player_cache as pc
+from rlrml import response_archive as ra
+from rlrml.metadata import PlatformPlayer
+from rlrml import tracker_network
+
+
+def _profile(player_id):
+    return {"data": {
+        "platformInfo": {"platformSlug": "steam", "platformUserId": player_id},
+        "metadata": {"playerId": int(player_id), "lastUpdated": {"value": "2023-01-01"}},
+        "segments": [
+            {"metadata": {"name": "Lifetime"}, "stats": {"wins": {"value": 10.0}}},
+        ],
+    }}
+
+
+def _mmr(player_id):
+    return {"data": {"11": [{"collectDate": "2023-01-01T00:00:00+00:00", "rating": player_id}]}}
+
+
+class _StandInTracker:
+    """A local stand in for the tracker network api that records its load."""
+
+    def __init__(self, delay=.05, clearance=None):
+        self.delay = delay
+        self.clearance = clearance
+        self.challenges = 0
+        self.profile_requests = 0
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.app = web.Application()
+        self.app.router.add_get("/", self.challenge)
+        self.app.router.add_get(
+            "/api/v2/rocket-league/standard/profile/steam/{player_id}", self.profile
+        )
+        self.app.router.add_get(
+            "/api/v1/rocket-league/player-history/mmr/{player_id}", self.mmr
+        )
+
+    async def _respond(self, body):
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return web.json_response(body)
+
+    async def challenge(self, request):
+        self.challenges += 1
+        self.user_agent = request.headers["User-Agent"]
+        response = web.Response(text="cleared")
+        if self.clearance is not None:
+            response.set_cookie("cf_clearance", self.clearance)
+        return response
+
+    async def profile(self, request):
+        self.profile_requests += 1
+        if self.clearance is not None and (
+                request.cookies.get("cf_clearance") != self.clearance or
+                request.headers["User-Agent"] != self.user_agent
+        ):
+            raise web.HTTPForbidden()
+        player_id = request.match_info["player_id"]
+        if player_id == "404":
+            raise web.HTTPNotFound()
+        return await self._respond(_profile(player_id))
+
+    async def mmr(self, request):
+        return await self._respond(_mmr(int(request.match_info["player_id"])))
+
+
+def _run_against_stand_in(tracker, run, **kwargs):
+    async def main():
+        async with TestServer(tracker.app) as server:
+            async with tracker_network.AsyncTrackerNetwork(
+                    base_uri=str(server.make_url("")).rstrip("/"), concurrency_per_proxy=3,
+                    **kwargs
+            ) as network:
+                return await run(network)
+    return asyncio.run(main())
+
+
+def test_async_client_limits_concurrency_and_coalesces_requests():
+    tracker = _StandInTracker()
+    players = [PlatformPlayer.from_tracker_suffix(f"steam/{i}") for i in range(1, 9)]
+
+    results = _run_against_stand_in(tracker, lambda network: asyncio.gather(*[
+        network.get_player_data(player) for player in players + players
+    ]))
+
+    assert tracker.profile_requests == len(players)
+    assert tracker.most_in_flight == 3
+    assert [result["mmr_history"]["Ranked Doubles 2v2"] for result in results] == [
+        [("2023-01-01T00:00:00+00:00", i)] for i in list(range(1, 9)) * 2
+    ]
+
+
+def test_async_cached_get_writes_fetched_players_in_batches(tmp_path):
+    tracker = _StandInTracker(delay=0)
+    player_cache = pc.PlayerCache.lmdb(str(tmp_path))
+    writes = []
+    put_many = player_cache.put_many
+    player_cache.put_many = lambda pairs: writes.append(len(pairs)) or put_many(pairs)
+    players = [PlatformPlayer.from_tracker_suffix(f"steam/{i}") for i in (1, 2, 3, 404)]
+    player_cache.insert_data_for_player(players[0], {"cached": True})
+    writes.clear()
+
+    async def run(network):
+        getter = pc.AsyncCachedGetPlayerData(player_cache, network.get_player_data, batch_size=2)
+        results = await getter.get_many_player_data(players)
+        getter.flush()
+        return results
+
+    results = _run_against_stand_in(tracker, run)
+
+    assert results[0] == {"cached": True}
+    assert results[3] == {pc.PlayerCache.error_key: {"type": "404"}}
+    assert tracker.profile_requests == 3
+    assert writes == [2, 1]
+    assert player_cache.get_player_data(players[2])["player_metadata"] == players[2].to_dict()
+    assert player_cache.get_player_summary(players[3]).error == {"type": "404"}
+
+
+def test_async_client_archives_raw_responses(tmp_path):
+    archive = ra.ResponseArchive(str(tmp_path))
+    players = [PlatformPlayer.from_tracker_suffix(f"steam/{i}") for i in (7, 404)]
+
+    async def run(network):
+        return await asyncio.gather(
+            *[network.get_player_data(player) for player in players], return_exceptions=True
+        )
+
+    data, error = _run_against_stand_in(_StandInTracker(delay=0), run, response_archive=archive)
+
+    assert error.status_code == 404
+    assert list(archive.tracker_suffixes()) == ["steam/404", "steam/7"]
+    assert ra.player_data_from_response(archive.latest("steam/7")) == data
+    assert ra.player_data_from_response(archive.latest("steam/404")) == {
+        pc.PlayerCache.error_key: {"type": "404"}
+    }
+
+
+def test_async_client_reuses_the_cloudscraper_clearance_of_each_proxy():
+    tracker = _StandInTracker(delay=0, clearance="first")
+    players = [PlatformPlayer.from_tracker_suffix(f"steam/{i}") for i in range(1, 4)]
+
+    async def run(network):
+        first = await asyncio.gather(*[network.get_player_data(player) for player in players])
+        # The clearance expires, so the next request is forbidden and solves it again.
+        tracker.clearance = "second"
+        forbidden = await asyncio.gather(
+            network.get_player_data(players[0]), return_exceptions=True
+        )
+        return first, forbidden, await network.get_player_data(players[1])
+
+    first, (forbidden,), again = _run_against_stand_in(tracker, run)
+
+    assert all(data["tracker_api_id"] == i for i, data in enumerate(first, 1))
+    assert forbidden.status_code == 403
+    assert again["tracker_api_id"] == 2
+    assert tracker.challenges == 2
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import torch
+
+pytest.importorskip("boxcars_py")
+
+from rlrml import util  # noqa: E402
+from rlrml.playlist import Playlist  # noqa: E402
+
+
+HEADERS = {
+    "global_headers": ["ball - position x", "ball - velocity x", "ball - position z"],
+    "player_headers": ["position x", "boost", "position y"],
+}
+
+
+def _column_by_column(tensor, rescaler, scaler):
+    for index in rescaler._header_indices:
+        scaler.scale_column_in_place(tensor, index)
+    return tensor
+
+
+@pytest.mark.parametrize("scaler", [
+    util.RatioScaler(ratio=1.0 / 600.0), util.ManualLinearScaler(-3000.0, 3000.0, -1.0, 1.0)
+])
+def test_vectorized_rescale_matches_column_by_column(scaler):
+    playlist = Playlist("Ranked Doubles 2v2")
+    rescaler = util.ReplayPositionRescaler(HEADERS, playlist, scaler)
+    tensor = torch.randn(20, 3 + 4 * 3) * 1000
+
+    expected = _column_by_column(tensor.clone(), rescaler, scaler)
+
+    assert torch.allclose(rescaler.scale_position_columns(tensor.clone()), expected, atol=1e-6)
+    assert np.allclose(rescaler.scale_position_columns(tensor.numpy().copy()), expected.numpy(), atol=1e-6)
+    batch = torch.stack([tensor, tensor])
+    assert torch.allclose(rescaler.scale_position_columns(batch)[1], expected, atol=1e-6)
+
+
+def test_batch_transform_keeps_padding_at_zero():
+    from rlrml import load
+
+    rescaler = util.ReplayPositionRescaler(
+        HEADERS, Playlist("Ranked Doubles 2v2"), util.ManualLinearScaler(0.0, 1.0, 5.0, 6.0)
+    )
+    training_data = load.TrainingData(
+        torch.ones(2, 4, 15), None, None, None, None, torch.tensor([4, 2])
+    )
+
+    X = load._transform_padded_batch(rescaler.scale_position_columns, training_data)
+
+    assert X[0, 3, 0] == 6.0
+    assert X[1, 1, 0] == 6.0
+    assert (X[1, 2:] == 0).all()